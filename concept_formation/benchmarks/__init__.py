@@ -0,0 +1,7 @@
+"""
+The benchmarks package contains scripts for measuring the performance of the
+concept formation algorithms. Each module can be run directly (e.g., ``python
+-m concept_formation.benchmarks.merge``) and prints its results as JSON. The
+main benchmark suite (see :mod:`concept_formation.benchmarks.suite`) is run
+with ``python -m concept_formation.benchmarks``.
+"""
@@ -0,0 +1,10 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+import sys
+
+from concept_formation.benchmarks.suite import main
+
+if __name__ == "__main__":
+    sys.exit(main())
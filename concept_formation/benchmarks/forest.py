@@ -0,0 +1,92 @@
+"""
+Benchmarks the accuracy and fitting throughput of a :class:`CobwebForest
+<concept_formation.parallel.CobwebForest>` as the number of worker processes
+increases. Each forest is fit on a training split and used to predict the
+class of the held out instances.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from random import seed
+from random import shuffle
+from timeit import default_timer
+import json
+import sys
+
+from concept_formation.cobweb import CobwebTree
+from concept_formation.cobweb3 import Cobweb3Tree
+from concept_formation.datasets import load_iris
+from concept_formation.datasets import load_mushroom
+from concept_formation.parallel import CobwebForest
+
+
+def benchmark_forest(tree_class, instances, attr, workers=(1, 2, 4),
+                     test_size=0.2, random_seed=0):
+    """
+    Fits a forest for each number of workers and returns the fitting time,
+    throughput and held out accuracy of each.
+
+    :param tree_class: The type of tree held by each worker
+    :type tree_class: CobwebTree or Cobweb3Tree
+    :param instances: The instances to fit and test on
+    :type instances: [:ref:`Instance<instance-rep>`, ...]
+    :param attr: The attribute to predict for the held out instances
+    :type attr: :ref:`Attribute<attributes>`
+    :param workers: The numbers of workers to evaluate
+    :type workers: [int, ...]
+    :param test_size: The proportion of instances that are held out
+    :type test_size: float
+    :param random_seed: The seed used to shuffle the instances
+    :type random_seed: int
+    :return: The benchmark results
+    :rtype: list
+    """
+    seed(random_seed)
+    instances = [i for i in instances]
+    shuffle(instances)
+    n_test = int(len(instances) * test_size)
+    test = instances[:n_test]
+    train = instances[n_test:]
+
+    results = []
+    for n_workers in workers:
+        with CobwebForest(tree_class, n_workers=n_workers) as forest:
+            start = default_timer()
+            forest.fit(train)
+            # a query waits for every worker to finish fitting.
+            forest.categorize({})
+            fit_time = default_timer() - start
+
+            correct = 0
+            for instance in test:
+                query = {a: instance[a] for a in instance if a != attr}
+                if forest.predict(query, attr) == instance[attr]:
+                    correct += 1
+
+        results.append({'tree': tree_class.__name__,
+                        'workers': n_workers,
+                        'train': len(train),
+                        'test': len(test),
+                        'fit_seconds': fit_time,
+                        'instances_per_second': len(train) / fit_time,
+                        'accuracy': correct / len(test)})
+    return results
+
+
+def main(datasets=('mushroom', 'iris')):
+    results = []
+    if 'mushroom' in datasets:
+        results.extend(benchmark_forest(CobwebTree, load_mushroom(),
+                                        'classification'))
+    if 'iris' in datasets:
+        results.extend(benchmark_forest(Cobweb3Tree, load_iris(), 'class'))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(sys.argv[1:])
+    else:
+        main()
@@ -0,0 +1,91 @@
+"""
+Benchmarks the memory saved by interning the attributes of :class:`TrestleTree
+<concept_formation.trestle.TrestleTree>` concepts on the RumbleBlocks
+datasets.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from random import seed
+from timeit import default_timer
+import json
+
+from concept_formation.trestle import TrestleTree
+from concept_formation.datasets import load_rb_wb_03
+from concept_formation.datasets import load_rb_s_07
+from concept_formation.datasets import load_rb_s_13
+from concept_formation.datasets import load_rb_com_11
+from concept_formation.benchmarks.measure import retained_memory
+
+# name: loader of the RumbleBlocks datasets compared by benchmark_interning.
+RUMBLEBLOCKS = {
+    'rb_com_11': load_rb_com_11,
+    'rb_s_07': load_rb_s_07,
+    'rb_s_13': load_rb_s_13,
+    'rb_wb_03': load_rb_wb_03,
+}
+
+
+def benchmark_interning(datasets=None, max_instances=None, random_seed=0):
+    """
+    Fits a :class:`TrestleTree <concept_formation.trestle.TrestleTree>` to
+    each of the RumbleBlocks datasets with and without interning attributes
+    (see: :class:`InternTable <concept_formation.utils.InternTable>`) and
+    measures the memory retained by the tree, the number of attribute keys
+    stored across its concepts and the number of distinct objects backing
+    them, and the fitting throughput.
+
+    :param datasets: The names of the :data:`RUMBLEBLOCKS` datasets to fit
+        (by default all of them)
+    :type datasets: [str, ...] or None
+    :param max_instances: The maximum number of instances used from each
+        dataset
+    :type max_instances: int or None
+    :param random_seed: The seed used to fit the trees
+    :type random_seed: int
+    :return: The metrics for each dataset, with and without interning
+    :rtype: dict
+    """
+    if datasets is None:
+        datasets = sorted(RUMBLEBLOCKS)
+
+    results = {}
+    for name in datasets:
+        try:
+            instances = RUMBLEBLOCKS[name]()
+        except (IOError, OSError) as e:
+            results[name] = {'skipped': str(e)}
+            continue
+        if max_instances is not None:
+            instances = instances[:max_instances]
+
+        results[name] = {}
+        for intern_attributes in (False, True):
+            def fit():
+                seed(random_seed)
+                tree = TrestleTree(intern_attributes=intern_attributes)
+                start = default_timer()
+                tree.fit(instances, randomize_first=False)
+                return tree, default_timer() - start
+
+            memory, (tree, fit_time) = retained_memory(fit)
+            keys = [attr for c in tree.preorder() for attr in c.av_counts]
+
+            results[name]['interned' if intern_attributes else
+                          'not_interned'] = {
+                'retained_memory_kb': memory,
+                'attribute_keys': len(keys),
+                'attribute_objects': len(set(id(attr) for attr in keys)),
+                'fit_instances_per_second': len(instances) / fit_time}
+
+    return results
+
+
+def main():
+    print(json.dumps(benchmark_interning(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
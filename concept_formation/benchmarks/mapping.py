@@ -0,0 +1,95 @@
+"""
+Benchmarks the quality and wall time of structure mapping with random
+restarts (see: :func:`flat_match
+<concept_formation.structure_mapper.flat_match>`) on synthetic relational
+scenes.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from random import seed
+from timeit import default_timer
+from multiprocessing import Pool
+import json
+
+from concept_formation.trestle import TrestleTree
+from concept_formation.preprocessor import Pipeline
+from concept_formation.preprocessor import NameStandardizer
+from concept_formation.preprocessor import Flattener
+from concept_formation.preprocessor import SubComponentProcessor
+from concept_formation.structure_mapper import flat_match
+from concept_formation.structure_mapper import mapping_cost
+from concept_formation.datasets import load_synthetic_relational
+
+
+def benchmark_mapping_restarts(instances, restarts=(0, 1, 3, 7),
+                               n_base=None, processes=None, random_seed=0):
+    """
+    Fits a :class:`TrestleTree <concept_formation.trestle.TrestleTree>` to the
+    first half of the instances (or n_base of them) and then structure maps
+    each of the remaining instances to its root with each number of random
+    restarts (see: :func:`flat_match
+    <concept_formation.structure_mapper.flat_match>`), measuring the wall time
+    per mapping and the average cost of the mappings found (lower is better).
+
+    :param instances: The instances to fit and map
+    :type instances: [:ref:`Instance<instance-rep>`, ...]
+    :param restarts: The numbers of restarts to compare
+    :type restarts: [int, ...]
+    :param n_base: The number of instances fit before mapping
+    :type n_base: int or None
+    :param processes: The number of worker processes the restarts are run
+        in. By default they are run in this process.
+    :type processes: int or None
+    :param random_seed: The seed used to fit the tree and for the restarts
+    :type random_seed: int
+    :return: The metrics for each number of restarts
+    :rtype: dict
+    """
+    if n_base is None:
+        n_base = len(instances) // 2
+
+    seed(random_seed)
+    tree = TrestleTree()
+    tree.fit(instances[:n_base], randomize_first=False)
+    preprocessing = Pipeline(NameStandardizer(tree.gensym), Flattener(),
+                             SubComponentProcessor())
+    targets = [preprocessing.transform(instance)
+               for instance in instances[n_base:]]
+
+    pool = None
+    if processes is not None:
+        pool = Pool(processes)
+
+    results = {}
+    try:
+        for n in restarts:
+            costs = []
+            start = default_timer()
+            for target in targets:
+                mapping = flat_match(target, tree.root, restarts=n,
+                                     restart_seed=random_seed, pool=pool)
+                costs.append(mapping_cost(mapping, target, tree.root))
+            elapsed = default_timer() - start
+
+            results['restarts_%i' % n] = {
+                'seconds_per_mapping': elapsed / len(targets),
+                'mapping_cost': sum(costs) / len(costs)}
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return results
+
+
+def main():
+    instances = list(load_synthetic_relational(60, num_objects=12,
+                                               num_relations=6, seed=0))
+    print(json.dumps(benchmark_mapping_restarts(instances), indent=2))
+
+
+if __name__ == "__main__":
+    main()
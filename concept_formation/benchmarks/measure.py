@@ -0,0 +1,110 @@
+"""
+Functions shared by the benchmarks for summarizing latencies and measuring
+the memory used by a call.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+import gc
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def percentile(values, p):
+    """
+    Returns the p-th percentile of a list of values using linear
+    interpolation between the closest ranks.
+
+    >>> percentile([1, 2, 3, 4], 50)
+    2.5
+    >>> percentile([5, 1, 3], 100)
+    5
+
+    :param values: The values to compute the percentile of
+    :type values: [float, ...]
+    :param p: The percentile, between 0 and 100
+    :type p: float
+    :return: The percentile
+    :rtype: float
+    """
+    values = sorted(values)
+    if not values:
+        raise ValueError("Cannot compute the percentile of no values.")
+    rank = (len(values) - 1) * p / 100
+    lower = int(rank)
+    if lower + 1 >= len(values):
+        return values[-1]
+    return values[lower] + (values[lower + 1] - values[lower]) * (rank - lower)
+
+
+def peak_memory(fn):
+    """
+    Calls a function and returns the peak memory (in KB) allocated during the
+    call along with the function's return value.
+
+    The measurement uses tracemalloc when it is available. Otherwise it falls
+    back on the maximum resident set size of the process, which only measures
+    the call if it raises the high water mark of the process. If neither is
+    available then None is returned for the memory.
+
+    :param fn: The function to call with no arguments
+    :type fn: function
+    :return: The peak memory and the function's return value
+    :rtype: (float, object)
+    """
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            value = fn()
+            peak = tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+        return peak, value
+
+    if resource is not None:
+        value = fn()
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            peak /= 1024
+        return peak, value
+
+    return None, fn()
+
+
+def retained_memory(fn):
+    """
+    Calls a function and returns the memory (in KB) allocated during the call
+    that is still in use after it returns (e.g., the size of a tree built by
+    the function) along with the function's return value.
+
+    The measurement uses tracemalloc, when it is not available None is
+    returned for the memory.
+
+    :param fn: The function to call with no arguments
+    :type fn: function
+    :return: The retained memory and the function's return value
+    :rtype: (float, object)
+    """
+    if tracemalloc is None:
+        return None, fn()
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        value = fn()
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] / 1024
+    finally:
+        tracemalloc.stop()
+    return retained, value
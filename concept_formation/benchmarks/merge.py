@@ -0,0 +1,83 @@
+"""
+Benchmarks :func:`merge_trees <concept_formation.parallel.merge_trees>`
+against a single sequential fit. The instances are split into shards, a tree
+is fit to each shard, and the shard trees are merged. The cost of fitting the
+shards in parallel is estimated as the slowest shard plus the merge.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from random import seed
+from random import shuffle
+from timeit import default_timer
+import json
+
+from concept_formation.cobweb import CobwebTree
+from concept_formation.cobweb3 import Cobweb3Tree
+from concept_formation.datasets import load_congressional_voting
+from concept_formation.datasets import load_iris
+from concept_formation.parallel import merge_trees
+
+
+def benchmark_merge(tree_class, instances, shards=4, random_seed=0):
+    """
+    Fits a tree sequentially and fits one tree per shard and merges them,
+    returning the timings, the category utility of the root of each tree, and
+    the number of concepts in each tree.
+
+    :param tree_class: The type of tree to fit
+    :type tree_class: CobwebTree or Cobweb3Tree
+    :param instances: The instances to fit
+    :type instances: [:ref:`Instance<instance-rep>`, ...]
+    :param shards: The number of shards to split the instances into
+    :type shards: int
+    :param random_seed: The seed used to shuffle the instances
+    :type random_seed: int
+    :return: The benchmark results
+    :rtype: dict
+    """
+    seed(random_seed)
+    instances = [i for i in instances]
+    shuffle(instances)
+
+    start = default_timer()
+    sequential = tree_class()
+    sequential.fit(instances, randomize_first=False)
+    sequential_time = default_timer() - start
+
+    shard_trees = []
+    shard_times = []
+    for i in range(shards):
+        start = default_timer()
+        tree = tree_class()
+        tree.fit(instances[i::shards], randomize_first=False)
+        shard_times.append(default_timer() - start)
+        shard_trees.append(tree)
+
+    start = default_timer()
+    merged = merge_trees(*shard_trees)
+    merge_time = default_timer() - start
+
+    return {'tree': tree_class.__name__,
+            'instances': len(instances),
+            'shards': shards,
+            'sequential_seconds': sequential_time,
+            'shard_seconds': shard_times,
+            'merge_seconds': merge_time,
+            'parallel_seconds': max(shard_times) + merge_time,
+            'sequential_cu': sequential.root.category_utility(),
+            'merged_cu': merged.root.category_utility(),
+            'sequential_concepts': sequential.root.num_concepts(),
+            'merged_concepts': merged.root.num_concepts()}
+
+
+def main():
+    results = [benchmark_merge(CobwebTree, load_congressional_voting()),
+               benchmark_merge(Cobweb3Tree, load_iris())]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
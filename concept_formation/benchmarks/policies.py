@@ -0,0 +1,104 @@
+"""
+Benchmarks the :data:`POLICIES` for restricting the cobweb operators (see:
+:class:`OperatorPolicy <concept_formation.operator_policy.OperatorPolicy>`)
+against each other, trading fitting throughput for the category utility and
+prediction accuracy of the resulting trees.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from random import seed
+from random import shuffle
+from timeit import default_timer
+import json
+
+from concept_formation.cobweb import CobwebTree
+from concept_formation.operator_policy import OperatorPolicy
+from concept_formation.datasets import load_congressional_voting
+
+# name: keyword arguments of the OperatorPolicy compared by
+# benchmark_policies, None is the default (unrestricted) cobweb algorithm.
+POLICIES = {
+    'all_operations': None,
+    'every_5': {'every': 5},
+    'max_depth_2': {'max_depth': 2},
+    'margin_0.01': {'margin': 0.01},
+    'budget_1ms': {'time_budget': 0.001},
+}
+
+
+def benchmark_policies(tree_class, instances, attr, policies=None,
+                       test_fraction=0.2, random_seed=0):
+    """
+    Fits a tree with each operator policy and measures the fitting
+    throughput, the category utility of the root of the resulting tree, and
+    the accuracy of predicting the target attribute for held out instances.
+
+    :param tree_class: The type of tree to benchmark
+    :type tree_class: CobwebTree, Cobweb3Tree, TrestleTree or a function
+        that returns a tree
+    :param instances: The instances to fit and test on
+    :type instances: [:ref:`Instance<instance-rep>`, ...]
+    :param attr: The attribute to predict, if None then accuracy is not
+        measured
+    :type attr: :ref:`Attribute<attributes>`
+    :param policies: The policies to compare, keyed by name (by default the
+        :data:`POLICIES`)
+    :type policies: dict
+    :param test_fraction: The fraction of the instances held out for testing
+    :type test_fraction: float
+    :param random_seed: The seed used to order the instances
+    :type random_seed: int
+    :return: The metrics for each policy
+    :rtype: dict
+    """
+    if policies is None:
+        policies = POLICIES
+
+    seed(random_seed)
+    instances = [i for i in instances]
+    shuffle(instances)
+    n_test = int(len(instances) * test_fraction)
+    train = instances[n_test:]
+    test = instances[:n_test]
+
+    results = {}
+    for name in sorted(policies):
+        policy = None
+        if policies[name] is not None:
+            policy = OperatorPolicy(**policies[name])
+
+        seed(random_seed)
+        tree = tree_class(operator_policy=policy)
+        start = default_timer()
+        for instance in train:
+            tree.ifit(instance)
+        fit_time = default_timer() - start
+
+        result = {'fit_instances_per_second': len(train) / fit_time,
+                  'root_category_utility': tree.root.category_utility(),
+                  'concepts': tree.root.num_concepts()}
+
+        if attr is not None and test:
+            correct = 0
+            for instance in test:
+                query = {a: instance[a] for a in instance if a != attr}
+                prediction = tree.categorize(query).predict(attr)
+                correct += prediction == instance.get(attr)
+            result['accuracy'] = correct / len(test)
+
+        results[name] = result
+
+    return results
+
+
+def main():
+    results = benchmark_policies(CobwebTree, load_congressional_voting(),
+                                 'Class Name')
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
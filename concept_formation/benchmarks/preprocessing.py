@@ -0,0 +1,194 @@
+"""
+Benchmarks the throughput of the preprocessors that standardize apart,
+flatten and list process instances, and of the :class:`Tuplizer
+<concept_formation.preprocessor.Tuplizer>` with and without its caches.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from random import Random
+from timeit import default_timer
+import json
+
+from concept_formation.preprocessor import Tuplizer
+from concept_formation.preprocessor import ListProcessor
+from concept_formation.preprocessor import NameStandardizer
+from concept_formation.preprocessor import Flattener
+
+# name: an instance with the shape of one of the preprocessor doctests, which
+# are standardized apart, flattened and list processed by
+# benchmark_preprocessing.
+PREPROCESSING_SHAPES = {
+    'relational': {'nominal': 'v1', 'numeric': 2.3, 'c1': {'a1': 'v1'},
+                   '?c2': {'a2': 'v2', '?c3': {'a3': 'v3'}},
+                   '(relation1 c1 ?c2)': True, 'lists': ['s1', 's2', 's3'],
+                   '(relation2 (a1 c1) (relation3 (a3 (?c3 ?c2))))': 4.3},
+    'rumbleblocks': {'?check0': {'Position': {'X': 1.5990001,
+                                              'Y': -7.05200052},
+                                 'Type': 'Checkpoint'},
+                     '?cube01': {'Bounds': {'X': 1.7420001, 'Y': 1.751},
+                                 'Name': 'cube01',
+                                 'Position': {'X': -12.0840006,
+                                              'Y': -7.1050005},
+                                 'Rotation': {'Z': 0.0}, 'Type': 'cube'},
+                     '?cube02': {'Bounds': {'X': 1.7420001, 'Y': 1.751},
+                                 'Name': 'cube02',
+                                 'Position': {'X': -4.662, 'Y': -7.1050005},
+                                 'Rotation': {'Z': 0.0}, 'Type': 'cube'},
+                     'Goal': {'Position': {'X': 8.599, 'Y': 0.715000033},
+                              'Type': 'Goal'}},
+    'nested_lists': {'tta': 'alpha',
+                     'ttb': {'tlist': ['a', 'b',
+                                       {'sub-a': 'c',
+                                        'sub-sub': {'s': 'd',
+                                                    'sslist': ['w', 'x', 'y',
+                                                               {'issue':
+                                                                'here'}]}},
+                                       'g']}},
+}
+
+
+def _nested_instance(depth):
+    """
+    Returns an instance whose objects are nested depth levels deep, with a
+    short list at every level.
+    """
+    instance = {'a': 'v'}
+    for i in range(depth):
+        instance = {'?o%i' % i: instance, 'l%i' % i: ['x', 'y']}
+    return instance
+
+
+def benchmark_preprocessing(n_instances=10000, depth=1000):
+    """
+    Measures the throughput of standardizing apart, flattening and list
+    processing many copies of each of the :data:`PREPROCESSING_SHAPES`, as
+    well as the time taken by each preprocessor for a single instance that
+    is nested depth levels deep.
+
+    :param n_instances: The number of copies of each shape to preprocess
+    :type n_instances: int
+    :param depth: The nesting depth of the deeply nested instance
+    :type depth: int
+    :return: The instances per second of each preprocessor for each shape
+        and the seconds each takes for the deeply nested instance
+    :rtype: dict
+    """
+    stages = [('name_standardizer', NameStandardizer),
+              ('flattener', Flattener),
+              ('list_processor', ListProcessor)]
+
+    results = {}
+    for name in sorted(PREPROCESSING_SHAPES):
+        instances = [Tuplizer().transform(PREPROCESSING_SHAPES[name])
+                     for i in range(n_instances)]
+        results[name] = {}
+        for stage, preprocessor in stages:
+            start = default_timer()
+            if stage == 'list_processor':
+                instances = [preprocessor().transform(instance)
+                             for instance in instances]
+            else:
+                instances = preprocessor().batch_transform(instances)
+            elapsed = default_timer() - start
+            results[name][stage + '_instances_per_second'] = (n_instances /
+                                                              elapsed)
+
+    instance = _nested_instance(depth)
+    results['nested_%i' % depth] = {}
+    for stage, preprocessor in stages:
+        start = default_timer()
+        transformed = preprocessor().transform(instance)
+        results['nested_%i' % depth][stage + '_seconds'] = (default_timer() -
+                                                            start)
+        if stage == 'name_standardizer':
+            instance = transformed
+
+    return results
+
+
+def _relational_string_instances(n_instances, n_templates, n_objects,
+                                 random_seed):
+    """
+    Returns instances whose attributes are string formatted relations drawn
+    from n_templates relation templates with random variable names.
+    """
+    rng = Random(random_seed)
+    templates = []
+    for t in range(n_templates):
+        inner = '(r%i ?%%s c%i)' % (t % 7, t % 11)
+        if t % 2:
+            inner = '(r%i ?%%s (a%i %s))' % (t % 5, t % 3, inner)
+        templates.append('(rel%i ?%%s %s)' % (t, inner))
+
+    instances = []
+    for i in range(n_instances):
+        instance = {}
+        for t in rng.sample(templates, 10):
+            names = tuple('o%i' % rng.randrange(n_objects)
+                          for j in range(t.count('%s')))
+            instance[t % names] = True
+        instances.append(instance)
+    return instances
+
+
+def benchmark_tuplizer(n_instances=20000, n_templates=300, n_objects=50,
+                       cache_size=1024, random_seed=0):
+    """
+    Measures the throughput of :class:`Tuplizer
+    <concept_formation.preprocessor.Tuplizer>` transforming and undoing
+    instances made up of string formatted relations that repeat n_templates
+    relation templates (with n_objects possible variable names), with and
+    without its caches.
+
+    :param n_instances: The number of instances (of 10 relations each)
+    :type n_instances: int
+    :param n_templates: The number of distinct relation templates
+    :type n_templates: int
+    :param n_objects: The number of distinct variable names
+    :type n_objects: int
+    :param cache_size: The cache size of the cached tuplizer
+    :type cache_size: int
+    :param random_seed: The seed used to generate the instances
+    :type random_seed: int
+    :return: The throughput with and without caching and the cache hit rates
+    :rtype: dict
+    """
+    instances = _relational_string_instances(n_instances, n_templates,
+                                             n_objects, random_seed)
+
+    results = {}
+    for name, size in (('uncached', None), ('cached', cache_size)):
+        tuplizer = Tuplizer(cache_size=size)
+        start = default_timer()
+        tuplized = tuplizer.batch_transform(instances)
+        transform_time = default_timer() - start
+
+        start = default_timer()
+        tuplizer.batch_undo(tuplized)
+        undo_time = default_timer() - start
+
+        results[name] = {
+            'transform_instances_per_second': n_instances / transform_time,
+            'undo_instances_per_second': n_instances / undo_time}
+        if size is not None:
+            results[name]['parse_hit_rate'] = (
+                tuplizer.parse_cache.stats()['hit_rate'])
+            results[name]['template_hit_rate'] = (
+                tuplizer.template_cache.stats()['hit_rate'])
+            results[name]['stringify_hit_rate'] = (
+                tuplizer.stringify_cache.stats()['hit_rate'])
+
+    return results
+
+
+def main():
+    results = {'preprocessing': benchmark_preprocessing(),
+               'tuplizer': benchmark_tuplizer()}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+"""
+The benchmark suite measures the fitting throughput, categorization latency,
+peak memory use and tree size of each of the trees on the bundled datasets, as
+well as the time taken by :func:`cluster_iter
+<concept_formation.cluster.cluster_iter>` and :func:`incremental_evaluation
+<concept_formation.evaluation.incremental_evaluation>`. Optionally, it also
+runs the benchmarks of the other modules of the package: the operator
+policies (see :mod:`concept_formation.benchmarks.policies`), value caps for
+high cardinality attributes (see
+:mod:`concept_formation.benchmarks.value_caps`), structure mapping with
+random restarts (see :mod:`concept_formation.benchmarks.mapping`), interning
+Trestle's attributes (see :mod:`concept_formation.benchmarks.interning`), and
+the preprocessors (see :mod:`concept_formation.benchmarks.preprocessing`).
+
+The suite can be run with ``python -m concept_formation.benchmarks``. The
+results are printed (or written with ``--output``) as JSON, which can be
+stored and later passed back in with ``--baseline`` to flag any metrics that
+have regressed by more than a tolerance. When regressions are found the
+process exits with a non-zero status so the suite can be used in automated
+checks.
+
+Timings are wall times so results are only comparable when they are produced
+on the same machine.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from random import seed
+from random import shuffle
+from timeit import default_timer
+import argparse
+import json
+import platform
+import sys
+
+from concept_formation.cobweb import CobwebTree
+from concept_formation.cobweb3 import Cobweb3Tree
+from concept_formation.trestle import TrestleTree
+from concept_formation.cluster import cluster_iter
+from concept_formation.evaluation import incremental_evaluation
+from concept_formation.instrumentation import Instrumentation
+from concept_formation.datasets import load_mushroom
+from concept_formation.datasets import load_congressional_voting
+from concept_formation.datasets import load_iris
+from concept_formation.datasets import load_forest_fires
+from concept_formation.datasets import load_rb_wb_03
+from concept_formation.datasets import load_quadruped
+from concept_formation.datasets import load_molecule
+from concept_formation.datasets import load_synthetic_nominal
+from concept_formation.datasets import load_synthetic_mixed
+from concept_formation.datasets import load_synthetic_sparse
+from concept_formation.datasets import load_synthetic_relational
+from concept_formation.benchmarks.measure import percentile
+from concept_formation.benchmarks.measure import peak_memory
+from concept_formation.benchmarks.policies import benchmark_policies
+from concept_formation.benchmarks.value_caps import benchmark_value_caps
+from concept_formation.benchmarks.value_caps import load_high_cardinality
+from concept_formation.benchmarks.mapping import benchmark_mapping_restarts
+from concept_formation.benchmarks.interning import benchmark_interning
+from concept_formation.benchmarks.preprocessing import \
+    benchmark_preprocessing
+from concept_formation.benchmarks.preprocessing import benchmark_tuplizer
+
+
+def _load_quadruped():
+    seed(0)
+    return load_quadruped(50)
+
+
+def _load_synthetic_mixed():
+    return list(load_synthetic_mixed(1000, seed=0))
+
+
+def _load_synthetic_wide():
+    # many well separated clusters, which produce concepts with dozens of
+    # children.
+    return list(load_synthetic_nominal(500, num_values=50, num_clusters=200,
+                                       noise=0.0, seed=0))
+
+
+def _load_synthetic_sparse():
+    # bag-of-words style instances over a 50,000 word vocabulary.
+    return list(load_synthetic_sparse(1000, seed=0))
+
+
+def _load_synthetic_relational():
+    # scenes of a dozen objects, whose hidden _role is their type.
+    return list(load_synthetic_relational(60, num_objects=12, num_relations=6,
+                                          seed=0))
+
+
+def _sparse_cobweb_tree(**kwargs):
+    return CobwebTree(sparse=True, **kwargs)
+
+
+def _blocked_trestle_tree(**kwargs):
+    return TrestleTree(blocking_keys=['_role'], **kwargs)
+
+
+# name: (tree class or function returning a tree, loader, attribute used by
+# incremental_evaluation, maximum number of instances used). The larger
+# relational datasets are truncated because structure mapping them is slow,
+# and the dense sparse benchmark is truncated because it is only included for
+# comparison.
+BENCHMARKS = {
+    'cobweb_mushroom': (CobwebTree, load_mushroom, 'classification', None),
+    'cobweb_voting': (CobwebTree, load_congressional_voting, 'Class Name',
+                      None),
+    'cobweb_synthetic_wide': (CobwebTree, _load_synthetic_wide, '_cluster',
+                              None),
+    'cobweb_sparse_50k': (_sparse_cobweb_tree, _load_synthetic_sparse,
+                          '_cluster', None),
+    'cobweb_sparse_50k_dense': (CobwebTree, _load_synthetic_sparse,
+                                '_cluster', 200),
+    'cobweb3_iris': (Cobweb3Tree, load_iris, 'class', None),
+    'cobweb3_forest_fires': (Cobweb3Tree, load_forest_fires, 'month', None),
+    'cobweb3_synthetic_mixed': (Cobweb3Tree, _load_synthetic_mixed,
+                                '_cluster', None),
+    'trestle_rumbleblocks': (TrestleTree, load_rb_wb_03,
+                             '_human_cluster_label', None),
+    'trestle_quadruped': (TrestleTree, _load_quadruped, '_type', None),
+    'trestle_molecule': (TrestleTree, load_molecule, None, 5),
+    'trestle_synthetic_relational': (TrestleTree, _load_synthetic_relational,
+                                     '_cluster', None),
+    'trestle_synthetic_relational_blocked': (_blocked_trestle_tree,
+                                             _load_synthetic_relational,
+                                             '_cluster', None),
+}
+
+# Whether a larger value of each metric is better. Metrics that are not listed
+# here (e.g., instance counts) are not compared against baselines.
+HIGHER_IS_BETTER = {
+    'fit_instances_per_second': True,
+    'categorize_p50_ms': False,
+    'categorize_p90_ms': False,
+    'categorize_p99_ms': False,
+    'peak_memory_kb': False,
+    'cu_evaluations_per_instance': False,
+    'cluster_iter_seconds': False,
+    'incremental_evaluation_seconds': False,
+}
+
+
+def benchmark_tree(tree_class, instances, n_queries=200, memory=True,
+                   random_seed=0):
+    """
+    Fits a tree on the instances and measures the fitting throughput, the
+    latency of categorizing instances in the fit tree, the peak memory used
+    while fitting and the size of the resulting tree.
+
+    The instances are fit twice: once for timing and once under memory
+    tracing with :class:`Instrumentation
+    <concept_formation.instrumentation.Instrumentation>` enabled, so that the
+    tracing does not affect the timings. Memory tracing is slow, so the second
+    pass can be skipped.
+
+    :param tree_class: The type of tree to benchmark
+    :type tree_class: CobwebTree, Cobweb3Tree, TrestleTree or a function
+        that returns a tree
+    :param instances: The instances to fit
+    :type instances: [:ref:`Instance<instance-rep>`, ...]
+    :param n_queries: The number of instances to categorize
+    :type n_queries: int
+    :param memory: Whether to measure the peak memory and instrumentation
+        counters
+    :type memory: bool
+    :param random_seed: The seed used to order the instances
+    :type random_seed: int
+    :return: The benchmark metrics
+    :rtype: dict
+    """
+    seed(random_seed)
+    instances = [i for i in instances]
+    shuffle(instances)
+
+    tree = tree_class()
+    start = default_timer()
+    for instance in instances:
+        tree.ifit(instance)
+    fit_time = default_timer() - start
+
+    latencies = []
+    for instance in instances[:n_queries]:
+        start = default_timer()
+        tree.categorize(instance)
+        latencies.append((default_timer() - start) * 1000)
+
+    results = {'tree': tree.__class__.__name__,
+               'sparse': tree.sparse,
+               'instances': len(instances),
+               'fit_seconds': fit_time,
+               'fit_instances_per_second': len(instances) / fit_time,
+               'categorize_p50_ms': percentile(latencies, 50),
+               'categorize_p90_ms': percentile(latencies, 90),
+               'categorize_p99_ms': percentile(latencies, 99),
+               'concepts': tree.root.num_concepts()}
+
+    if memory:
+        seed(random_seed)
+        traced_tree = tree_class()
+        traced_tree.instrumentation = Instrumentation()
+
+        def fit_traced():
+            for instance in instances:
+                traced_tree.ifit(instance)
+
+        results['peak_memory_kb'], _ = peak_memory(fit_traced)
+        counters = traced_tree.instrumentation.counters
+        results['cu_evaluations_per_instance'] = (
+            counters.get('cu_evaluations', 0) / len(instances))
+
+    return results
+
+
+def benchmark_evaluation(tree_class, instances, attr, max_splits=10,
+                         random_seed=0):
+    """
+    Measures the time taken to run :func:`cluster_iter
+    <concept_formation.cluster.cluster_iter>` for a number of splits and to run
+    :func:`incremental_evaluation
+    <concept_formation.evaluation.incremental_evaluation>` on the target
+    attribute.
+
+    :param tree_class: The type of tree to benchmark
+    :type tree_class: CobwebTree, Cobweb3Tree, TrestleTree or a function
+        that returns a tree
+    :param instances: The instances to cluster and evaluate on
+    :type instances: [:ref:`Instance<instance-rep>`, ...]
+    :param attr: The attribute to predict in incremental evaluation, if None
+        then only cluster_iter is timed
+    :type attr: :ref:`Attribute<attributes>`
+    :param max_splits: The number of cluster_iter splits to time
+    :type max_splits: int
+    :param random_seed: The seed used to order the instances
+    :type random_seed: int
+    :return: The benchmark metrics
+    :rtype: dict
+    """
+    seed(random_seed)
+    instances = [i for i in instances]
+    shuffle(instances)
+
+    start = default_timer()
+    n_splits = 0
+    for _ in cluster_iter(tree_class(), instances, maxsplit=max_splits):
+        n_splits += 1
+    results = {'cluster_iter_seconds': default_timer() - start,
+               'cluster_iter_splits': n_splits}
+
+    if attr is not None:
+        start = default_timer()
+        incremental_evaluation(tree_class(), instances, attr,
+                               run_length=len(instances) - 2,
+                               randomize_first=False)
+        results['incremental_evaluation_seconds'] = default_timer() - start
+
+    return results
+
+
+def run_suite(names=None, max_instances=None, n_queries=200, memory=True,
+              random_seed=0, policies=False, value_caps=False,
+              mapping_restarts=False, interning=False, preprocessing=False):
+    """
+    Runs the named benchmarks (by default all of the :data:`BENCHMARKS`) and
+    returns their results. Benchmarks whose datasets cannot be loaded are
+    reported as skipped rather than failing the whole suite.
+
+    :param names: The benchmarks to run
+    :type names: [str, ...]
+    :param max_instances: The maximum number of instances used from each
+        dataset, which overrides the default limits in :data:`BENCHMARKS`
+    :type max_instances: int
+    :param n_queries: The number of instances to categorize per benchmark
+    :type n_queries: int
+    :param memory: Whether to measure peak memory use
+    :type memory: bool
+    :param random_seed: The seed used to order the instances
+    :type random_seed: int
+    :param policies: Whether to also compare the operator policies (see:
+        :func:`benchmark_policies
+        <concept_formation.benchmarks.policies.benchmark_policies>`)
+    :type policies: bool
+    :param value_caps: Whether to also run :func:`benchmark_value_caps
+        <concept_formation.benchmarks.value_caps.benchmark_value_caps>` on a
+        synthetic high cardinality dataset
+    :type value_caps: bool
+    :param mapping_restarts: Whether to also run
+        :func:`benchmark_mapping_restarts
+        <concept_formation.benchmarks.mapping.benchmark_mapping_restarts>` on
+        a synthetic relational dataset
+    :type mapping_restarts: bool
+    :param interning: Whether to also run :func:`benchmark_interning
+        <concept_formation.benchmarks.interning.benchmark_interning>` on the
+        RumbleBlocks datasets (limited to max_instances)
+    :type interning: bool
+    :param preprocessing: Whether to also run :func:`benchmark_preprocessing
+        <concept_formation.benchmarks.preprocessing.benchmark_preprocessing>`
+        and :func:`benchmark_tuplizer
+        <concept_formation.benchmarks.preprocessing.benchmark_tuplizer>`
+    :type preprocessing: bool
+    :return: The results, keyed by benchmark name, along with information
+        about the environment they were produced in
+    :rtype: dict
+    """
+    if names is None:
+        names = sorted(BENCHMARKS)
+
+    results = {}
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError("Unknown benchmark: %s" % name)
+        tree_class, loader, attr, limit = BENCHMARKS[name]
+        if max_instances is not None:
+            limit = max_instances
+
+        try:
+            instances = loader()
+        except (IOError, OSError) as e:
+            results[name] = {'skipped': str(e)}
+            continue
+        if limit is not None:
+            instances = instances[:limit]
+
+        result = benchmark_tree(tree_class, instances, n_queries=n_queries,
+                                memory=memory, random_seed=random_seed)
+        result.update(benchmark_evaluation(tree_class, instances, attr,
+                                           random_seed=random_seed))
+        if policies:
+            result['policies'] = benchmark_policies(tree_class, instances,
+                                                    attr,
+                                                    random_seed=random_seed)
+        results[name] = result
+
+    output = {'python': platform.python_version(),
+              'platform': platform.platform(),
+              'benchmarks': results}
+    if value_caps:
+        output['value_caps'] = benchmark_value_caps(load_high_cardinality(),
+                                                    '_cluster',
+                                                    random_seed=random_seed)
+    if mapping_restarts:
+        output['mapping_restarts'] = benchmark_mapping_restarts(
+            _load_synthetic_relational(), random_seed=random_seed)
+    if interning:
+        output['interning'] = benchmark_interning(
+            max_instances=max_instances, random_seed=random_seed)
+    if preprocessing:
+        output['preprocessing'] = benchmark_preprocessing()
+        output['tuplizer'] = benchmark_tuplizer(random_seed=random_seed)
+    return output
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Compares the results of a suite run to a baseline run and returns the
+    metrics that are more than the tolerance worse than the baseline.
+
+    >>> baseline = {'benchmarks': {'b': {'fit_instances_per_second': 100.0,
+    ...                                  'categorize_p50_ms': 1.0}}}
+    >>> results = {'benchmarks': {'b': {'fit_instances_per_second': 80.0,
+    ...                                 'categorize_p50_ms': 1.05}}}
+    >>> import pprint
+    >>> pprint.pprint(compare(results, baseline, tolerance=0.1))
+    [{'baseline': 100.0,
+      'benchmark': 'b',
+      'change': -0.2,
+      'metric': 'fit_instances_per_second',
+      'value': 80.0}]
+
+    :param results: The results of :func:`run_suite`
+    :type results: dict
+    :param baseline: The stored results of an earlier run of
+        :func:`run_suite`
+    :type baseline: dict
+    :param tolerance: The relative change that is tolerated before a metric is
+        flagged (e.g., 0.1 is 10%)
+    :type tolerance: float
+    :return: The regressions found
+    :rtype: [dict, ...]
+    """
+    regressions = []
+    for name in sorted(results['benchmarks']):
+        if name not in baseline['benchmarks']:
+            continue
+        current = results['benchmarks'][name]
+        previous = baseline['benchmarks'][name]
+
+        for metric in sorted(HIGHER_IS_BETTER):
+            if current.get(metric) is None or not previous.get(metric):
+                continue
+            change = (current[metric] - previous[metric]) / previous[metric]
+            worse = -change if HIGHER_IS_BETTER[metric] else change
+            if worse > tolerance:
+                regressions.append({'benchmark': name, 'metric': metric,
+                                    'baseline': previous[metric],
+                                    'value': current[metric],
+                                    'change': round(change, 4)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m concept_formation.benchmarks',
+        description='Runs the concept_formation benchmark suite.')
+    parser.add_argument('benchmarks', nargs='*', help='the benchmarks to '
+                        'run, any of: %s (default: all)' %
+                        ', '.join(sorted(BENCHMARKS)))
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--baseline', help='a previous results file to '
+                        'check for regressions against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='the relative change tolerated before a metric '
+                        'is flagged (default: 0.1)')
+    parser.add_argument('--max-instances', type=int,
+                        help='the maximum number of instances used from each '
+                        'dataset')
+    parser.add_argument('--queries', type=int, default=200,
+                        help='the number of instances categorized per '
+                        'benchmark (default: 200)')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='skip the (slow) peak memory measurement')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='the random seed (default: 0)')
+    parser.add_argument('--policies', action='store_true',
+                        help='also compare the throughput, category utility '
+                        'and accuracy of the operator policies')
+    parser.add_argument('--value-caps', action='store_true',
+                        help='also compare the memory and accuracy of value '
+                        'caps on high cardinality attributes')
+    parser.add_argument('--mapping-restarts', action='store_true',
+                        help='also compare the quality and wall time of '
+                        'structure mapping with random restarts')
+    parser.add_argument('--interning', action='store_true',
+                        help='also compare the memory of trestle trees with '
+                        'and without interned attributes on the '
+                        'RumbleBlocks datasets')
+    parser.add_argument('--preprocessing', action='store_true',
+                        help='also measure the throughput of the '
+                        'preprocessors')
+    args = parser.parse_args(argv)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark: %s" % name)
+
+    results = run_suite(args.benchmarks or None,
+                        max_instances=args.max_instances,
+                        n_queries=args.queries, memory=args.memory,
+                        random_seed=args.seed, policies=args.policies,
+                        value_caps=args.value_caps,
+                        mapping_restarts=args.mapping_restarts,
+                        interning=args.interning,
+                        preprocessing=args.preprocessing)
+
+    if args.baseline:
+        with open(args.baseline) as fin:
+            baseline = json.load(fin)
+        results['regressions'] = compare(results, baseline, args.tolerance)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fout:
+            fout.write(output)
+    else:
+        print(output)
+
+    if results.get('regressions'):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Benchmarks the memory and accuracy of capping the number of values that
+concepts keep for each attribute (see: :class:`CobwebTree
+<concept_formation.cobweb.CobwebTree>`) on a synthetic dataset with high
+cardinality attributes.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from random import seed
+from random import shuffle
+from timeit import default_timer
+import json
+
+from concept_formation.cobweb import CobwebTree
+from concept_formation.datasets import load_synthetic_nominal
+
+
+def load_high_cardinality():
+    """
+    Returns synthetic nominal instances whose attributes have long tails of
+    noisy values, along with a unique id attribute.
+    """
+    instances = list(load_synthetic_nominal(1000, num_values=100, noise=0.3,
+                                            seed=0))
+    for i, instance in enumerate(instances):
+        instance['id'] = 'id%i' % i
+    return instances
+
+
+def benchmark_value_caps(instances, attr, caps=(None, 2, 5, 10),
+                         test_fraction=0.2, random_seed=0):
+    """
+    Fits a :class:`CobwebTree <concept_formation.cobweb.CobwebTree>` with each
+    of the value caps applied to every attribute and measures the fitting
+    throughput, the average and maximum number of values stored per concept,
+    and the accuracy of predicting the target attribute for held out
+    instances.
+
+    :param instances: The instances to fit and test on
+    :type instances: [:ref:`Instance<instance-rep>`, ...]
+    :param attr: The attribute to predict
+    :type attr: :ref:`Attribute<attributes>`
+    :param caps: The value caps to compare, None is no cap
+    :type caps: [int or None, ...]
+    :param test_fraction: The fraction of the instances held out for testing
+    :type test_fraction: float
+    :param random_seed: The seed used to order the instances
+    :type random_seed: int
+    :return: The metrics for each cap
+    :rtype: dict
+    """
+    seed(random_seed)
+    instances = [i for i in instances]
+    shuffle(instances)
+    n_test = int(len(instances) * test_fraction)
+    train = instances[n_test:]
+    test = instances[:n_test]
+    attrs = set(a for instance in instances for a in instance
+                if a[0] != '_')
+
+    results = {}
+    for cap in caps:
+        value_caps = None
+        if cap is not None:
+            value_caps = {a: cap for a in attrs}
+
+        seed(random_seed)
+        tree = CobwebTree(value_caps=value_caps)
+        start = default_timer()
+        for instance in train:
+            tree.ifit(instance)
+        fit_time = default_timer() - start
+
+        values = [sum(len(c.av_counts[a]) for a in c.av_counts)
+                  for c in tree.preorder()]
+
+        correct = 0
+        for instance in test:
+            query = {a: instance[a] for a in instance if a != attr}
+            prediction = tree.categorize(query).predict(attr)
+            correct += prediction == instance.get(attr)
+
+        results['no_cap' if cap is None else 'cap_%i' % cap] = {
+            'fit_instances_per_second': len(train) / fit_time,
+            'values_per_concept': sum(values) / len(values),
+            'max_values_per_concept': max(values),
+            'accuracy': correct / len(test) if test else None}
+
+    return results
+
+
+def main():
+    results = benchmark_value_caps(load_high_cardinality(), '_cluster')
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,33 +10,213 @@ from __future__ import division
 from random import shuffle
 from random import random
 from math import log
+from collections import deque
+from timeit import default_timer
+
+from concept_formation.utils import AliasTable
+from concept_formation.utils import instance_key
+
+# The instance weight at which a decaying tree rescales all of its counts
+# back down (see: CobwebTree.renormalize).
+_decay_renormalize_weight = 2.0
+
+# The value under which the counts of the infrequent values of an attribute
+# with a value cap are folded (see: CobwebTree).
+other_key = "#OtherValues#"
 
-from concept_formation.utils import weighted_choice
-from concept_formation.utils import most_likely_choice
 
 class CobwebTree(object):
     """
     The CobwebTree contains the knoweldge base of a partiucluar instance of the
     cobweb algorithm and can be used to fit and categorize instances.
+
+    The decay parameter enables exponential forgetting of old instances, which
+    is useful for long running trees that are fit on streams subject to concept
+    drift. After each instance is incorporated, all previous counts are
+    effectively multiplied by the decay factor. Rather than touching every node
+    on each :meth:`CobwebTree.ifit`, new instances are instead incorporated
+    with a weight that grows by a factor of ``1 / decay`` each step. Because
+    category utility only depends on ratios of counts this is equivalent to
+    decaying all of the counts. Once the instance weight grows large, the
+    counts of the whole tree are rescaled to effective counts (where the most
+    recent instance has a weight of 1) in a single pass (see:
+    :meth:`CobwebTree.renormalize`).
+
+    When a prune_threshold is also provided then concepts whose effective
+    count drops below the threshold are removed during this rescaling, which
+    keeps the tree compact. The threshold should
+    be less than the decay factor, otherwise the most recent instances would
+    be eligible for pruning.
+
+    :param decay: The factor to multiply old counts by after each instance
+        (e.g., 0.999). By default no decay is applied.
+    :type decay: a float in (0, 1] or None
+    :param prune_threshold: The effective count below which concepts are
+        pruned. By default nothing is pruned.
+    :type prune_threshold: float or None
+    :param operator_policy: A policy that limits when the merge and split
+        operations are entertained, trading tree quality for speed. By default
+        every operation is entertained at every concept.
+    :type operator_policy: :class:`OperatorPolicy
+        <concept_formation.operator_policy.OperatorPolicy>` or None
+    :param sparse: Whether to use sparse mode, in which the tree is made of
+        :class:`SparseCobwebNode` concepts. This is much faster for instances
+        that only have a few of the many attributes in the tree (e.g.,
+        bag-of-words instances).
+    :type sparse: boolean
+    :param value_caps: The maximum number of values each concept keeps for
+        particular attributes, e.g., ``{'id': 10}``. By default the values of
+        every attribute are kept.
+    :type value_caps: {:ref:`Attribute<attributes>`: int} or None
+
+    High cardinality nominal attributes (e.g., ids or urls) make every
+    concept's probability table grow without bound. When an attribute has a
+    value cap, each concept only keeps the counts of that many values for the
+    attribute, using the Space-Saving heavy hitters algorithm. Each kept value
+    has a counter, which is its count plus an error. Once a concept is full, a
+    new value replaces the value with the smallest counter and inherits that
+    counter as its error, so frequent values are not evicted by a long tail
+    of infrequent ones. The count of the replaced value is folded into the
+    attribute's :data:`other_key` value. The other
+    value also keeps the sum of the squared counts folded into it, so that
+    :meth:`CobwebNode.expected_correct_guesses` and
+    :meth:`CobwebNode.probability` treat it as many infrequent values rather
+    than a single frequent one. It is never predicted.
+
+    >>> tree = CobwebTree(value_caps={'id': 2})
+    >>> tree.fit([{'id': 'a'}, {'id': 'a'}, {'id': 'b'}, {'id': 'c'}],
+    ...          randomize_first=False)
+    >>> sorted(tree.root.av_counts['id'].items())
+    [('#OtherValues#', 1), ('a', 2), ('c', 1)]
+    >>> tree.root.probability('id', 'b')
+    0.25
+    >>> tree.root.predict('id')
+    'a'
+
+    The instrumentation attribute can be set to an :class:`Instrumentation
+    <concept_formation.instrumentation.Instrumentation>` object to record
+    statistics about how each instance is incorporated. It is None (disabled)
+    by default.
+
+    Similarly, the categorize_cache attribute can be set to an
+    :class:`LRUCache <concept_formation.utils.LRUCache>` to cache the concepts
+    returned by :meth:`CobwebTree.categorize` (and used by
+    :meth:`CobwebTree.infer_missing`) for repeated instances. Cached results
+    are only used while the tree is unchanged: any call to
+    :meth:`CobwebTree.ifit`, :meth:`CobwebTree.clear` or anything that
+    restructures the tree invalidates them. The cache's hits and misses can
+    be checked with :meth:`LRUCache.stats
+    <concept_formation.utils.LRUCache.stats>`.
+
+    >>> from concept_formation.utils import LRUCache
+    >>> tree = CobwebTree()
+    >>> tree.categorize_cache = LRUCache(100)
+    >>> tree.fit([{'a': 'x'}, {'a': 'y'}], randomize_first=False)
+    >>> tree.categorize({'a': 'x'}) is tree.categorize({'a': 'x'})
+    True
+    >>> leaf = tree.ifit({'a': 'z'})
+    >>> concept = tree.categorize({'a': 'x'})
+    >>> tree.categorize_cache.hits, tree.categorize_cache.misses
+    (1, 2)
     """
 
-    def __init__(self):
+    # Default values for trees that do not call the CobwebTree constructor.
+    decay = None
+    prune_threshold = None
+    operator_policy = None
+    sparse = False
+    value_caps = None
+    instance_weight = 1
+    instrumentation = None
+    categorize_cache = None
+
+    # Incremented whenever the tree is modified, which invalidates the cached
+    # results of categorize.
+    _version = 0
+
+    # Incremented whenever existing concepts move within the tree, which
+    # invalidates the cached concept depths (see: CobwebNode.depth).
+    _structure_version = 0
+
+    def __init__(self, decay=None, prune_threshold=None,
+                 operator_policy=None, sparse=False, value_caps=None):
         """
         The tree constructor.
         """
-        self.root = CobwebNode()
-        self.root.tree = self
+        if decay is not None and not (0.0 < decay <= 1.0):
+            raise ValueError("decay must be in the range (0, 1].")
+        if sparse and value_caps:
+            raise ValueError("value_caps are not supported in sparse mode.")
+        if value_caps and min(value_caps.values()) < 1:
+            raise ValueError("value caps must be at least 1.")
+        self.value_caps = value_caps
+        self.decay = decay
+        self.prune_threshold = prune_threshold
+        self.operator_policy = operator_policy
+        self.sparse = sparse
+        self.clear()
 
     def clear(self):
         """
         Clears the concepts of the tree.
         """
-        self.root = CobwebNode()
+        if self.sparse:
+            self.root = SparseCobwebNode()
+        else:
+            self.root = CobwebNode()
         self.root.tree = self
+        self.instance_weight = 1
+        self._invalidate_categorize_cache()
+
+    def _invalidate_categorize_cache(self):
+        """
+        Invalidates all of the results in the categorize cache, which is used
+        when the concepts of the tree are replaced.
+        """
+        self._version += 1
+        if self.categorize_cache is not None:
+            self.categorize_cache.clear()
 
     def __str__(self):
         return str(self.root)
 
+    def preorder(self):
+        """
+        Iterates over the concepts of the tree in preorder (see:
+        :meth:`CobwebNode.preorder`).
+        """
+        return self.root.preorder()
+
+    def postorder(self):
+        """
+        Iterates over the concepts of the tree in postorder (see:
+        :meth:`CobwebNode.postorder`).
+        """
+        return self.root.postorder()
+
+    def level_order(self):
+        """
+        Iterates over the concepts of the tree in level order (see:
+        :meth:`CobwebNode.level_order`).
+        """
+        return self.root.level_order()
+
+    def leaves(self):
+        """
+        Iterates over the leaves of the tree (see: :meth:`CobwebNode.leaves`).
+        """
+        return self.root.leaves()
+
+    def _structure_changed(self):
+        """
+        Invalidates the cached depths and recomputes the cached sizes of every
+        concept. This is used after operations that restructure large parts of
+        the tree at once, such as :meth:`CobwebTree.renormalize`.
+        """
+        self._structure_version += 1
+        for node in self.root.postorder():
+            node._size = 1 + sum([c._size for c in node.children])
+
     def _sanity_check_instance(self,instance):
         for attr in instance:
             try:
@@ -123,7 +303,8 @@ class CobwebTree(object):
         children (see: :meth:`CobwebNode.get_best_operation
         <CobwebNode.get_best_operation>`), commiting to whichever operation
         results in the highest category utility. In the case of ties an
-        operation is chosen at random.
+        operation is chosen at random. The tree's operator_policy, if any,
+        determines which of the operations are entertained at each concept.
 
         In the base case, i.e. a leaf node, the algorithm checks to see if
         the current leaf is an exact match to the current node. If it is, then
@@ -142,25 +323,71 @@ class CobwebTree(object):
 
         .. seealso:: :meth:`CobwebTree.ifit`, :meth:`CobwebTree.categorize`
         """
+        if (self.decay is not None and
+                self.instance_weight > _decay_renormalize_weight):
+            self.renormalize()
+
+        self._version += 1
+
+        inst = self.instrumentation
+        if inst is None:
+            current = self._incorporate(instance)
+        else:
+            # the nesting of the instrumentation is restored even if
+            # incorporating the instance fails.
+            inst.begin()
+            start = default_timer()
+            try:
+                current = self._incorporate(instance)
+                inst.incr('instances')
+                inst.incr('depth', current.depth())
+                inst.add_time('cobweb', default_timer() - start)
+            finally:
+                inst.end()
+
+        if self.decay is not None:
+            self.instance_weight /= self.decay
+
+        return current
+
+    def _incorporate(self, instance):
+        """
+        Sorts the instance down the tree, incorporating it into the concepts
+        along the way (see: :meth:`CobwebTree.cobweb`), and returns the concept
+        that best describes it.
+        """
+        inst = self.instrumentation
+        policy = self.operator_policy
+        if policy is not None:
+            policy.begin()
+
         current = self.root
+        depth = 0
 
         while current:
             # the current.count == 0 here is for the initially empty tree.
             if not current.children and (current.is_exact_match(instance) or
                                          current.count == 0):
                 # print("leaf match")
+                if inst is not None:
+                    inst.incr('op_leaf_match')
                 current.increment_counts(instance)
                 break
 
             elif not current.children:
                 # print("fringe split")
+                if inst is not None:
+                    inst.incr('op_fringe_split')
                 new = current.__class__(current)
                 current.parent = new
                 new.children.append(current)
+                new._size = current._size + 1
+                self._structure_version += 1
 
                 if new.parent:
                     new.parent.children.remove(current)
                     new.parent.children.append(new)
+                    new.parent._update_size(1)
                 else:
                     self.root = new
 
@@ -170,11 +397,17 @@ class CobwebTree(object):
 
             else:
                 best1, best2 = current.two_best_children(instance)
-                action_cu, best_action = current.get_best_operation(instance,
-                                                                    best1,
-                                                                    best2)
+                if policy is None:
+                    action_cu, best_action = current.get_best_operation(
+                        instance, best1, best2)
+                else:
+                    action_cu, best_action = current.get_best_operation(
+                        instance, best1, best2, policy.operations(depth),
+                        policy.margin)
 
                 # print(best_action)
+                if inst is not None:
+                    inst.incr('op_' + best_action)
                 if best1:
                     best1_cu, best1 = best1
                 if best2:
@@ -183,6 +416,7 @@ class CobwebTree(object):
                 if best_action == 'best':
                     current.increment_counts(instance)
                     current = best1
+                    depth += 1
                 elif best_action == 'new':
                     current.increment_counts(instance)
                     current = current.create_new_child(instance)
@@ -191,6 +425,7 @@ class CobwebTree(object):
                     current.increment_counts(instance)
                     new_child = current.merge(best1, best2)
                     current = new_child
+                    depth += 1
                 elif best_action == 'split':
                     current.split(best1)
                 else:
@@ -200,7 +435,119 @@ class CobwebTree(object):
 
         return current
 
-    def _cobweb_categorize(self, instance):
+    def renormalize(self):
+        """
+        Rescales the counts of every concept in a decaying tree to effective
+        counts, where the most recent instance has a weight of 1, and resets
+        the instance weight back to 1. If the tree has a prune_threshold, then
+        concepts with an effective count below the threshold are removed and
+        their counts are subtracted from their ancestors, so the counts of
+        every concept still sum to those of its children. Whenever pruning
+        leaves a concept with a single child, that child is replaced by its
+        own children (or the concept takes the place of the child when it is
+        a leaf). When every child of a concept is below the threshold, the
+        concept becomes a leaf that summarizes them instead.
+
+        This is called automatically by :meth:`CobwebTree.cobweb` whenever the
+        instance weight grows too large, so the cost of touching every node
+        is amortized over many instances.
+
+        >>> tree = CobwebTree(decay=0.5, prune_threshold=0.3)
+        >>> tree.fit([{'a': 'x'}, {'a': 'y'}], randomize_first=False)
+        >>> tree.instance_weight
+        4.0
+        >>> tree.renormalize()
+        >>> print(tree.root.count, len(tree.root.children))
+        0.5 0
+        >>> tree.root.av_counts['a']
+        {'y': 0.5}
+        >>> leaf = tree.ifit({'a': 'z'})
+        >>> print(tree.root.count, len(tree.root.children))
+        1.5 2
+        """
+        factor = 1.0 / self.instance_weight
+        threshold = self.prune_threshold
+        self.instance_weight = 1.0
+
+        # the concepts that lost descendants to pruning, which are recounted
+        # from their remaining children (or, when they are left without any,
+        # from the last child they replaced).
+        pruned = []
+        replaced = {}
+
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            node.rescale_counts(factor)
+
+            if threshold is not None:
+                while True:
+                    kept = [c for c in node.children
+                            if c.count * factor >= threshold]
+                    if not kept:
+                        node.children = []
+                        break
+                    if len(kept) < len(node.children):
+                        pruned.append(node)
+                    node.children = kept
+                    if len(kept) != 1:
+                        break
+                    only_child = kept[0]
+                    node.children = only_child.children
+                    for c in node.children:
+                        c.parent = node
+                    replaced[node] = only_child
+
+            nodes.extend(node.children)
+
+        dirty = set()
+        for node in pruned:
+            while node is not None and node not in dirty:
+                dirty.add(node)
+                node = node.parent
+
+        if dirty:
+            for node in self.root.postorder():
+                if node not in dirty:
+                    continue
+                sources = node.children
+                if not sources:
+                    sources = [replaced[node]]
+                    sources[0].rescale_counts(factor)
+                node._reset_counts()
+                for source in sources:
+                    node.update_counts_from_node(source)
+
+        self._structure_changed()
+
+    def _categorize_with_cache(self, instance, categorize, **options):
+        """
+        Returns the result of calling the categorize function on the instance,
+        using the categorize_cache when one is set and the tree has not changed
+        since the result was cached. Only the default categorization is cached,
+        so the cache is bypassed when any early stopping options are given.
+        """
+        options = {k: v for k, v in options.items()
+                   if v is not None and v is not False}
+        if options:
+            return categorize(instance, **options)
+
+        if self.categorize_cache is None:
+            return categorize(instance)
+
+        key = instance_key(instance)
+        if key is None:
+            return categorize(instance)
+        key = (self._version, self._structure_version, key)
+
+        concept = self.categorize_cache.get(key)
+        if concept is None:
+            concept = categorize(instance)
+            self.categorize_cache.put(key, concept)
+        return concept
+
+    def _cobweb_categorize(self, instance, max_depth=None, min_count=None,
+                           stop_when=None, return_path=False):
         """
         A cobweb specific version of categorize, not inteded to be
         externally called.
@@ -208,20 +555,39 @@ class CobwebTree(object):
         .. seealso:: :meth:`CobwebTree.categorize`
         """
         current = self.root
-        while current:
-            if not current.children:
-                return current
+        path = [current]
+        depth = 0
+        while current.children:
+            if max_depth is not None and depth >= max_depth:
+                break
+            if stop_when is not None and stop_when(current):
+                break
 
             best1, best2 = current.two_best_children(instance)
+            if min_count is not None and best1[1].count < min_count:
+                break
+
             current = best1[1]
+            depth += 1
+            if return_path:
+                path.append(current)
+
+        if return_path:
+            return current, path
+        return current
 
     def infer_missing(self, instance, choice_fn="most likely",
-                      allow_none=True):
+                      allow_none=True, max_depth=None, min_count=None,
+                      stop_when=None):
         """
         Given a tree and an instance, returns a new instance with attribute
         values picked using the specified choice function (either "most likely"
         or "sampled").
 
+        The max_depth, min_count, and stop_when options stop the
+        categorization early (see :meth:`CobwebTree.categorize`), so the values
+        are inferred from a more general concept.
+
         .. todo:: write some kind of test for this.
 
         :param instance: an instance to be completed.
@@ -233,12 +599,23 @@ class CobwebTree(object):
             inferred to be missing. If False, then all attributes will be
             inferred with some value.
         :type allow_none: Boolean
+        :param max_depth: the maximum depth to categorize the instance to.
+        :type max_depth: int
+        :param min_count: the minimum count of a concept to descend into.
+        :type min_count: float
+        :param stop_when: a function that takes a concept and returns True if
+            categorization should stop at that concept.
+        :type stop_when: function
         :return: A completed instance
         :rtype: :ref:`Instance<instance-rep>`
         """
         self._sanity_check_instance(instance)
         temp_instance = {a:instance[a] for a in instance}
-        concept = self._cobweb_categorize(temp_instance)
+        concept = self._categorize_with_cache(temp_instance,
+                                              self._cobweb_categorize,
+                                              max_depth=max_depth,
+                                              min_count=min_count,
+                                              stop_when=stop_when)
 
         for attr in concept.attrs('all'):
             if attr in temp_instance:
@@ -249,7 +626,8 @@ class CobwebTree(object):
 
         return temp_instance
 
-    def categorize(self, instance): 
+    def categorize(self, instance, max_depth=None, min_count=None,
+                   stop_when=None, return_path=False):
         """
         Sort an instance in the categorization tree and return its resulting
         concept.
@@ -260,15 +638,52 @@ class CobwebTree(object):
         modify the tree's knowledge** for a modifying version of labeling use
         the :meth:`CobwebTree.ifit` function
 
+        By default the instance is sorted all the way to a leaf. Sorting can be
+        stopped early, trading accuracy for speed, once the concept reached is
+        at max_depth (the root is at depth 0), when the best child has a count
+        less than min_count, or when stop_when returns True for the concept.
+        For example, to stop once a concept predicts an attribute with enough
+        probability:
+
+        >>> from concept_formation.cobweb import CobwebTree
+        >>> tree = CobwebTree()
+        >>> tree.fit([{'a': 'x', 'b': 'y'}, {'a': 'x', 'b': 'z'},
+        ...           {'a': 'w', 'b': 'z'}], randomize_first=False)
+        >>> def confident(concept):
+        ...     return concept.probability('a', concept.predict('a')) >= 0.6
+        >>> concept, path = tree.categorize({'b': 'y'}, stop_when=confident,
+        ...                                 return_path=True)
+        >>> concept is tree.root
+        True
+        >>> len(path)
+        1
+        >>> tree.categorize({'b': 'y'}, max_depth=0) is tree.root
+        True
+
         :param instance: an instance to be categorized into the tree.
         :type instance: :ref:`Instance<instance-rep>`
-        :return: A concept describing the instance
-        :rtype: CobwebNode
+        :param max_depth: the maximum depth to categorize the instance to.
+        :type max_depth: int
+        :param min_count: the minimum count of a concept to descend into.
+        :type min_count: float
+        :param stop_when: a function that takes a concept and returns True if
+            categorization should stop at that concept.
+        :type stop_when: function
+        :param return_path: whether to also return the concepts from the root
+            to the returned concept.
+        :type return_path: Boolean
+        :return: A concept describing the instance, or the concept and the path
+            to it when return_path is True.
+        :rtype: CobwebNode or (CobwebNode, [CobwebNode, ...])
 
         .. seealso:: :meth:`CobwebTree.cobweb`
         """
         self._sanity_check_instance(instance)
-        return self._cobweb_categorize(instance)
+        return self._categorize_with_cache(instance, self._cobweb_categorize,
+                                           max_depth=max_depth,
+                                           min_count=min_count,
+                                           stop_when=stop_when,
+                                           return_path=return_path)
 
 class CobwebNode(object):
     """
@@ -292,6 +707,12 @@ class CobwebNode(object):
     # a counter used to generate unique concept names.
     _counter = 0
 
+    # the number of children at which two_best_children switches to bounding
+    # each child's category utility rather than computing all of them, and the
+    # relative padding that turns the estimates into bounds.
+    _bound_min_children = 5
+    _bound_tolerance = 1e-9
+
     def __init__(self, otherNode=None):
         """Create a new CobwebNode"""
         self.concept_id = self.gensym() 
@@ -300,14 +721,33 @@ class CobwebNode(object):
         self.children = [] 
         self.parent = None 
         self.tree = None
+        self._size = 1
+        self._depth = 0
+        self._depth_version = -1
+        self._counts_version = 0
+        self._choice_tables = None
+        self._other_sq = None
+        self._value_errors = None
 
         if otherNode:
-            self.tree = otherNode.tree
             self.parent = otherNode.parent
-            self.update_counts_from_node(otherNode)
 
-            for child in otherNode.children:
-                self.children.append(self.__class__(child))
+            # the subtree is copied iteratively so deep trees can be copied.
+            nodes = [(self, otherNode)]
+            while nodes:
+                copy, original = nodes.pop()
+                copy.tree = original.tree
+                if (copy.tree is not None and
+                        copy.tree.instrumentation is not None):
+                    copy.tree.instrumentation.incr('node_copies')
+                copy.update_counts_from_node(original)
+                copy._size = original._size
+
+                for child in original.children:
+                    child_copy = self.__class__()
+                    child_copy.parent = copy
+                    copy.children.append(child_copy)
+                    nodes.append((child_copy, child))
 
     def shallow_copy(self):
         """
@@ -318,6 +758,8 @@ class CobwebNode(object):
         the tree, except for the root which is necessary to calculate category
         utility.
         """
+        if self.tree is not None and self.tree.instrumentation is not None:
+            self.tree.instrumentation.incr('node_copies')
         temp = self.__class__()
         temp.tree = self.tree
         temp.parent = self.parent
@@ -348,15 +790,136 @@ class CobwebNode(object):
         Increment the counts at the current node according to the specified
         instance.
 
+        If the node belongs to a decaying tree, then the instance is
+        incorporated with the tree's current instance weight rather than 1.
+
         :param instance: A new instances to incorporate into the node.
         :type instance: :ref:`Instance<instance-rep>`
         """
-        self.count += 1 
+        weight = 1 if self.tree is None else self.tree.instance_weight
+        self._counts_version += 1
+        self.count += weight
+        caps = None if self.tree is None else self.tree.value_caps
         for attr in instance:
             self.av_counts[attr] = self.av_counts.setdefault(attr,{})
+            if (caps and attr in caps and
+                    instance[attr] not in self.av_counts[attr]):
+                self._make_room(attr, caps[attr], instance[attr])
             self.av_counts[attr][instance[attr]] = (self.av_counts[attr].get(
-                instance[attr], 0) + 1)
+                instance[attr], 0) + weight)
+
+    def _value_counter(self, attr, val):
+        """
+        Returns the Space-Saving counter of a kept value, i.e., its count plus
+        the count it inherited when it replaced another value.
+        """
+        count = self.av_counts[attr][val]
+        if self._value_errors is not None and attr in self._value_errors:
+            count += self._value_errors[attr].get(val, 0)
+        return count
+
+    def _fold_value(self, attr, val):
+        """
+        Removes a kept value, folds its count into the attribute's other value
+        and returns its Space-Saving counter.
+        """
+        counter = self._value_counter(attr, val)
+        count = self.av_counts[attr].pop(val)
+        if self._value_errors is not None and attr in self._value_errors:
+            self._value_errors[attr].pop(val, None)
+        if self._other_sq is None:
+            self._other_sq = {}
+        self.av_counts[attr][other_key] = (
+            self.av_counts[attr].get(other_key, 0) + count)
+        self._other_sq[attr] = self._other_sq.get(attr, 0) + count * count
+        return counter
+
+    def _min_counter_values(self, attr):
+        """
+        Returns the kept values of an attribute ordered from the smallest
+        Space-Saving counter to the largest.
+        """
+        counts = self.av_counts[attr]
+        return [val for c, n, i, val in sorted(
+            (self._value_counter(attr, val), counts[val], i, val)
+            for i, val in enumerate(counts) if val != other_key)]
+
+    def _make_room(self, attr, cap, val):
+        """
+        Makes room for a new value of a capped attribute using the
+        Space-Saving algorithm: when cap values are already kept, the value
+        with the smallest counter is folded into the other value and the new
+        value inherits its counter (as the new value's error).
+        """
+        counts = self.av_counts[attr]
+        kept = len(counts) - (1 if other_key in counts else 0)
+        if kept < cap:
+            return
+
+        evicted = self._min_counter_values(attr)[0]
+        counter = self._fold_value(attr, evicted)
+        if self._value_errors is None:
+            self._value_errors = {}
+        self._value_errors.setdefault(attr, {})[val] = counter
+
+    def _cap_values(self, attr, cap):
+        """
+        Folds the values of an attribute with the smallest Space-Saving
+        counters into its other value until at most cap values are kept. This
+        is used when the counts of two concepts are combined.
+        """
+        counts = self.av_counts[attr]
+        excess = len(counts) - cap
+        if other_key in counts:
+            excess -= 1
+        if excess <= 0:
+            return
+
+        for val in self._min_counter_values(attr)[:excess]:
+            self._fold_value(attr, val)
+
+    def _other_sq_sum(self, attr):
+        """
+        Returns the sum of the squared counts of the values folded into an
+        attribute's other value.
+        """
+        if self._other_sq is not None and attr in self._other_sq:
+            return self._other_sq[attr]
+        return self.av_counts[attr][other_key] ** 2
+
+    def rescale_counts(self, factor):
+        """
+        Multiply all of the counts in the node's probability table by the
+        given factor. This is used by :meth:`CobwebTree.renormalize` to apply
+        decay.
+
+        :param factor: The amount to multiply the counts by
+        :type factor: float
+        """
+        self._counts_version += 1
+        self.count *= factor
+        for attr in self.av_counts:
+            for val in self.av_counts[attr]:
+                self.av_counts[attr][val] *= factor
+        if self._other_sq is not None:
+            for attr in self._other_sq:
+                self._other_sq[attr] *= factor * factor
+        if self._value_errors is not None:
+            for attr in self._value_errors:
+                for val in self._value_errors[attr]:
+                    self._value_errors[attr][val] *= factor
     
+    def _reset_counts(self):
+        """
+        Empties the node's probability table, so it can be recounted from
+        other nodes with :meth:`CobwebNode.update_counts_from_node`.
+        """
+        self._counts_version += 1
+        self.count = 0.0
+        self.av_counts = {}
+        self._other_sq = None
+        self._value_errors = None
+
     def update_counts_from_node(self, node):
         """
         Increments the counts of the current node by the amount in the
@@ -367,6 +930,7 @@ class CobwebNode(object):
         :param node: Another node from the same CobwebTree
         :type node: CobwebNode
         """
+        self._counts_version += 1
         self.count += node.count
         for attr in node.attrs('all'):
             for val in node.av_counts[attr]:
@@ -374,6 +938,28 @@ class CobwebNode(object):
                 self.av_counts[attr][val] = (self.av_counts[attr].get(val,0) +
                                      node.av_counts[attr][val])
 
+        if node._other_sq is not None:
+            if self._other_sq is None:
+                self._other_sq = {}
+            for attr in node._other_sq:
+                self._other_sq[attr] = (self._other_sq.get(attr, 0) +
+                                        node._other_sq[attr])
+
+        if node._value_errors is not None:
+            if self._value_errors is None:
+                self._value_errors = {}
+            for attr in node._value_errors:
+                errors = self._value_errors.setdefault(attr, {})
+                for val in node._value_errors[attr]:
+                    errors[val] = (errors.get(val, 0) +
+                                   node._value_errors[attr][val])
+
+        caps = None if self.tree is None else self.tree.value_caps
+        if caps:
+            for attr in caps:
+                if attr in self.av_counts:
+                    self._cap_values(attr, caps[attr])
+
     def expected_correct_guesses(self):
         """
         Returns the number of correct guesses that are expected from the given
@@ -394,9 +980,17 @@ class CobwebNode(object):
             attr_count += 1
             if attr in self.av_counts:
                 for val in self.av_counts[attr]:
+                    if val == other_key:
+                        correct_guesses += (self._other_sq_sum(attr) /
+                                            (self.count * self.count))
+                        continue
                     prob = (self.av_counts[attr][val]) / self.count
                     correct_guesses += (prob * prob)
 
+        # a concept without any (non-hidden) attributes has nothing to guess.
+        if attr_count == 0:
+            return 0.0
+
         return correct_guesses / attr_count
 
     def category_utility(self):
@@ -429,6 +1023,9 @@ class CobwebNode(object):
                  children.
         :rtype: float     
         """
+        if self.tree is not None and self.tree.instrumentation is not None:
+            self.tree.instrumentation.incr('cu_evaluations')
+
         if len(self.children) == 0:
             return 0.0
 
@@ -442,7 +1039,8 @@ class CobwebNode(object):
                 (1.0 * len(self.children)))
 
     def get_best_operation(self, instance, best1, best2, 
-                            possible_ops=["best", "new", "merge", "split"]):
+                            possible_ops=["best", "new", "merge", "split"],
+                            margin=None):
         """
         Given an instance, the two best children based on category utility and a
         set of possible operations, find the operation that produces the highest
@@ -505,6 +1103,10 @@ class CobwebNode(object):
         :param possible_ops: A list of operations from ["best", "new", "merge",
             "split"] to entertain.
         :type possible_ops: ["best", "new", "merge", "split"]
+        :param margin: If provided, merge and split are only entertained when
+            the category utility of the best and new operations are within the
+            margin of each other.
+        :type margin: float
         :return: A tuple of the category utility of the best operation and the
             name of the best operation.
         :rtype: (cu_bestOp,name_bestOp)
@@ -522,6 +1124,9 @@ class CobwebNode(object):
             operations.append((best1_cu, random(), "best"))
         if "new" in possible_ops: 
             operations.append((self.cu_for_new_child(instance), random(), 'new'))
+        if (margin is not None and len(operations) == 2 and
+                abs(operations[0][0] - operations[1][0]) > margin):
+            possible_ops = ["best", "new"]
         if "merge" in possible_ops and len(self.children) > 2 and best2:
             operations.append((self.cu_for_merge(best1, best2, instance),
                                random(),'merge'))
@@ -550,6 +1155,9 @@ class CobwebNode(object):
         if len(self.children) == 0:
             raise Exception("No children!")
 
+        if len(self.children) >= self._bound_min_children:
+            return self._bounded_two_best_children(instance)
+
         children_cu = [(self.cu_for_insert(child, instance), child.count,
                         random(), child) for child in self.children]
         children_cu.sort(reverse=True)
@@ -562,6 +1170,62 @@ class CobwebNode(object):
         return ((children_cu[0][0], children_cu[0][3]), (children_cu[1][0],
                                                          children_cu[1][3]))
 
+    def _bounded_two_best_children(self, instance):
+        """
+        Returns the same result as :meth:`CobwebNode.two_best_children`, but
+        avoids computing the full category utility of inserting the instance
+        into every child, which costs time quadratic in the number of children.
+
+        The category utility of inserting the instance into a child only
+        depends on the child through the change in its count weighted expected
+        correct guesses, which can be computed from the child and the
+        instance alone. This gives an estimate of each child's category
+        utility that is padded (to cover floating point error) into an upper
+        bound. The children are evaluated exactly with
+        :meth:`CobwebNode.cu_for_insert` in order of their bounds until no
+        remaining child can be one of the best two.
+        """
+        # draw the random tie breakers in the same order as the full sort.
+        tie_breakers = [random() for child in self.children]
+
+        temp = self.shallow_copy()
+        temp.increment_counts(instance)
+        count = temp.count
+        n = len(self.children)
+
+        current = []
+        inserted = []
+        for child in self.children:
+            temp_child = child.shallow_copy()
+            current.append(child.count * child.expected_correct_guesses())
+            temp_child.increment_counts(instance)
+            inserted.append(temp_child.count *
+                            temp_child.expected_correct_guesses())
+
+        total = sum(current)
+        parent_guesses = temp.expected_correct_guesses()
+        bounds = []
+        for i, child in enumerate(self.children):
+            estimate = (((total - current[i] + inserted[i]) / count -
+                         parent_guesses) / n)
+            bounds.append((estimate + self._bound_tolerance *
+                           (1 + abs(estimate)), i))
+        bounds.sort(reverse=True)
+
+        best = []
+        for bound, i in bounds:
+            if len(best) == 2 and bound < best[1][0]:
+                break
+            child = self.children[i]
+            best.append((self.cu_for_insert(child, instance), child.count,
+                         tie_breakers[i], child))
+            best.sort(reverse=True)
+            best = best[:2]
+
+        if len(best) == 1:
+            return (best[0][0], best[0][3]), None
+        return (best[0][0], best[0][3]), (best[1][0], best[1][3])
+
     def cu_for_insert(self, child, instance):
         """
         Compute the category utility of adding the instance to the specified
@@ -613,6 +1277,7 @@ class CobwebNode(object):
         new_child.tree = self.tree
         new_child.increment_counts(instance)
         self.children.append(new_child)
+        self._update_size(1)
         return new_child
 
     def create_child_with_current_counts(self):
@@ -631,6 +1296,7 @@ class CobwebNode(object):
             new.parent = self
             new.tree = self.tree
             self.children.append(new)
+            self._update_size(new._size)
             return new
 
     def cu_for_new_child(self, instance):
@@ -656,7 +1322,14 @@ class CobwebNode(object):
         # temp = self.shallow_copy()
 
         temp.increment_counts(instance)
-        temp.create_new_child(instance)
+
+        # the child is created directly, rather than with create_new_child,
+        # so that the sizes of the real ancestors are not updated.
+        new_child = self.__class__()
+        new_child.tree = self.tree
+        new_child.parent = temp
+        new_child.increment_counts(instance)
+        temp.children.append(new_child)
         return temp.category_utility()
 
     def merge(self, best1, best2):
@@ -692,6 +1365,11 @@ class CobwebNode(object):
         self.children.remove(best2)
         self.children.append(new_child)
 
+        new_child._size = 1 + best1._size + best2._size
+        self._update_size(1)
+        if self.tree is not None:
+            self.tree._structure_version += 1
+
         return new_child
 
     def cu_for_merge(self, best1, best2, instance):
@@ -750,6 +1428,10 @@ class CobwebNode(object):
             child.tree = self.tree
             self.children.append(child)
 
+        self._update_size(-1)
+        if self.tree is not None:
+            self.tree._structure_version += 1
+
     def cu_for_fringe_split(self, instance):
         """
         Return the category utility of performing a fringe split (i.e.,
@@ -771,10 +1453,22 @@ class CobwebNode(object):
         """
 
         temp = self.shallow_copy()
-        
-        temp.create_child_with_current_counts()
+
+        # the children are created directly, rather than with
+        # create_child_with_current_counts and create_new_child, so that the
+        # sizes of the real ancestors are not updated.
+        if self.count > 0:
+            current_child = self.shallow_copy()
+            current_child.parent = temp
+            temp.children.append(current_child)
+
         temp.increment_counts(instance)
-        temp.create_new_child(instance)
+
+        new_child = self.__class__()
+        new_child.tree = self.tree
+        new_child.parent = temp
+        new_child.increment_counts(instance)
+        temp.children.append(new_child)
 
         return temp.category_utility()
 
@@ -862,32 +1556,135 @@ class CobwebNode(object):
         The string formatting inserts tab characters to align child nodes of the
         same depth.
         
-        :param depth: The current depth in the print, intended to be called
-                      recursively
+        :param depth: The number of tabs to indent the current node by
         :type depth: int
         :return: a formated string displaying the tree and its children
         :rtype: str
         """
+        lines = []
+        stack = [(self, depth)]
+        while stack:
+            node, node_depth = stack.pop()
+            lines.append(node._pretty_print_line(node_depth))
+            stack.extend((c, node_depth + 1) for c in reversed(node.children))
+        return ''.join(lines)
 
-        ret = str(('\t' * depth) + "|-" + str(self.av_counts) + ":" +
-                  str(self.count) + '\n')
-        
-        for c in self.children:
-            ret += c.pretty_print(depth+1)
+    def _pretty_print_line(self, depth):
+        """
+        Returns the line describing this concept (without its children) in
+        :meth:`CobwebNode.pretty_print`.
+        """
+        return str(('\t' * depth) + "|-" + str(self.av_counts) + ":" +
+                   str(self.count) + '\n')
 
-        return ret
+    def preorder(self):
+        """
+        Iterates over this concept and its descendants in preorder (i.e.,
+        each concept comes before its children).
+
+        The traversal is iterative, so it works on trees of any depth. The
+        tree should not be modified during the traversal.
+
+        >>> tree = CobwebTree()
+        >>> tree.fit([{'a': 'x'}, {'a': 'y'}], randomize_first=False)
+        >>> [len(node.children) for node in tree.root.preorder()]
+        [2, 0, 0]
+        >>> [len(node.children) for node in tree.root.postorder()]
+        [0, 0, 2]
+        >>> len(list(tree.leaves()))
+        2
+
+        :return: an iterator over the concepts
+        :rtype: iterator
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def postorder(self):
+        """
+        Iterates over this concept and its descendants in postorder (i.e.,
+        each concept comes after its children).
+
+        :return: an iterator over the concepts
+        :rtype: iterator
+        """
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                yield node
+            else:
+                stack.append((node, True))
+                stack.extend((c, False) for c in reversed(node.children))
+
+    def level_order(self):
+        """
+        Iterates over this concept and its descendants in level order (i.e.,
+        breadth first).
+
+        :return: an iterator over the concepts
+        :rtype: iterator
+        """
+        queue = deque([self])
+        while queue:
+            node = queue.popleft()
+            yield node
+            queue.extend(node.children)
+
+    def leaves(self):
+        """
+        Iterates over the leaves below this concept, from left to right.
+
+        :return: an iterator over the leaf concepts
+        :rtype: iterator
+        """
+        for node in self.preorder():
+            if not node.children:
+                yield node
+
+    def _update_size(self, delta):
+        """
+        Adds delta to the cached subtree size of this concept and of all of
+        its ancestors.
+        """
+        node = self
+        while node is not None:
+            node._size += delta
+            node = node.parent
 
     def depth(self):
         """
         Returns the depth of the current node in its tree
 
+        Depths are cached and the caches are invalidated whenever concepts are
+        moved within the tree (i.e., by merges and splits), so repeated calls
+        only walk up to the nearest ancestor with a valid cached depth.
+
         :return: the depth of the current node in its tree
         :rtype: int
         """
+        version = None if self.tree is None else self.tree._structure_version
+
+        path = []
+        node = self
+        depth = -1
+        while node is not None:
+            if version is not None and node._depth_version == version:
+                depth = node._depth
+                break
+            path.append(node)
+            node = node.parent
+
+        for node in reversed(path):
+            depth += 1
+            if version is not None:
+                node._depth = depth
+                node._depth_version = version
 
-        if self.parent:
-            return 1 + self.parent.depth()
-        return 0
+        return depth
 
     def is_parent(self, other_concept):
         """
@@ -897,16 +1694,22 @@ class CobwebNode(object):
                  ``False``
         :rtype: bool
         """
-        
+        if self.tree is not None and other_concept.tree is self.tree:
+            steps = other_concept.depth() - self.depth()
+            if steps < 0:
+                return False
+        else:
+            steps = None
+
         temp = other_concept
-        while temp != None:
+        while temp is not None:
             if temp == self:
                 return True
-            try:
-                temp = temp.parent
-            except:
-                print(temp)
-                assert False
+            if steps is not None:
+                if steps == 0:
+                    return False
+                steps -= 1
+            temp = temp.parent
         return False
 
     def num_concepts(self):
@@ -915,42 +1718,59 @@ class CobwebNode(object):
         tree.
 
         When called on the :attr:`CobwebTree.root` this is the number of nodes
-        in the whole tree.
+        in the whole tree. The size of each subtree is cached, so this is a
+        constant time operation.
 
         :return: the number of concepts below this concept.
         :rtype: int
         """
-        
-        children_count = 0
-        for c in self.children:
-           children_count += c.num_concepts() 
-        return 1 + children_count 
+        return self._size
 
     def output_json(self):
         """
         Outputs the categorization tree in JSON form
 
+        The tree is traversed iteratively, so this works on trees of any
+        depth. For very large trees it is better to stream the JSON to a file
+        using :func:`export_json
+        <concept_formation.visualize.export_json>`, which never holds the
+        whole object in memory.
+
         :return: an object that contains all of the structural information of
                  the node and its children
         :rtype: obj
         """
+        output = self._json_fields()
+        output['children'] = []
+        stack = [(self, output)]
+
+        while stack:
+            node, node_output = stack.pop()
+            for child in node.children:
+                child_output = child._json_fields()
+                child_output['children'] = []
+                node_output['children'].append(child_output)
+                stack.append((child, child_output))
+
+        return output
+
+    def _json_fields(self):
+        """
+        Returns the JSON description of this node, without its children.
 
+        :return: the name, size, and attribute value counts of the node
+        :rtype: dict
+        """
         output = {}
         output['name'] = "Concept" + self.concept_id
         output['size'] = self.count
-        output['children'] = []
 
         temp = {}
         for attr in self.attrs('all'):
-            for value in self.av_counts[attr]:
-                temp[str(attr)] = {str(value):self.av_counts[attr][value] for value in self.av_counts[attr]}
-                #temp[attr + " = " + str(value)] = self.av_counts[attr][value]
-
-        for child in self.children:
-            output["children"].append(child.output_json())
+            temp[str(attr)] = {str(value): self.av_counts[attr][value] for
+                               value in self.av_counts[attr]}
 
         output['counts'] = temp
-
         return output
 
     def get_weighted_values(self, attr, allow_none=True):
@@ -980,8 +1800,10 @@ class CobwebNode(object):
         val_count = 0
         for val in self.av_counts[attr]:
             count = self.av_counts[attr][val]
-            choices.append((val, count / self.count))
             val_count += count
+            if val == other_key:
+                continue
+            choices.append((val, count / self.count))
 
         if allow_none:
             choices.append((None, ((self.count - val_count) / self.count)))
@@ -1007,19 +1829,94 @@ class CobwebNode(object):
         :rtype: :ref:`Value<values>`
         """
         if choice_fn == "most likely" or choice_fn == "m":
-            choose = most_likely_choice
+            most_likely = True
         elif choice_fn == "sampled" or choice_fn == "s":
-            choose = weighted_choice
+            most_likely = False
         else:
             raise Exception("Unknown choice_fn")
 
         if attr not in self.av_counts:
             return None
 
-        choices = self.get_weighted_values(attr, allow_none)
-        val = choose(choices)
+        table = self._choice_table(attr, allow_none)
+        if most_likely:
+            return table.most_likely()
+        return table.sample()
+
+    def _choice_table(self, attr, allow_none=True):
+        """
+        Returns an :class:`AliasTable <concept_formation.utils.AliasTable>`
+        over the weighted values of an attribute (see
+        :meth:`CobwebNode.get_weighted_values`). The tables are cached on the
+        node and rebuilt after its counts change, so repeated predictions from
+        the same concept do not rescan or sort its probability table.
+        """
+        if (self._choice_tables is None or
+                self._choice_tables[0] != self._counts_version):
+            self._choice_tables = (self._counts_version, {})
+
+        tables = self._choice_tables[1]
+        key = (attr, allow_none)
+        if key not in tables:
+            tables[key] = AliasTable(self.get_weighted_values(attr,
+                                                              allow_none))
+        return tables[key]
+
+    def _sampled_value(self, attr, val):
+        """
+        Converts a value sampled from an attribute's choice table into the
+        value of a sampled instance. Overridden by subclasses that store
+        values that are distributions (e.g., continuous values).
+        """
         return val
 
+    def sample_instances(self, n, allow_none=True, attr_filter='all',
+                         chunk_size=1000):
+        """
+        Yields n instances sampled from the node's probability table. Each
+        attribute is sampled independently, as in
+        :meth:`CobwebNode.predict` with the "sampled" choice function, but the
+        choice tables are only built once and the values are drawn a column
+        (attribute) at a time in chunks, which is much faster than repeatedly
+        calling predict.
+
+        >>> from random import seed
+        >>> seed(0)
+        >>> from concept_formation.cobweb import CobwebTree
+        >>> tree = CobwebTree()
+        >>> tree.fit([{'a': 'x'}, {'a': 'x'}, {'b': 'y'}])
+        >>> samples = list(tree.root.sample_instances(100))
+        >>> len(samples)
+        100
+        >>> sorted(set(v for s in samples for v in s.values()))
+        ['x', 'y']
+
+        :param n: the number of instances to sample.
+        :type n: int
+        :param allow_none: whether attributes can be sampled as missing. If
+            False, then every attribute will be sampled with some value.
+        :type allow_none: Boolean
+        :param attr_filter: a filter for the attributes to sample (see
+            :meth:`CobwebNode.attrs`), by default all attributes are sampled.
+        :param chunk_size: the number of instances to sample at a time.
+        :type chunk_size: int
+        :return: a generator of sampled instances
+        :rtype: a generator of :ref:`Instances<instance-rep>`
+        """
+        tables = [(attr, self._choice_table(attr, allow_none))
+                  for attr in self.attrs(attr_filter)]
+
+        while n > 0:
+            size = min(n, chunk_size)
+            n -= size
+            instances = [{} for i in range(size)]
+            for attr, table in tables:
+                for instance, val in zip(instances, table.samples(size)):
+                    if val is not None:
+                        instance[attr] = self._sampled_value(attr, val)
+            for instance in instances:
+                yield instance
+
     def probability(self, attr, val):
         """
         Returns the probability of a particular attribute value at the current
@@ -1046,6 +1943,12 @@ class CobwebNode(object):
         if attr in self.av_counts and val in self.av_counts[attr]:
             return self.av_counts[attr][val] / self.count
 
+        # values that were folded into the other value are given the
+        # average probability of the folded values.
+        if attr in self.av_counts and other_key in self.av_counts[attr]:
+            return (self._other_sq_sum(attr) /
+                    self.av_counts[attr][other_key] / self.count)
+
         return 0.0
 
     def log_likelihood(self, other):
@@ -1072,3 +1975,341 @@ class CobwebNode(object):
                         raise Exception("Should always be greater than 0")
                         
         return ll
+
+
+def _scaled_guesses(sq_sum, count, num_attrs):
+    """
+    Returns a concept's count times its expected correct guesses, given the
+    sum of its squared value counts, its count and its number of attributes.
+    A concept without any (non-hidden) attributes has nothing to guess.
+    """
+    if num_attrs == 0:
+        return 0.0
+    return sq_sum / (count * num_attrs)
+
+
+class SparseCobwebNode(CobwebNode):
+    """
+    A SparseCobwebNode is a :class:`CobwebNode` that is used by a
+    :class:`CobwebTree` in sparse mode. It is intended for high dimensional
+    nominal data, such as bag-of-words instances, where each instance only
+    has a handful of the many attributes that the tree has seen.
+
+    Alongside its probability table, each node maintains the sum of the
+    squared counts of its attribute values and the number of attributes it
+    has seen. These aggregates give the node's
+    :meth:`expected_correct_guesses` in constant time, and they let the
+    category utility of each operation be computed from the instance's
+    attributes alone, without copying any nodes. As a result the cost of
+    sorting an instance into the tree grows with the size of the instance
+    rather than with the number of attributes in the tree (merging two
+    concepts still touches the attributes of the smaller concept).
+
+    Because the aggregates are sums, the category utilities can differ from
+    those of a :class:`CobwebNode` by floating point error, so exact ties may
+    be broken differently.
+
+    >>> tree = CobwebTree(sparse=True)
+    >>> tree.fit([{'w1': True, 'w2': True}, {'w3': True}, {'w1': True}],
+    ...          randomize_first=False)
+    >>> tree.root.__class__.__name__
+    'SparseCobwebNode'
+    >>> print(round(tree.root.expected_correct_guesses(), 4))
+    0.2222
+    """
+
+    def __init__(self, otherNode=None):
+        self._sq_sum = 0.0
+        self._num_attrs = 0
+        super(SparseCobwebNode, self).__init__(otherNode)
+
+    def increment_counts(self, instance):
+        """
+        Increment the counts at the current node according to the specified
+        instance, maintaining the node's aggregates.
+
+        :param instance: A new instances to incorporate into the node.
+        :type instance: :ref:`Instance<instance-rep>`
+        """
+        weight = 1 if self.tree is None else self.tree.instance_weight
+        self._counts_version += 1
+        self.count += weight
+        for attr in instance:
+            counts = self.av_counts.setdefault(attr, {})
+            prior = counts.get(instance[attr], 0)
+            if attr[0] != '_':
+                if not counts:
+                    self._num_attrs += 1
+                self._sq_sum += weight * (2 * prior + weight)
+            counts[instance[attr]] = prior + weight
+
+    def rescale_counts(self, factor):
+        """
+        Multiply all of the counts in the node's probability table by the
+        given factor and recompute the node's aggregates.
+
+        :param factor: The amount to multiply the counts by
+        :type factor: float
+        """
+        super(SparseCobwebNode, self).rescale_counts(factor)
+        self._sq_sum = 0.0
+        self._num_attrs = 0
+        for attr in self.attrs():
+            if self.av_counts[attr]:
+                self._num_attrs += 1
+            for val in self.av_counts[attr]:
+                self._sq_sum += self.av_counts[attr][val] ** 2
+
+    def _reset_counts(self):
+        """
+        Empties the node's probability table and aggregates.
+        """
+        super(SparseCobwebNode, self)._reset_counts()
+        self._sq_sum = 0.0
+        self._num_attrs = 0
+
+    def update_counts_from_node(self, node):
+        """
+        Increments the counts of the current node by the amount in the
+        specified node, maintaining the node's aggregates.
+
+        :param node: Another node from the same CobwebTree
+        :type node: CobwebNode
+        """
+        self._counts_version += 1
+        self.count += node.count
+        for attr in node.attrs('all'):
+            if not node.av_counts[attr]:
+                continue
+            counts = self.av_counts.setdefault(attr, {})
+            hidden = attr[0] == '_'
+            if not hidden and not counts:
+                self._num_attrs += 1
+            for val in node.av_counts[attr]:
+                prior = counts.get(val, 0)
+                count = node.av_counts[attr][val]
+                counts[val] = prior + count
+                if not hidden:
+                    self._sq_sum += count * (2 * prior + count)
+
+    def expected_correct_guesses(self):
+        """
+        Returns the number of correct guesses that are expected from the given
+        concept, computed from the node's aggregates.
+
+        :return: the number of correct guesses that are expected from the given
+                 concept.
+        :rtype: float
+        """
+        if self._num_attrs == 0:
+            return 0.0
+        return self._sq_sum / (self.count * self.count) / self._num_attrs
+
+    def is_exact_match(self, instance):
+        """
+        Returns true if the concept exactly matches the instance, only
+        checking the attributes of the instance.
+
+        :param instance: The instance currently being categorized
+        :type instance: :ref:`Instance<instance-rep>`
+        :return: whether the instance perfectly matches the concept
+        :rtype: boolean
+        """
+        num_attrs = 0
+        for attr in instance:
+            if attr[0] == '_':
+                continue
+            num_attrs += 1
+            if attr not in self.av_counts:
+                return False
+            if instance[attr] not in self.av_counts[attr]:
+                return False
+            if not self.av_counts[attr][instance[attr]] == self.count:
+                return False
+        return num_attrs == self._num_attrs
+
+    def log_likelihood(self, other):
+        """
+        Returns the log-likelihood of the concept. Only the attribute values
+        of the other concept contribute to the likelihood, so only they are
+        visited.
+        """
+        ll = 0
+
+        for attr in other.attrs():
+            for val in other.av_counts[attr]:
+                op = other.probability(attr, val)
+                if op > 0:
+                    p = self.probability(attr, val) * op
+                    if p >= 0:
+                        ll += log(p)
+                    else:
+                        raise Exception("Should always be greater than 0")
+
+        return ll
+
+    def _guesses(self):
+        """
+        Returns the node's count times its expected correct guesses, which is
+        its contribution to the category utility of its parent.
+        """
+        return _scaled_guesses(self._sq_sum, self.count, self._num_attrs)
+
+    def _stats_with(self, instance, weight):
+        """
+        Returns the count, sum of squared counts and number of attributes that
+        the node would have if the instance were added to it, without
+        modifying the node.
+        """
+        sq_sum = self._sq_sum
+        num_attrs = self._num_attrs
+        for attr in instance:
+            if attr[0] == '_':
+                continue
+            counts = self.av_counts.get(attr)
+            if counts:
+                prior = counts.get(instance[attr], 0)
+            else:
+                prior = 0
+                num_attrs += 1
+            sq_sum += weight * (2 * prior + weight)
+        return self.count + weight, sq_sum, num_attrs
+
+    def _partition_cu(self, guesses, count, sq_sum, num_attrs, num_children):
+        """
+        Returns the category utility of a partition of a concept with the
+        given statistics into children whose guesses sum to the given value.
+        """
+        if self.tree is not None and self.tree.instrumentation is not None:
+            self.tree.instrumentation.incr('cu_evaluations')
+        parent_guesses = 0.0
+        if num_attrs > 0:
+            parent_guesses = sq_sum / (count * count * num_attrs)
+        return (guesses / count - parent_guesses) / num_children
+
+    def _children_guesses(self):
+        return sum(child._guesses() for child in self.children)
+
+    def _instance_weight(self):
+        return 1 if self.tree is None else self.tree.instance_weight
+
+    def two_best_children(self, instance):
+        """
+        Calculates the category utility of inserting the instance into each of
+        this node's children and returns the best two, with ties broken in the
+        same way as :meth:`CobwebNode.two_best_children`.
+
+        :param instance: The instance currently being categorized
+        :type instance: :ref:`Instance<instance-rep>`
+        :return: the category utility and indices for the two best children (the
+            second tuple will be ``None`` if there is only 1 child).
+        :rtype: ((cu_best1,index_best1),(cu_best2,index_best2))
+        """
+        if len(self.children) == 0:
+            raise Exception("No children!")
+
+        weight = self._instance_weight()
+        count, sq_sum, num_attrs = self._stats_with(instance, weight)
+        total = self._children_guesses()
+        n = len(self.children)
+
+        children_cu = []
+        for child in self.children:
+            c_count, c_sq_sum, c_num_attrs = child._stats_with(instance,
+                                                               weight)
+            guesses = (total - child._guesses() +
+                       _scaled_guesses(c_sq_sum, c_count, c_num_attrs))
+            children_cu.append((self._partition_cu(guesses, count, sq_sum,
+                                                   num_attrs, n),
+                                child.count, random(), child))
+        children_cu.sort(reverse=True)
+
+        if len(children_cu) == 1:
+            return (children_cu[0][0], children_cu[0][3]), None
+
+        return ((children_cu[0][0], children_cu[0][3]), (children_cu[1][0],
+                                                         children_cu[1][3]))
+
+    def cu_for_insert(self, child, instance):
+        """
+        Compute the category utility of adding the instance to the specified
+        child, using the nodes' aggregates.
+        """
+        weight = self._instance_weight()
+        count, sq_sum, num_attrs = self._stats_with(instance, weight)
+        c_count, c_sq_sum, c_num_attrs = child._stats_with(instance, weight)
+        guesses = (self._children_guesses() - child._guesses() +
+                   _scaled_guesses(c_sq_sum, c_count, c_num_attrs))
+        return self._partition_cu(guesses, count, sq_sum, num_attrs,
+                                  len(self.children))
+
+    def cu_for_new_child(self, instance):
+        """
+        Return the category utility for creating a new child using the
+        particular instance, using the nodes' aggregates.
+        """
+        weight = self._instance_weight()
+        count, sq_sum, num_attrs = self._stats_with(instance, weight)
+        new_attrs = len([attr for attr in instance if attr[0] != '_'])
+        guesses = (self._children_guesses() +
+                   _scaled_guesses(new_attrs * weight * weight, weight,
+                                   new_attrs))
+        return self._partition_cu(guesses, count, sq_sum, num_attrs,
+                                  len(self.children) + 1)
+
+    def cu_for_merge(self, best1, best2, instance):
+        """
+        Returns the category utility for merging the two best children, using
+        the nodes' aggregates. Only the attributes of the smaller of the two
+        children are visited.
+        """
+        weight = self._instance_weight()
+        count, sq_sum, num_attrs = self._stats_with(instance, weight)
+
+        small, large = best1, best2
+        if len(small.av_counts) > len(large.av_counts):
+            small, large = large, small
+
+        m_sq_sum = small._sq_sum + large._sq_sum
+        m_num_attrs = small._num_attrs + large._num_attrs
+        for attr in small.attrs():
+            if not large.av_counts.get(attr) or not small.av_counts[attr]:
+                continue
+            m_num_attrs -= 1
+            for val in small.av_counts[attr]:
+                if val in large.av_counts[attr]:
+                    m_sq_sum += (2 * small.av_counts[attr][val] *
+                                 large.av_counts[attr][val])
+
+        for attr in instance:
+            if attr[0] == '_':
+                continue
+            prior = 0
+            present = False
+            for node in (small, large):
+                counts = node.av_counts.get(attr)
+                if counts:
+                    present = True
+                    prior += counts.get(instance[attr], 0)
+            if not present:
+                m_num_attrs += 1
+            m_sq_sum += weight * (2 * prior + weight)
+
+        m_count = best1.count + best2.count + weight
+        guesses = (self._children_guesses() - best1._guesses() -
+                   best2._guesses() +
+                   _scaled_guesses(m_sq_sum, m_count, m_num_attrs))
+        return self._partition_cu(guesses, count, sq_sum, num_attrs,
+                                  len(self.children) - 1)
+
+    def cu_for_split(self, best):
+        """
+        Return the category utility for splitting the best child, using the
+        nodes' aggregates.
+        """
+        guesses = (self._children_guesses() - best._guesses() +
+                   best._children_guesses())
+        return self._partition_cu(guesses, self.count, self._sq_sum,
+                                  self._num_attrs,
+                                  len(self.children) - 1 +
+                                  len(best.children))
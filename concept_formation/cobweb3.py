@@ -18,8 +18,6 @@ from concept_formation.cobweb import CobwebNode
 from concept_formation.cobweb import CobwebTree
 from concept_formation.continuous_value import ContinuousValue
 from concept_formation.utils import isNumber
-from concept_formation.utils import weighted_choice
-from concept_formation.utils import most_likely_choice
 
 cv_key = "#ContinuousValue#"
 
@@ -54,17 +52,31 @@ class Cobweb3Tree(CobwebTree):
         inner most attributes, some objects might have multiple attributes
         (i.e., 'attr' for different objects) that contribute to the scaling.
     :param inner_attr_scaling: boolean
+    :param decay: The factor to multiply old counts by after each instance
+        (see: :class:`CobwebTree <concept_formation.cobweb.CobwebTree>`). By
+        default no decay is applied.
+    :type decay: a float in (0, 1] or None
+    :param prune_threshold: The effective count below which concepts are
+        pruned. By default nothing is pruned.
+    :type prune_threshold: float or None
+    :param operator_policy: A policy that limits when the merge and split
+        operations are entertained (see: :class:`CobwebTree
+        <concept_formation.cobweb.CobwebTree>`). By default every operation is
+        entertained.
+    :type operator_policy: :class:`OperatorPolicy
+        <concept_formation.operator_policy.OperatorPolicy>` or None
     """
 
-    def __init__(self, scaling=0.5, inner_attr_scaling=True):
+    def __init__(self, scaling=0.5, inner_attr_scaling=True, decay=None,
+                 prune_threshold=None, operator_policy=None):
         """
         The tree constructor.
         """
-        self.root = Cobweb3Node()
-        self.root.tree = self
         self.scaling = scaling
         self.inner_attr_scaling = inner_attr_scaling
-        self.attr_scales = {}
+        super(Cobweb3Tree, self).__init__(decay=decay,
+                                          prune_threshold=prune_threshold,
+                                          operator_policy=operator_policy)
 
     def clear(self):
         """
@@ -73,6 +85,8 @@ class Cobweb3Tree(CobwebTree):
         self.root = Cobweb3Node()
         self.root.tree = self
         self.attr_scales = {}
+        self.instance_weight = 1
+        self._invalidate_categorize_cache()
 
     def get_inner_attr(self, attr):
         """
@@ -101,7 +115,19 @@ class Cobweb3Tree(CobwebTree):
                 inner_attr = self.get_inner_attr(attr)
                 if inner_attr not in self.attr_scales:
                     self.attr_scales[inner_attr] = ContinuousValue()
-                self.attr_scales[inner_attr].update(instance[attr])
+                self.attr_scales[inner_attr].update(instance[attr],
+                                                    self.instance_weight)
+
+    def renormalize(self):
+        """
+        A modification of :meth:`CobwebTree.renormalize
+        <concept_formation.cobweb.CobwebTree.renormalize>` that also rescales
+        the attribute scales, so they decay along with the concepts.
+        """
+        factor = 1.0 / self.instance_weight
+        for inner_attr in self.attr_scales:
+            self.attr_scales[inner_attr].rescale(factor)
+        super(Cobweb3Tree, self).renormalize()
 
     def cobweb(self, instance):
         """
@@ -166,7 +192,9 @@ class Cobweb3Node(CobwebNode):
         :type instance: :ref:`Instance<instance-rep>`
 
         """
-        self.count += 1 
+        weight = 1 if self.tree is None else self.tree.instance_weight
+        self._counts_version += 1
+        self.count += weight
             
         for attr in instance:
             self.av_counts[attr] = self.av_counts.setdefault(attr,{})
@@ -174,10 +202,28 @@ class Cobweb3Node(CobwebNode):
             if isNumber(instance[attr]):
                 if cv_key not in self.av_counts[attr]:
                     self.av_counts[attr][cv_key] = ContinuousValue()
-                self.av_counts[attr][cv_key].update(instance[attr])
+                self.av_counts[attr][cv_key].update(instance[attr], weight)
             else:
                 prior_count = self.av_counts[attr].get(instance[attr], 0)
-                self.av_counts[attr][instance[attr]] = prior_count + 1
+                self.av_counts[attr][instance[attr]] = prior_count + weight
+
+    def rescale_counts(self, factor):
+        """
+        Multiply all of the counts in the node's probability table by the
+        given factor, modified to handle numbers. Continuous values are
+        rescaled so that their means and stds are unchanged.
+
+        :param factor: The amount to multiply the counts by
+        :type factor: float
+        """
+        self._counts_version += 1
+        self.count *= factor
+        for attr in self.av_counts:
+            for val in self.av_counts[attr]:
+                if val == cv_key:
+                    self.av_counts[attr][val].rescale(factor)
+                else:
+                    self.av_counts[attr][val] *= factor
 
     def update_counts_from_node(self, node):
         """
@@ -193,6 +239,7 @@ class Cobweb3Node(CobwebNode):
         :param node: Another node from the same Cobweb3Tree
         :type node: Cobweb3Node
         """
+        self._counts_version += 1
         self.count += node.count
         for attr in node.attrs('all'):
             self.av_counts[attr] = self.av_counts.setdefault(attr, {})
@@ -254,44 +301,64 @@ class Cobweb3Node(CobwebNode):
 
         for attr in self.attrs():
             attr_count += 1
-
-            for val in self.av_counts[attr]:
-                if val == cv_key:
-                    scale = 1.0
-                    if self.tree is not None and self.tree.scaling:
-                        inner_attr = self.tree.get_inner_attr(attr)
-                        if inner_attr in self.tree.attr_scales:
-                            scale = ((1/self.tree.scaling) *
-                                     self.tree.attr_scales[inner_attr].unbiased_std())
-
-                    # we basically add noise to the std and adjust the
-                    # normalizing constant to ensure the probability of a
-                    # particular value never exceeds 1.
-                    cv = self.av_counts[attr][cv_key]
-                    std = sqrt(cv.scaled_unbiased_std(scale) *
-                               cv.scaled_unbiased_std(scale) +
-                               (1 / (4 * pi)))
-                    prob_attr = cv.num / self.count
-                    correct_guesses += ((prob_attr * prob_attr) * 
-                                        (1/(2 * sqrt(pi) * std)))
-                else:
-                    prob = (self.av_counts[attr][val]) / self.count
-                    correct_guesses += (prob * prob)
+            correct_guesses = self.attr_correct_guesses(attr,
+                                                        self.av_counts[attr],
+                                                        self.count,
+                                                        correct_guesses)
 
         return correct_guesses / attr_count
 
-    def pretty_print(self, depth=0):
+    def attr_correct_guesses(self, attr, values, count, correct_guesses=0.0):
         """
-        Print the categorization tree
+        Adds the number of values of a single attribute that would be correctly
+        guessed (see: :meth:`Cobweb3Node.expected_correct_guesses`) to
+        correct_guesses and returns the result. The attribute's values and the
+        count are passed in, so that the guesses of hypothetical combinations
+        of concepts (e.g., during structure mapping) can be computed without
+        building them.
 
-        The string formatting inserts tab characters to align child nodes of the
-        same depth. Numerical values are printed with their means and standard
-        deviations.
-        
-        :param depth: The current depth in the print, intended to be called recursively
-        :type depth: int
-        :return: a formated string displaying the tree and its children
-        :rtype: str
+        :param attr: an attribute
+        :type attr: :ref:`Attribute<attributes>`
+        :param values: the attribute's value table
+        :type values: dict
+        :param count: the count of the concept
+        :type count: float
+        :param correct_guesses: the running total to add to
+        :type correct_guesses: float
+        :return: the updated total of correct guesses
+        :rtype: float
+        """
+        for val in values:
+            if val == cv_key:
+                scale = 1.0
+                if self.tree is not None and self.tree.scaling:
+                    inner_attr = self.tree.get_inner_attr(attr)
+                    if inner_attr in self.tree.attr_scales:
+                        scale = ((1/self.tree.scaling) *
+                                 self.tree.attr_scales[inner_attr].unbiased_std())
+
+                # we basically add noise to the std and adjust the
+                # normalizing constant to ensure the probability of a
+                # particular value never exceeds 1.
+                cv = values[cv_key]
+                std = sqrt(cv.scaled_unbiased_std(scale) *
+                           cv.scaled_unbiased_std(scale) +
+                           (1 / (4 * pi)))
+                prob_attr = cv.num / count
+                correct_guesses += ((prob_attr * prob_attr) * 
+                                    (1/(2 * sqrt(pi) * std)))
+            else:
+                prob = values[val] / count
+                correct_guesses += (prob * prob)
+
+        return correct_guesses
+
+    def _pretty_print_line(self, depth):
+        """
+        Returns the line describing this concept (without its children) in
+        :meth:`CobwebNode.pretty_print
+        <concept_formation.cobweb.CobwebNode.pretty_print>`. Numerical values
+        are printed with their means and standard deviations.
         """
         ret = str(('\t' * depth) + "|-")
 
@@ -307,10 +374,6 @@ class Cobweb3Node(CobwebNode):
                               + "}")
                   
         ret += "{" + ", ".join(attributes) + "}: " + str(self.count) + '\n'
-        
-        for c in self.children:
-            ret += c.pretty_print(depth+1)
-
         return ret
 
     def get_weighted_values(self, attr, allow_none=True):
@@ -373,29 +436,36 @@ class Cobweb3Node(CobwebNode):
         .. seealso :meth:`Cobweb3Node.sample`
         """
         if choice_fn == "most likely" or choice_fn == "m":
-            choose = most_likely_choice
+            most_likely = True
         elif choice_fn == "sampled" or choice_fn == "s":
-            choose = weighted_choice
+            most_likely = False
         else:
             raise Exception("Unknown choice_fn")
 
         if attr not in self.av_counts:
             return None
 
-        choices = self.get_weighted_values(attr, allow_none)
-        val = choose(choices)
-
-        if val == cv_key:
-            if choice_fn == "most likely" or choice_fn == "m":
+        table = self._choice_table(attr, allow_none)
+        if most_likely:
+            val = table.most_likely()
+            if val == cv_key:
                 val = self.av_counts[attr][val].mean
-            elif choice_fn == "sampled" or choice_fn == "s":
-                val = normalvariate(self.av_counts[attr][val].unbiased_mean(),
-                                    self.av_counts[attr][val].unbiased_std())
-            else:
-                raise Exception("Unknown choice_fn")
+        else:
+            val = self._sampled_value(attr, table.sample())
 
         return val
 
+    def _sampled_value(self, attr, val):
+        """
+        Numeric values are sampled from the normal distribution described by
+        the attribute's :class:`ContinuousValue
+        <concept_formation.continuous_value.ContinuousValue>`.
+        """
+        if val == cv_key:
+            return normalvariate(self.av_counts[attr][val].unbiased_mean(),
+                                 self.av_counts[attr][val].unbiased_std())
+        return val
+
     def probability(self, attr, val):
         """
         Returns the probability of a particular attribute value at the current
@@ -530,17 +600,16 @@ class Cobweb3Node(CobwebNode):
                     return False
         return True
 
-    def output_json(self):
+    def _json_fields(self):
         """
-        Outputs the categorization tree in JSON form. 
+        Returns the JSON description of this node, without its children.
 
-        This is a modification of the :meth:`CobwebNode.output_json
-        <concept_formation.cobweb.CobwebNode.output_json>` to handle numeric
-        values.
+        This is a modification of the :meth:`CobwebNode._json_fields
+        <concept_formation.cobweb.CobwebNode._json_fields>` to handle numeric
+        values and the guid of instances.
 
-        :return: an object that contains all of the structural information of
-            the node and its children
-        :rtype: obj
+        :return: the name, size, and attribute value counts of the node
+        :rtype: dict
         """
         output = {}
         if "_guid" in self.av_counts:
@@ -548,7 +617,6 @@ class Cobweb3Node(CobwebNode):
                 output['guid'] = guid
         output["name"] = "Concept" + self.concept_id
         output["size"] = self.count
-        output["children"] = []
 
         temp = {}
         for attr in self.attrs('all'):
@@ -560,16 +628,6 @@ class Cobweb3Node(CobwebNode):
                 else:
                     temp[str(attr)][str(val)] = self.av_counts[attr][val]
 
-
-
-
-                # temp[str(attr)] = {str(value):str(self.av_counts[attr][value]) for
-                #                    value in self.av_counts[attr]}
-
-        for child in self.children:
-               output["children"].append(child.output_json())
-
         output["counts"] = temp
-
         return output
 
@@ -154,7 +154,7 @@ class ContinuousValue():
         for x in data:
             self.update(x)
 
-    def update(self, x):
+    def update(self, x, weight=1.0):
         """
         Incrementally update the mean and squared mean error (meanSq) values in
         an efficient and practical (no precision problems) way. 
@@ -162,13 +162,41 @@ class ContinuousValue():
         This uses and algorithm by Knuth found here:
         `<https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance>`_
 
+        A weight other than 1 can be provided to incorporate the value as if it
+        had been observed that many times, this uses the weighted
+        generalization of the algorithm by West (1979) and is used by trees
+        with decaying counts.
+
         :param x: A new value to incorporate into the distribution
         :type x: Number
+        :param weight: The weight (frequency) of the new value
+        :type weight: float
         """
-        self.num += 1
+        self.num += weight
         delta = x - self.mean 
-        self.mean += delta / self.num
-        self.meanSq += delta * (x - self.mean)
+        self.mean += delta * weight / self.num
+        self.meanSq += weight * delta * (x - self.mean)
+
+    def rescale(self, factor):
+        """
+        Multiply the weight of every value in the distribution by the given
+        factor, leaving the mean and std unchanged. This is used to apply decay
+        to the counts of a :class:`CobwebTree
+        <concept_formation.cobweb.CobwebTree>`.
+
+        >>> cv = ContinuousValue()
+        >>> cv.update_batch([1, 2, 3, 4])
+        >>> cv.rescale(0.5)
+        >>> cv.num
+        2.0
+        >>> cv.biased_std() == sqrt(1.25)
+        True
+
+        :param factor: The amount to multiply the weights by
+        :type factor: float
+        """
+        self.num *= factor
+        self.meanSq *= factor
 
     def combine(self, other):
         """
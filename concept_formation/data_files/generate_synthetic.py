@@ -0,0 +1,304 @@
+"""
+Seeded generators for synthetic datasets of arbitrary size. Each generator
+lazily yields instances drawn from a fixed number of clusters, so they can be
+used to produce millions of instances for scaling tests without holding them
+in memory. The cluster each instance was drawn from is included as the hidden
+``_cluster`` attribute.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from itertools import count
+from random import Random
+
+
+def _instance_range(num_instances):
+    """
+    Returns an iterator over the instance indices, which never ends when
+    num_instances is None.
+    """
+    if num_instances is None:
+        return count()
+    return range(num_instances)
+
+
+def _nominal_prototypes(rng, num_clusters, num_attrs, num_values):
+    return [[rng.randrange(num_values) for a in range(num_attrs)]
+            for c in range(num_clusters)]
+
+
+def _numeric_prototypes(rng, num_clusters, num_attrs, separation):
+    return [[rng.uniform(0, separation) for a in range(num_attrs)]
+            for c in range(num_clusters)]
+
+
+def _fill_nominal(rng, instance, names, values, prototype, noise, sparsity):
+    for attr, value in zip(names, prototype):
+        if sparsity and rng.random() < sparsity:
+            continue
+        if noise and rng.random() < noise:
+            value = rng.randrange(len(values))
+        instance[attr] = values[value]
+
+
+def _fill_numeric(rng, instance, names, prototype, std, sparsity):
+    for attr, center in zip(names, prototype):
+        if sparsity and rng.random() < sparsity:
+            continue
+        instance[attr] = rng.gauss(center, std)
+
+
+def generate_nominal(num_instances=None, num_attrs=10, num_values=5,
+                     num_clusters=4, noise=0.1, sparsity=0.0, seed=None):
+    """
+    Yields instances with nominal attributes ``a0``, ``a1``, ... that take the
+    values ``v0``, ``v1``, .... Each cluster has a prototypical value for every
+    attribute, which is replaced by a uniformly random value with probability
+    noise.
+
+    :param num_instances: The number of instances to generate, or None to
+        generate instances forever
+    :type num_instances: int or None
+    :param num_attrs: The number of attributes per instance
+    :type num_attrs: int
+    :param num_values: The number of values each attribute can take
+    :type num_values: int
+    :param num_clusters: The number of underlying clusters
+    :type num_clusters: int
+    :param noise: The probability that an attribute's value is random
+    :type noise: float
+    :param sparsity: The probability that an attribute is missing
+    :type sparsity: float
+    :param seed: The random seed
+    :type seed: int or None
+    """
+    rng = Random(seed)
+    names = ['a%i' % a for a in range(num_attrs)]
+    values = ['v%i' % v for v in range(num_values)]
+    prototypes = _nominal_prototypes(rng, num_clusters, num_attrs, num_values)
+
+    for i in _instance_range(num_instances):
+        cluster = rng.randrange(num_clusters)
+        instance = {'_cluster': 'c%i' % cluster}
+        _fill_nominal(rng, instance, names, values, prototypes[cluster],
+                      noise, sparsity)
+        yield instance
+
+
+def generate_numeric(num_instances=None, num_attrs=4, num_clusters=4,
+                     separation=10.0, std=1.0, sparsity=0.0, seed=None):
+    """
+    Yields instances with numeric attributes ``n0``, ``n1``, ... drawn from a
+    normal distribution around their cluster's center. The cluster centers are
+    drawn uniformly from [0, separation] on each attribute.
+
+    :param num_instances: The number of instances to generate, or None to
+        generate instances forever
+    :type num_instances: int or None
+    :param num_attrs: The number of attributes per instance
+    :type num_attrs: int
+    :param num_clusters: The number of underlying clusters
+    :type num_clusters: int
+    :param separation: The range the cluster centers are drawn from
+    :type separation: float
+    :param std: The standard deviation of the values around their center
+    :type std: float
+    :param sparsity: The probability that an attribute is missing
+    :type sparsity: float
+    :param seed: The random seed
+    :type seed: int or None
+    """
+    rng = Random(seed)
+    names = ['n%i' % a for a in range(num_attrs)]
+    prototypes = _numeric_prototypes(rng, num_clusters, num_attrs, separation)
+
+    for i in _instance_range(num_instances):
+        cluster = rng.randrange(num_clusters)
+        instance = {'_cluster': 'c%i' % cluster}
+        _fill_numeric(rng, instance, names, prototypes[cluster], std,
+                      sparsity)
+        yield instance
+
+
+def generate_mixed(num_instances=None, num_nominal=5, num_numeric=5,
+                   num_values=5, num_clusters=4, noise=0.1, separation=10.0,
+                   std=1.0, sparsity=0.0, seed=None):
+    """
+    Yields instances with both the nominal attributes of
+    :func:`generate_nominal` and the numeric attributes of
+    :func:`generate_numeric`, drawn from the same clusters.
+
+    :param num_instances: The number of instances to generate, or None to
+        generate instances forever
+    :type num_instances: int or None
+    :param num_nominal: The number of nominal attributes per instance
+    :type num_nominal: int
+    :param num_numeric: The number of numeric attributes per instance
+    :type num_numeric: int
+    :param num_values: The number of values each nominal attribute can take
+    :type num_values: int
+    :param num_clusters: The number of underlying clusters
+    :type num_clusters: int
+    :param noise: The probability that a nominal attribute's value is random
+    :type noise: float
+    :param separation: The range the numeric cluster centers are drawn from
+    :type separation: float
+    :param std: The standard deviation of the numeric values around their
+        center
+    :type std: float
+    :param sparsity: The probability that an attribute is missing
+    :type sparsity: float
+    :param seed: The random seed
+    :type seed: int or None
+    """
+    rng = Random(seed)
+    nominal_names = ['a%i' % a for a in range(num_nominal)]
+    numeric_names = ['n%i' % a for a in range(num_numeric)]
+    values = ['v%i' % v for v in range(num_values)]
+    nominal_prototypes = _nominal_prototypes(rng, num_clusters, num_nominal,
+                                             num_values)
+    numeric_prototypes = _numeric_prototypes(rng, num_clusters, num_numeric,
+                                             separation)
+
+    for i in _instance_range(num_instances):
+        cluster = rng.randrange(num_clusters)
+        instance = {'_cluster': 'c%i' % cluster}
+        _fill_nominal(rng, instance, nominal_names, values,
+                      nominal_prototypes[cluster], noise, sparsity)
+        _fill_numeric(rng, instance, numeric_names,
+                      numeric_prototypes[cluster], std, sparsity)
+        yield instance
+
+
+def generate_sparse(num_instances=None, vocabulary_size=50000,
+                    words_per_instance=10, topic_size=100, num_clusters=10,
+                    noise=0.1, seed=None):
+    """
+    Yields sparse bag-of-words style instances. Each instance contains a
+    handful of the word attributes ``w0``, ``w1``, ... out of a large
+    vocabulary, with the value ``True``. Each cluster has a topic of
+    topic_size words that its instances draw their words from, and each word
+    is instead drawn uniformly from the whole vocabulary with probability
+    noise.
+
+    :param num_instances: The number of instances to generate, or None to
+        generate instances forever
+    :type num_instances: int or None
+    :param vocabulary_size: The number of distinct word attributes
+    :type vocabulary_size: int
+    :param words_per_instance: The number of words drawn for each instance
+        (duplicate words are only included once)
+    :type words_per_instance: int
+    :param topic_size: The number of words in each cluster's topic
+    :type topic_size: int
+    :param num_clusters: The number of underlying clusters
+    :type num_clusters: int
+    :param noise: The probability that a word is drawn from the whole
+        vocabulary rather than the cluster's topic
+    :type noise: float
+    :param seed: The random seed
+    :type seed: int or None
+    """
+    rng = Random(seed)
+    topics = [[rng.randrange(vocabulary_size) for w in range(topic_size)]
+              for c in range(num_clusters)]
+
+    for i in _instance_range(num_instances):
+        cluster = rng.randrange(num_clusters)
+        instance = {'_cluster': 'c%i' % cluster}
+        for w in range(words_per_instance):
+            if noise and rng.random() < noise:
+                word = rng.randrange(vocabulary_size)
+            else:
+                word = rng.choice(topics[cluster])
+            instance['w%i' % word] = True
+        yield instance
+
+
+def generate_relational(num_instances=None, num_objects=4, num_nominal=2,
+                        num_numeric=2, num_values=5, num_clusters=4,
+                        num_relations=3, noise=0.1, separation=10.0, std=1.0,
+                        seed=None):
+    """
+    Yields instances made up of component objects and relations between them,
+    in the format expected by :class:`TrestleTree
+    <concept_formation.trestle.TrestleTree>`.
+
+    Each cluster has a prototype for each of its objects, made up of nominal
+    attributes (``a0``, ...) and numeric attributes (``n0``, ...), and a set
+    of binary relations (``r0``, ...) between its objects. The objects of each
+    instance are given shuffled variable names (``?o0``, ...), so a structure
+    mapping is needed to align them with the objects of other instances. Each
+    object's role in its cluster is included as the hidden ``_role``
+    attribute.
+
+    :param num_instances: The number of instances to generate, or None to
+        generate instances forever
+    :type num_instances: int or None
+    :param num_objects: The number of objects in each instance
+    :type num_objects: int
+    :param num_nominal: The number of nominal attributes per object
+    :type num_nominal: int
+    :param num_numeric: The number of numeric attributes per object
+    :type num_numeric: int
+    :param num_values: The number of values each nominal attribute can take
+    :type num_values: int
+    :param num_clusters: The number of underlying clusters
+    :type num_clusters: int
+    :param num_relations: The number of relations in each instance
+    :type num_relations: int
+    :param noise: The probability that a nominal attribute's value is random
+        or that a relation is replaced with a random relation
+    :type noise: float
+    :param separation: The range the numeric centers are drawn from
+    :type separation: float
+    :param std: The standard deviation of the numeric values around their
+        center
+    :type std: float
+    :param seed: The random seed
+    :type seed: int or None
+    """
+    if num_objects < 2 and num_relations > 0:
+        raise ValueError("Relations require at least two objects.")
+
+    rng = Random(seed)
+    nominal_names = ['a%i' % a for a in range(num_nominal)]
+    numeric_names = ['n%i' % a for a in range(num_numeric)]
+    values = ['v%i' % v for v in range(num_values)]
+    object_names = ['?o%i' % o for o in range(num_objects)]
+    relation_names = ['r%i' % r for r in range(num_relations)]
+
+    def random_relation():
+        o1, o2 = rng.sample(range(num_objects), 2)
+        return (rng.choice(relation_names), o1, o2)
+
+    prototypes = []
+    for c in range(num_clusters):
+        objects = [(_nominal_prototypes(rng, 1, num_nominal, num_values)[0],
+                    _numeric_prototypes(rng, 1, num_numeric, separation)[0])
+                   for o in range(num_objects)]
+        relations = [random_relation() for r in range(num_relations)]
+        prototypes.append((objects, relations))
+
+    for i in _instance_range(num_instances):
+        cluster = rng.randrange(num_clusters)
+        objects, relations = prototypes[cluster]
+        names = object_names[:]
+        rng.shuffle(names)
+
+        instance = {'_cluster': 'c%i' % cluster}
+        for role, (nominal, numeric) in enumerate(objects):
+            obj = {'_role': 'role%i' % role}
+            _fill_nominal(rng, obj, nominal_names, values, nominal, noise, 0.0)
+            _fill_numeric(rng, obj, numeric_names, numeric, std, 0.0)
+            instance[names[role]] = obj
+
+        for relation in relations:
+            if noise and rng.random() < noise:
+                relation = random_relation()
+            name, o1, o2 = relation
+            instance[(name, names[o1], names[o2])] = True
+
+        yield instance
@@ -12,6 +12,12 @@ from os.path import join
 import json
 
 from concept_formation.data_files.generate_quadruped import generate_animals
+from concept_formation.data_files.generate_synthetic import generate_nominal
+from concept_formation.data_files.generate_synthetic import generate_numeric
+from concept_formation.data_files.generate_synthetic import generate_mixed
+from concept_formation.data_files.generate_synthetic import \
+    generate_relational
+from concept_formation.data_files.generate_synthetic import generate_sparse
 
 def _load_json(filename):
     """
@@ -543,3 +549,92 @@ def load_molecule():
     """
     return _load_json('molecule.json')
 
+
+def load_synthetic_nominal(num_instances=None, seed=None, **kwargs):
+    """
+    Returns an iterator over a seeded, randomly generated dataset of instances
+    with :ref:`Nominal<val-nom>` values. Instances are generated lazily, so
+    this can be used to stream millions of instances (or an unending stream
+    when num_instances is None). The attribute count, value cardinality,
+    cluster structure, noise, and sparsity can be tuned using the keyword
+    arguments of :func:`generate_nominal
+    <concept_formation.data_files.generate_synthetic.generate_nominal>`.
+
+    >>> import pprint
+    >>> data = list(load_synthetic_nominal(2, seed=0, num_attrs=3))
+    >>> pprint.pprint(data)
+    [{'_cluster': 'c1', 'a0': 'v2', 'a1': 'v4', 'a2': 'v3'},
+     {'_cluster': 'c2', 'a0': 'v3', 'a1': 'v2', 'a2': 'v3'}]
+    """
+    return generate_nominal(num_instances, seed=seed, **kwargs)
+
+
+def load_synthetic_numeric(num_instances=None, seed=None, **kwargs):
+    """
+    Returns an iterator over a seeded, randomly generated dataset of instances
+    with :ref:`Numeric<val-num>` values. See :func:`generate_numeric
+    <concept_formation.data_files.generate_synthetic.generate_numeric>` for
+    the keyword arguments.
+
+    >>> data = list(load_synthetic_numeric(1000, seed=0, num_attrs=2))
+    >>> len(data)
+    1000
+    >>> sorted(data[0])
+    ['_cluster', 'n0', 'n1']
+    """
+    return generate_numeric(num_instances, seed=seed, **kwargs)
+
+
+def load_synthetic_mixed(num_instances=None, seed=None, **kwargs):
+    """
+    Returns an iterator over a seeded, randomly generated dataset of instances
+    with both :ref:`Nominal<val-nom>` and :ref:`Numeric<val-num>` values. See
+    :func:`generate_mixed
+    <concept_formation.data_files.generate_synthetic.generate_mixed>` for the
+    keyword arguments.
+
+    >>> from itertools import islice
+    >>> data = load_synthetic_mixed(seed=0, num_nominal=1, num_numeric=1,
+    ...                             sparsity=0.5)
+    >>> [sorted(instance) for instance in islice(data, 3)]
+    [['_cluster', 'n0'], ['_cluster', 'a0'], ['_cluster', 'n0']]
+    """
+    return generate_mixed(num_instances, seed=seed, **kwargs)
+
+
+def load_synthetic_relational(num_instances=None, seed=None, **kwargs):
+    """
+    Returns an iterator over a seeded, randomly generated dataset of instances
+    with :ref:`Component<val-comp>` values and :ref:`Relation<attr-rel>`
+    attributes, for use with :class:`TrestleTree
+    <concept_formation.trestle.TrestleTree>`. See :func:`generate_relational
+    <concept_formation.data_files.generate_synthetic.generate_relational>` for
+    the keyword arguments.
+
+    >>> data = list(load_synthetic_relational(1, seed=0, num_objects=2,
+    ...                                       num_relations=1, num_numeric=0))
+    >>> sorted(data[0], key=str)
+    [('r0', '?o1', '?o0'), '?o0', '?o1', '_cluster']
+    >>> sorted(data[0]['?o0'])
+    ['_role', 'a0', 'a1']
+    """
+    return generate_relational(num_instances, seed=seed, **kwargs)
+
+
+def load_synthetic_sparse(num_instances=None, seed=None, **kwargs):
+    """
+    Returns an iterator over a seeded, randomly generated dataset of sparse
+    bag-of-words style instances, where each instance only has a few of the
+    attributes from a large vocabulary (50,000 words by default). These are
+    best fit with a :class:`CobwebTree <concept_formation.cobweb.CobwebTree>`
+    in sparse mode. See :func:`generate_sparse
+    <concept_formation.data_files.generate_synthetic.generate_sparse>` for the
+    keyword arguments.
+
+    >>> data = list(load_synthetic_sparse(100, seed=0, words_per_instance=5))
+    >>> all(2 <= len(instance) <= 6 for instance in data)
+    True
+    >>> len(set(attr for instance in data for attr in instance)) > 100
+    True
+    """
+    return generate_sparse(num_instances, seed=seed, **kwargs)
@@ -0,0 +1,126 @@
+"""
+The instrumentation module contains the :class:`Instrumentation` class, which
+can be attached to a tree (or a :class:`StructureMapper
+<concept_formation.structure_mapper.StructureMapper>`) to record what the
+algorithms are doing on each instance. This is useful for understanding where
+the time goes when fitting an instance is slow.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from collections import deque
+
+
+class Instrumentation(object):
+    """
+    Records cumulative counters and stage timings, and optionally a trace of
+    the counters and timings for each top level call.
+
+    Instrumentation is disabled by default. It is enabled by setting the
+    instrumentation attribute of a tree, after which
+    :meth:`CobwebTree.cobweb <concept_formation.cobweb.CobwebTree.cobweb>`,
+    :meth:`TrestleTree.trestle <concept_formation.trestle.TrestleTree.trestle>`
+    and :meth:`StructureMapper.transform
+    <concept_formation.structure_mapper.StructureMapper.transform>` record:
+
+    * **instances** - the number of instances incorporated by cobweb.
+    * **depth** - the total depth of the concepts the instances ended at.
+    * **op_best**, **op_new**, **op_merge**, **op_split**,
+      **op_fringe_split**, **op_leaf_match** - how often each operation was
+      chosen.
+    * **cu_evaluations** - the number of category utility calculations.
+    * **node_copies** - the number of nodes copied.
+    * **mapping_searches**, **mapping_expansions**, **mapping_evaluations** -
+      the number of structure mapping searches, the number of search nodes
+      they expanded, and the number of mappings they evaluated.
+    * **mapping_budget_hits** - the number of structure mapping searches that
+      were stopped early because they ran out of budget.
+    * **mapping_restarts** - the number of additional, randomly perturbed,
+      structure mapping searches.
+
+    The timers record the wall time (in seconds) spent in the
+    **preprocessing**, **structure_mapping** and **cobweb** stages.
+
+    >>> from concept_formation.cobweb import CobwebTree
+    >>> tree = CobwebTree()
+    >>> tree.instrumentation = Instrumentation(trace=True)
+    >>> tree.fit([{'a': 'x'}, {'a': 'y'}, {'a': 'x'}], randomize_first=False)
+    >>> tree.instrumentation.counters['instances']
+    3
+    >>> tree.instrumentation.counters['op_fringe_split']
+    1
+    >>> len(tree.instrumentation.traces)
+    3
+    >>> sorted(tree.instrumentation.traces[0]['counters'].items())
+    [('depth', 0), ('instances', 1), ('op_leaf_match', 1)]
+
+    :param trace: Whether to keep a trace of each top level call.
+    :type trace: bool
+    :param max_traces: The maximum number of traces to keep, older traces are
+        discarded first. By default all traces are kept.
+    :type max_traces: int or None
+    """
+
+    def __init__(self, trace=False, max_traces=None):
+        self.trace = trace
+        self.max_traces = max_traces
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all of the counters, timers, and traces.
+        """
+        self.counters = {}
+        self.timers = {}
+        self.traces = deque(maxlen=self.max_traces)
+        self._nesting = 0
+        self._current = None
+
+    def begin(self):
+        """
+        Marks the start of an instrumented call. Nested calls (e.g., the call
+        to cobweb made by trestle) are recorded in the same trace as the
+        outermost call.
+        """
+        self._nesting += 1
+        if self._nesting == 1 and self.trace:
+            self._current = {'counters': {}, 'timers': {}}
+
+    def end(self):
+        """
+        Marks the end of an instrumented call.
+        """
+        self._nesting -= 1
+        if self._nesting == 0 and self._current is not None:
+            self.traces.append(self._current)
+            self._current = None
+
+    def incr(self, name, amount=1):
+        """
+        Increments a counter.
+
+        :param name: The name of the counter
+        :type name: str
+        :param amount: The amount to increment the counter by
+        :type amount: int
+        """
+        self.counters[name] = self.counters.get(name, 0) + amount
+        if self._current is not None:
+            counters = self._current['counters']
+            counters[name] = counters.get(name, 0) + amount
+
+    def add_time(self, stage, seconds):
+        """
+        Adds time to a stage's timer.
+
+        :param stage: The name of the stage
+        :type stage: str
+        :param seconds: The elapsed wall time
+        :type seconds: float
+        """
+        self.timers[stage] = self.timers.get(stage, 0.0) + seconds
+        if self._current is not None:
+            timers = self._current['timers']
+            timers[stage] = timers.get(stage, 0.0) + seconds
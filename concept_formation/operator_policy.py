@@ -0,0 +1,101 @@
+"""
+The operator_policy module contains the :class:`OperatorPolicy` class, which
+can be passed to a tree's constructor to limit when the (expensive) merge and
+split operators are entertained by :meth:`CobwebTree.cobweb
+<concept_formation.cobweb.CobwebTree.cobweb>`. This trades some of the
+quality of the resulting tree for faster fitting.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from timeit import default_timer
+
+ALL_OPERATIONS = ["best", "new", "merge", "split"]
+BEST_AND_NEW = ["best", "new"]
+
+
+class OperatorPolicy(object):
+    """
+    Decides which operations cobweb entertains at each concept as an instance
+    is sorted into the tree. The best and new operations are always
+    entertained, while merge and split are only entertained when all of the
+    policy's conditions hold:
+
+    * **every** - merge and split are only entertained for every k-th
+      instance.
+    * **max_depth** - merge and split are only entertained at concepts that
+      are shallower than max_depth (the root is at depth 0).
+    * **margin** - merge and split are only entertained when the category
+      utility of the best and new operations differ by no more than the
+      margin, i.e., when the choice between them is uncertain.
+    * **time_budget** - merge and split are no longer entertained once an
+      instance has taken more than time_budget seconds to incorporate.
+
+    The default policy entertains every operation, which is the normal cobweb
+    algorithm.
+
+    >>> from concept_formation.cobweb import CobwebTree
+    >>> policy = OperatorPolicy(every=2)
+    >>> tree = CobwebTree(operator_policy=policy)
+    >>> tree.fit([{'a': 'x'}, {'a': 'y'}, {'a': 'z'}], randomize_first=False)
+    >>> policy.instances
+    3
+    >>> policy.operations(0)
+    ['best', 'new']
+
+    :param every: Entertain merge and split for every k-th instance.
+    :type every: int
+    :param max_depth: Only entertain merge and split at concepts shallower
+        than this depth. By default merge and split are entertained at every
+        depth.
+    :type max_depth: int or None
+    :param margin: Only entertain merge and split when the category utility of
+        the best and new operations are within this margin. By default there
+        is no margin.
+    :type margin: float or None
+    :param time_budget: The time (in seconds) an instance can take before
+        falling back to only the best and new operations. By default there is
+        no budget.
+    :type time_budget: float or None
+    """
+
+    def __init__(self, every=1, max_depth=None, margin=None,
+                 time_budget=None):
+        if every < 1:
+            raise ValueError("every must be at least 1.")
+        self.every = every
+        self.max_depth = max_depth
+        self.margin = margin
+        self.time_budget = time_budget
+        self.instances = 0
+        self._start = None
+
+    def begin(self):
+        """
+        Marks the start of incorporating a new instance.
+        """
+        self.instances += 1
+        if self.time_budget is not None:
+            self._start = default_timer()
+
+    def operations(self, depth):
+        """
+        Returns the operations to entertain at a concept at the given depth for
+        the current instance.
+
+        :param depth: The depth of the concept the instance is being sorted
+            into
+        :type depth: int
+        :return: The operations to entertain
+        :rtype: ["best", "new", ...]
+        """
+        if self.instances % self.every != 0:
+            return BEST_AND_NEW
+        if self.max_depth is not None and depth >= self.max_depth:
+            return BEST_AND_NEW
+        if (self.time_budget is not None and self._start is not None and
+                default_timer() - self._start > self.time_budget):
+            return BEST_AND_NEW
+        return ALL_OPERATIONS
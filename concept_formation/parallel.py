@@ -0,0 +1,637 @@
+"""
+The parallel module contains functions for training concept trees in
+parallel. In particular, :func:`merge_trees` can be used to combine trees that
+were trained independently on different shards of a dataset (e.g., in
+different processes) into a single tree, and the :class:`CobwebForest` fits a
+sharded ensemble of trees in separate worker processes.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+from random import random
+from random import seed
+from copy import copy
+from multiprocessing import Pipe
+from multiprocessing import Process
+from zlib import crc32
+
+from concept_formation.cobweb import CobwebTree
+from concept_formation.cobweb3 import Cobweb3Tree
+from concept_formation.cobweb3 import cv_key
+from concept_formation.trestle import TrestleTree
+
+
+def merge_trees(*trees):
+    """
+    Combines independently trained trees into a single tree and returns it.
+    The trees that are passed in are not modified.
+
+    The first tree is used as the target and the concepts of every other tree
+    are re-sorted into it top down. At each concept of the target the children
+    of the matching concept from the other tree are sorted, as weighted
+    instances (see:
+    :meth:`CobwebNode.update_counts_from_node
+    <concept_formation.cobweb.CobwebNode.update_counts_from_node>`), into
+    whichever child of the target maximizes category utility. If creating a
+    new child is better than any existing child, then the other tree's concept
+    is added as a new child along with its whole subtree. Leaves are handled
+    like they are in :meth:`CobwebTree.cobweb
+    <concept_formation.cobweb.CobwebTree.cobweb>`; i.e., they are either exact
+    matches or get fringe split.
+
+    Because whole subtrees are moved at once, merging is typically much
+    cheaper than refitting the instances of the other trees, so training can
+    be sharded across processes and then reduced.
+
+    >>> from concept_formation.cobweb import CobwebTree
+    >>> t1 = CobwebTree()
+    >>> t1.fit([{'a': 'x'}, {'a': 'y'}])
+    >>> t2 = CobwebTree()
+    >>> t2.fit([{'a': 'x'}, {'a': 'z'}])
+    >>> merged = merge_trees(t1, t2)
+    >>> merged.root.count
+    4.0
+    >>> sorted(merged.root.av_counts['a'].items())
+    [('x', 2), ('y', 1), ('z', 1)]
+
+    .. warning:: Merging is not supported for :class:`TrestleTree
+        <concept_formation.trestle.TrestleTree>` because the objects in
+        separately trained trees are named apart from each other and would
+        need to be structure mapped.
+
+    :param trees: Two or more trees of the same type to merge.
+    :type trees: :class:`CobwebTree <concept_formation.cobweb.CobwebTree>` or
+        :class:`Cobweb3Tree <concept_formation.cobweb3.Cobweb3Tree>`
+    :return: A new tree containing the knowledge of all of the trees.
+    :rtype: :class:`CobwebTree <concept_formation.cobweb.CobwebTree>` or
+        :class:`Cobweb3Tree <concept_formation.cobweb3.Cobweb3Tree>`
+    """
+    if len(trees) == 0:
+        raise ValueError("Must provide at least one tree to merge.")
+
+    for tree in trees:
+        if isinstance(tree, TrestleTree):
+            raise ValueError("Merging TrestleTrees is not supported.")
+        if type(tree) is not type(trees[0]):
+            raise ValueError("Can only merge trees of the same type.")
+
+    target = _copy_tree(trees[0])
+    if target.decay is not None:
+        target.renormalize()
+
+    for other in trees[1:]:
+        if other.decay is not None:
+            other = _copy_tree(other)
+            other.renormalize()
+
+        if isinstance(target, Cobweb3Tree):
+            for inner_attr in other.attr_scales:
+                if inner_attr not in target.attr_scales:
+                    target.attr_scales[inner_attr] = (
+                        other.attr_scales[inner_attr].copy())
+                else:
+                    target.attr_scales[inner_attr].combine(
+                        other.attr_scales[inner_attr])
+
+        if other.root.count > 0:
+            _merge_into(target, other.root)
+
+    target._structure_changed()
+
+    return target
+
+
+def _copy_tree(tree):
+    """
+    Returns a copy of a tree. The concepts are copied iteratively (see:
+    :class:`CobwebNode <concept_formation.cobweb.CobwebNode>`), so unlike
+    deepcopy this works for trees of any depth. The copy does not share the
+    tree's instrumentation or categorize cache.
+    """
+    new = tree.__class__()
+    new.decay = tree.decay
+    new.prune_threshold = tree.prune_threshold
+    new.operator_policy = copy(tree.operator_policy)
+    new.sparse = tree.sparse
+    new.value_caps = copy(tree.value_caps)
+    new.instance_weight = tree.instance_weight
+
+    if isinstance(tree, Cobweb3Tree):
+        new.scaling = tree.scaling
+        new.inner_attr_scaling = tree.inner_attr_scaling
+        new.attr_scales = {inner_attr: tree.attr_scales[inner_attr].copy()
+                           for inner_attr in tree.attr_scales}
+
+    new.root = tree.root.__class__(tree.root)
+    for node in new.root.preorder():
+        node.tree = new
+    new._structure_changed()
+    return new
+
+
+def _merge_into(tree, other_root):
+    """
+    Sorts the concepts below other_root into the provided tree. This is the
+    core of :func:`merge_trees` and is not intended to be externally called.
+
+    Each level of the descent is a generator (see: :func:`_merge_steps`) that
+    yields the target child and the other tree's concept that should be
+    merged into it. Each yielded pair is fully merged before its parent level
+    continues, so the counts of the tree are consistent at every step.
+    """
+    stack = [_merge_steps(tree, tree.root, other_root)]
+
+    while stack:
+        try:
+            node, other = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            continue
+        stack.append(_merge_steps(tree, node, other))
+
+
+def _merge_steps(tree, node, other):
+    """
+    Incorporates another tree's concept into a concept of the tree. Whenever
+    the other concept (or one of its children) should be sorted into one of
+    the node's children, then the child and the other concept are yielded.
+    """
+    if not node.children:
+        if node.count == 0:
+            node.update_counts_from_node(other)
+            for child in other.children:
+                _attach_copy(node, child)
+            return
+
+        instance = _leaf_instance(other)
+        if instance is not None and node.is_exact_match(instance):
+            node.update_counts_from_node(other)
+            return
+
+        # fringe split
+        new = node.__class__(node)
+        node.parent = new
+        new.children.append(node)
+
+        if new.parent:
+            new.parent.children.remove(node)
+            new.parent.children.append(new)
+        else:
+            tree.root = new
+
+        new.update_counts_from_node(other)
+        _attach_copy(new, other)
+        return
+
+    pieces = other.children if other.children else [other]
+    for piece in pieces:
+        children_cu = [(_cu_for_insert_node(node, child, piece),
+                        child.count, random(), child)
+                       for child in node.children]
+        children_cu.sort(reverse=True)
+        best_cu, _, _, best = children_cu[0]
+
+        operations = [(best_cu, random(), 'best'),
+                      (_cu_for_new_node(node, piece), random(), 'new')]
+        operations.sort(reverse=True)
+
+        node.update_counts_from_node(piece)
+        if operations[0][2] == 'best':
+            yield best, piece
+        else:
+            _attach_copy(node, piece)
+
+
+def _attach_copy(node, other):
+    """
+    Adds a copy of another tree's concept (and its subtree) as a child of the
+    given node.
+    """
+    new_child = node.__class__(other)
+    new_child.parent = node
+    node.children.append(new_child)
+
+    nodes = [new_child]
+    while nodes:
+        current = nodes.pop()
+        current.tree = node.tree
+        for child in current.children:
+            child.parent = current
+            nodes.append(child)
+
+
+def _leaf_instance(leaf):
+    """
+    Returns the single instance that a leaf represents, or None if the leaf
+    summarizes multiple distinct instances.
+    """
+    instance = {}
+    for attr in leaf.attrs():
+        values = leaf.av_counts[attr]
+        if len(values) != 1:
+            return None
+        val = next(iter(values))
+        if val == cv_key:
+            cv = values[val]
+            if cv.num != leaf.count or cv.unbiased_std() != 0.0:
+                return None
+            instance[attr] = cv.unbiased_mean()
+        elif values[val] != leaf.count:
+            return None
+        else:
+            instance[attr] = val
+    return instance
+
+
+def _cu_for_insert_node(node, child, other):
+    """
+    The category utility of adding another tree's concept to a child of node.
+    """
+    temp = node.shallow_copy()
+    temp.update_counts_from_node(other)
+    for c in node.children:
+        temp_child = c.shallow_copy()
+        temp.children.append(temp_child)
+        temp_child.parent = temp
+        if c == child:
+            temp_child.update_counts_from_node(other)
+    return temp.category_utility()
+
+
+def _cu_for_new_node(node, other):
+    """
+    The category utility of adding another tree's concept as a new child of
+    node.
+    """
+    temp = node.shallow_copy()
+    temp.update_counts_from_node(other)
+    for c in node.children:
+        temp.children.append(c.shallow_copy())
+
+    new_child = node.__class__()
+    new_child.tree = node.tree
+    new_child.parent = temp
+    new_child.update_counts_from_node(other)
+    temp.children.append(new_child)
+    return temp.category_utility()
+
+
+class WorkerError(Exception):
+    """
+    Raised by a :class:`CobwebForest` when one of its worker processes failed
+    to fit its instances or to answer a query, or has exited. The message
+    contains the worker's error.
+    """
+    pass
+
+
+class CobwebForest(object):
+    """
+    A CobwebForest is an ensemble of trees, each of which is held by its own
+    worker process. Instances are partitioned across the workers, either
+    round-robin or by hashing the instance (so identical instances always go
+    to the same tree), and fit in parallel. Instances are sent to the workers
+    in chunks, so the throughput of :meth:`CobwebForest.ifit` scales with the
+    number of workers.
+
+    Queries fan out to every tree. :meth:`CobwebForest.categorize` sorts the
+    instance in every tree and combines the resulting concepts by adding
+    their probability tables together; i.e., each tree votes with the
+    distribution of its concept weighted by the concept's count, and numeric
+    attributes are combined into a count-weighted average. The predictions of
+    :meth:`CobwebForest.predict` and :meth:`CobwebForest.infer_missing` are
+    made from this combined concept.
+
+    >>> from concept_formation.cobweb import CobwebTree
+    >>> forest = CobwebForest(CobwebTree, n_workers=2)
+    >>> forest.fit([{'a': 'x', 'b': 'y'}, {'a': 'x', 'b': 'y'},
+    ...             {'a': 'z', 'b': 'w'}, {'a': 'z', 'b': 'w'}])
+    >>> forest.predict({'a': 'z'}, 'b')
+    'w'
+    >>> forest.categorize({'a': 'x'}).count
+    2.0
+    >>> forest.close()
+
+    .. warning:: Forests of :class:`TrestleTree
+        <concept_formation.trestle.TrestleTree>` are not supported because
+        the objects in the concepts of different trees are named apart.
+
+    :param tree_class: The type of tree held by each worker
+    :type tree_class: CobwebTree or Cobweb3Tree
+    :param n_workers: The number of worker processes (and trees)
+    :type n_workers: int
+    :param partition: How instances are assigned to workers, either
+        "round-robin" or "hash".
+    :type partition: str
+    :param chunk_size: The number of instances buffered for a worker before
+        they are sent to it.
+    :type chunk_size: int
+    :param tree_kwargs: Keyword arguments used to construct each tree.
+    """
+
+    def __init__(self, tree_class=CobwebTree, n_workers=2,
+                 partition="round-robin", chunk_size=100, **tree_kwargs):
+        if issubclass(tree_class, TrestleTree):
+            raise ValueError("Forests of TrestleTrees are not supported.")
+        if partition not in ("round-robin", "hash"):
+            raise ValueError("Unknown partition: " + str(partition))
+        if n_workers < 1:
+            raise ValueError("Need at least one worker.")
+
+        self.tree_class = tree_class
+        self.tree_kwargs = tree_kwargs
+        self.partition = partition
+        self.chunk_size = chunk_size
+        self.node_class = tree_class(**tree_kwargs).root.__class__
+
+        self.next_worker = 0
+        self.buffers = [[] for i in range(n_workers)]
+        self.connections = []
+        self.workers = []
+        for i in range(n_workers):
+            parent_conn, child_conn = Pipe()
+            worker = Process(target=_forest_worker,
+                             args=(child_conn, tree_class, tree_kwargs))
+            worker.daemon = True
+            worker.start()
+            self.connections.append(parent_conn)
+            self.workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _assign_worker(self, instance):
+        """
+        Returns the index of the worker that an instance is partitioned to.
+        """
+        if self.partition == "hash":
+            key = "".join(sorted(repr(item) for item in instance.items()))
+            return crc32(key.encode('utf-8')) % len(self.workers)
+
+        worker = self.next_worker
+        self.next_worker = (self.next_worker + 1) % len(self.workers)
+        return worker
+
+    def _send(self, worker, message):
+        """
+        Sends a message to a worker. Raises a :class:`WorkerError` if the
+        worker has exited (e.g., it was killed).
+        """
+        try:
+            self.connections[worker].send(message)
+        except (EOFError, IOError, OSError) as e:
+            raise WorkerError(_exited_message(worker, e))
+
+    def _flush(self):
+        """
+        Sends all of the buffered instances to their workers.
+        """
+        for i, buff in enumerate(self.buffers):
+            if buff:
+                self.buffers[i] = []
+                self._send(i, ("fit", buff))
+
+    def _query(self, command, args=None):
+        """
+        Sends a command to every worker and returns their replies. Raises a
+        :class:`WorkerError` if any of the workers failed.
+        """
+        self._flush()
+        errors = []
+        sent = []
+        for i, conn in enumerate(self.connections):
+            try:
+                conn.send((command, args))
+                sent.append(i)
+            except (EOFError, IOError, OSError) as e:
+                errors.append(_exited_message(i, e))
+
+        # every reply is received before raising, so that no stale replies
+        # are left for the next query.
+        replies = []
+        for i in sent:
+            try:
+                status, reply = self.connections[i].recv()
+            except (EOFError, IOError, OSError) as e:
+                errors.append(_exited_message(i, e))
+                continue
+            if status == "error":
+                errors.append("Worker failed: " + reply)
+            replies.append(reply)
+
+        if errors:
+            raise WorkerError(errors[0])
+        return replies
+
+    def ifit(self, instance):
+        """
+        Assigns the instance to one of the workers to be incorporated into its
+        tree. Instances are buffered and sent in chunks, so the tree might not
+        contain the instance until the next query.
+
+        :param instance: An instance to be categorized into the forest.
+        :type instance:  :ref:`Instance<instance-rep>`
+        """
+        worker = self._assign_worker(instance)
+        self.buffers[worker].append(instance)
+        if len(self.buffers[worker]) >= self.chunk_size:
+            buff = self.buffers[worker]
+            self.buffers[worker] = []
+            self._send(worker, ("fit", buff))
+
+    def fit(self, instances):
+        """
+        Fit a collection of instances into the forest.
+
+        :param instances: a collection of instances
+        :type instances:  [:ref:`Instance<instance-rep>`,
+            :ref:`Instance<instance-rep>`, ...]
+        """
+        for instance in instances:
+            self.ifit(instance)
+        self._flush()
+
+    def categorize(self, instance):
+        """
+        Categorizes the instance in every tree and returns a concept that
+        combines the probability tables of all of the resulting concepts. The
+        returned concept does not belong to any tree.
+
+        **This process does not modify the forest's knowledge.**
+
+        :param instance: an instance to be categorized into the forest.
+        :type instance: :ref:`Instance<instance-rep>`
+        :return: The combination of each tree's concept for the instance
+        :rtype: CobwebNode or Cobweb3Node
+        """
+        combined = self.node_class()
+        for count, av_counts, weight in self._query("categorize", instance):
+            concept = self.node_class()
+            concept.count = count
+            concept.av_counts = av_counts
+            if weight != 1:
+                concept.rescale_counts(1.0 / weight)
+            combined.update_counts_from_node(concept)
+        return combined
+
+    def predict(self, instance, attr, choice_fn="most likely",
+                allow_none=True):
+        """
+        Predicts the value of an attribute for an instance by voting across
+        the trees of the forest.
+
+        :param instance: an instance to make the prediction for
+        :type instance: :ref:`Instance<instance-rep>`
+        :param attr: the attribute to predict
+        :type attr: :ref:`Attribute<attributes>`
+        :param choice_fn: a string specifying the choice function to use,
+            either "most likely" or "sampled".
+        :type choice_fn: a string
+        :param allow_none: whether the attribute can be predicted to be
+            missing.
+        :type allow_none: Boolean
+        :return: The predicted value
+        :rtype: :ref:`Value<values>`
+        """
+        return self.categorize(instance).predict(attr, choice_fn, allow_none)
+
+    def infer_missing(self, instance, choice_fn="most likely",
+                      allow_none=True):
+        """
+        Returns a new instance with the missing attribute values inferred by
+        voting across the trees of the forest (see:
+        :meth:`CobwebTree.infer_missing
+        <concept_formation.cobweb.CobwebTree.infer_missing>`).
+
+        :param instance: an instance to be completed.
+        :type instance: :ref:`Instance<instance-rep>`
+        :param choice_fn: a string specifying the choice function to use,
+            either "most likely" or "sampled".
+        :type choice_fn: a string
+        :param allow_none: whether attributes not in the instance can be
+            inferred to be missing.
+        :type allow_none: Boolean
+        :return: A completed instance
+        :rtype: :ref:`Instance<instance-rep>`
+        """
+        temp_instance = {a: instance[a] for a in instance}
+        concept = self.categorize(temp_instance)
+
+        for attr in concept.attrs('all'):
+            if attr in temp_instance:
+                continue
+            val = concept.predict(attr, choice_fn, allow_none)
+            if val is not None:
+                temp_instance[attr] = val
+
+        return temp_instance
+
+    def get_trees(self):
+        """
+        Returns copies of the trees held by each worker.
+
+        :return: The trees of the forest
+        :rtype: list
+        """
+        return self._query("tree")
+
+    def merge(self):
+        """
+        Returns a single tree that merges all of the trees in the forest (see:
+        :func:`merge_trees`).
+
+        :return: The merged tree
+        :rtype: CobwebTree or Cobweb3Tree
+        """
+        return merge_trees(*self.get_trees())
+
+    def clear(self):
+        """
+        Clears the concepts of every tree in the forest, which also recovers
+        workers that failed to fit their instances.
+        """
+        self.buffers = [[] for w in self.workers]
+        self._query("clear")
+
+    def close(self):
+        """
+        Stops the worker processes. The forest cannot be used afterwards.
+        Workers that have already exited are ignored, so closing the forest
+        never raises.
+        """
+        for conn in self.connections:
+            try:
+                conn.send(("close", None))
+            except (EOFError, IOError, OSError):
+                # the worker has already exited.
+                pass
+            try:
+                conn.close()
+            except (IOError, OSError):
+                pass
+        for worker in self.workers:
+            worker.join()
+        self.connections = []
+        self.workers = []
+
+
+def _exited_message(worker, error):
+    """
+    Returns the message of the :class:`WorkerError` raised when a worker
+    cannot be reached.
+    """
+    return "Worker %i exited: %r" % (worker, error)
+
+
+def _forest_worker(conn, tree_class, tree_kwargs):
+    """
+    The loop run by each :class:`CobwebForest` worker process. Errors while
+    fitting are reported in response to every later query until the tree is
+    cleared.
+    """
+    seed()
+    tree = tree_class(**tree_kwargs)
+    error = None
+
+    while True:
+        command, args = conn.recv()
+
+        if command == "close":
+            break
+
+        if command == "fit":
+            if error is None:
+                try:
+                    for instance in args:
+                        tree.ifit(instance)
+                except Exception as e:
+                    error = repr(e)
+            continue
+
+        if command == "clear":
+            error = None
+
+        if error is not None:
+            conn.send(("error", error))
+            continue
+
+        try:
+            if command == "categorize":
+                concept = tree.categorize(args)
+                reply = (concept.count, concept.av_counts,
+                         tree.instance_weight)
+            elif command == "tree":
+                reply = tree
+            elif command == "clear":
+                tree.clear()
+                reply = None
+            else:
+                raise ValueError("Unknown command: " + str(command))
+            conn.send(("ok", reply))
+        except Exception as e:
+            conn.send(("error", repr(e)))
@@ -41,12 +41,22 @@ from __future__ import unicode_literals
 from __future__ import absolute_import
 from __future__ import division
 
-from copy import deepcopy
 from numbers import Number
+from collections import deque
 import collections
+import re
+
+from concept_formation.utils import LRUCache
 
 _gensym_counter = 0
 
+# Matches the variables (e.g., ?o1) in a string formatted relation, leaving
+# the parentheses around them in the rest of the relation.
+_variable_token = re.compile(r'(?<![^ (])(\?[^ ]*?)(?=\)*(?: |$))')
+
+# Marks the positions of the variables in a relation template.
+_variable_slot = object()
+
 
 def get_attribute_components(attribute, vars_only=True):
     """
@@ -117,7 +127,15 @@ class Preprocessor(object):
     A template class that defines the functions a preprocessor class should
     implement. In particular, a preprocessor should tranform an instance and
     implement a function for undoing this transformation.
+
+    Preprocessors whose transform of an instance does not depend on (or
+    change) any state, such as the instances that were transformed before it
+    or a name generator, set ``stateless`` to True. Stateless preprocessors
+    can be run on chunks of instances in other processes (see:
+    :meth:`Pipeline.stream`).
     """
+    stateless = False
+
     def transform(self, instance):
         """
         Transforms an instance.
@@ -161,10 +179,23 @@ class Pipeline(Preprocessor):
     """
     A special preprocessor class used to chain together many preprocessors.
     Supports the same transform and undo_transform functions as a regular
-    preprocessor.
+    preprocessor. A pipeline is stateless when all of its preprocessors are.
+
+    Large (or unbounded) collections of instances can be lazily transformed
+    with :meth:`Pipeline.stream`.
+
+    >>> from itertools import count, islice
+    >>> pipeline = Pipeline(Tuplizer(), Flattener())
+    >>> instances = ({'(rel ?o1 ?o2)': True, '?o1': {'x': i}}
+    ...              for i in count())
+    >>> for instance in islice(pipeline.stream(instances), 2):
+    ...     print(sorted(instance.items()))
+    [(('rel', '?o1', '?o2'), True), (('x', '?o1'), 0)]
+    [(('rel', '?o1', '?o2'), True), (('x', '?o1'), 1)]
     """
     def __init__(self, *preprocessors):
         self.preprocessors = preprocessors
+        self.stateless = all(pp.stateless for pp in preprocessors)
 
     def transform(self, instance):
         """
@@ -182,6 +213,98 @@ class Pipeline(Preprocessor):
             instance = pp.undo_transform(instance)
         return instance
 
+    def stream(self, instances, pool=None, chunk_size=100, max_pending=4):
+        """
+        Lazily applies the series of transformations to each of the instances
+        and yields the transformed instances in order. Instances are only read
+        from the iterable as they are needed, so it can be a generator over a
+        dataset that is larger than memory.
+
+        When a pool is given, the runs of consecutive stateless preprocessors
+        (see: :class:`Preprocessor`) are applied in the pool's worker
+        processes, chunk_size instances at a time, while the other
+        preprocessors are applied in this process (in order). At most
+        max_pending chunks are sent to the workers ahead of the chunk that is
+        being yielded, which bounds the number of instances held in memory.
+
+        :param instances: The instances to transform
+        :type instances: iterable of instances
+        :param pool: A pool of worker processes to run the stateless
+            preprocessors in. By default everything is run in this process.
+        :type pool: multiprocessing.Pool or None
+        :param chunk_size: The number of instances sent to a worker at a time
+        :type chunk_size: int
+        :param max_pending: The maximum number of chunks being transformed by
+            the workers at a time
+        :type max_pending: int
+        :return: The transformed instances
+        :rtype: generator of instances
+        """
+        if chunk_size < 1 or max_pending < 1:
+            raise ValueError("chunk_size and max_pending must be at least 1.")
+
+        if pool is None:
+            return _stream(self, instances)
+
+        stages = []
+        for pp in self.preprocessors:
+            if stages and stages[-1][0] == pp.stateless:
+                stages[-1][1].append(pp)
+            else:
+                stages.append((pp.stateless, [pp]))
+
+        for stateless, preprocessors in stages:
+            stage = Pipeline(*preprocessors)
+            if stateless:
+                instances = _stream_in_pool(stage, instances, pool,
+                                            chunk_size, max_pending)
+            else:
+                instances = _stream(stage, instances)
+        return instances
+
+
+def _stream(preprocessor, instances):
+    """
+    Lazily transforms each of the instances with the preprocessor.
+    """
+    for instance in instances:
+        yield preprocessor.transform(instance)
+
+
+def _batch_transform(args):
+    """
+    Transforms a chunk of instances with a preprocessor in a worker process.
+    """
+    preprocessor, instances = args
+    return preprocessor.batch_transform(instances)
+
+
+def _stream_in_pool(preprocessor, instances, pool, chunk_size, max_pending):
+    """
+    Lazily transforms chunks of the instances with the preprocessor in the
+    pool's worker processes and yields the transformed instances in order,
+    keeping at most max_pending chunks in the workers at a time.
+    """
+    pending = deque()
+    chunk = []
+    for instance in instances:
+        chunk.append(instance)
+        if len(chunk) < chunk_size:
+            continue
+        pending.append(pool.apply_async(_batch_transform,
+                                        ((preprocessor, chunk),)))
+        chunk = []
+        if len(pending) >= max_pending:
+            for transformed in pending.popleft().get():
+                yield transformed
+
+    if chunk:
+        pending.append(pool.apply_async(_batch_transform,
+                                        ((preprocessor, chunk),)))
+    while pending:
+        for transformed in pending.popleft().get():
+            yield transformed
+
 
 class Tuplizer(Preprocessor):
     """
@@ -207,7 +330,47 @@ class Tuplizer(Preprocessor):
     >>> tuplizer = Tuplizer()
     >>> tuplizer.transform(instance)
     {('place', 'x1', 12.4, 9.6, ('div', 'width', 18.2)): True}
+
+    Parsed relations are kept in a least recently used cache, and relations
+    that only differ in their variable names (e.g., ``(on ?o1 ?o2)`` and ``(on
+    ?o7 ?o3)``) share a parsed template that the variables are filled into,
+    so each relation template is only parsed once. The string forms of
+    relations are cached the same way for undo_transform.
+
+    >>> tuplizer = Tuplizer()
+    >>> for i in range(3):
+    ...     on = '(on ?o%i (above ?o%i ?o2))' % (i, i)
+    ...     _ = tuplizer.transform({on: True, '(left-of ?o1 ?o2)': True})
+    >>> tuplizer.parse_cache.hits, tuplizer.parse_cache.misses
+    (2, 4)
+    >>> tuplizer.template_cache.hits, tuplizer.template_cache.misses
+    (2, 2)
+
+    :param cache_size: The number of parsed relations (and of templates and of
+        string formatted relations) to cache. If None, then nothing is cached.
+    :type cache_size: int or None
     """
+    stateless = True
+
+    def __init__(self, cache_size=1024):
+        self.cache_size = cache_size
+        if cache_size is None:
+            self.parse_cache = None
+            self.template_cache = None
+            self.stringify_cache = None
+        else:
+            self.parse_cache = LRUCache(cache_size)
+            self.template_cache = LRUCache(cache_size)
+            self.stringify_cache = LRUCache(cache_size)
+
+    def __getstate__(self):
+        # The caches are not sent along when the tuplizer is copied to another
+        # process (see: Pipeline.stream).
+        return {'cache_size': self.cache_size}
+
+    def __setstate__(self, state):
+        self.__init__(state['cache_size'])
+
     def transform(self, instance):
         """
         Convert at string specified relations into tuples.
@@ -243,6 +406,52 @@ class Tuplizer(Preprocessor):
         if relation[0] != '(':
             return relation
 
+        if self.parse_cache is None:
+            return self._parse_relation(relation)
+
+        parsed = self.parse_cache.get(relation)
+        if parsed is None:
+            parsed = self._parse_template(relation)
+            self.parse_cache.put(relation, parsed)
+        return parsed
+
+    def _parse_template(self, relation):
+        """
+        Converts a string formatted relation into a tuplized relation by
+        filling its variables into the template of a previous relation that
+        only differed in its variable names, or by parsing it and keeping its
+        template when there is no such relation.
+
+        >>> tuplizer = Tuplizer()
+        >>> tuplizer._parse_template('(on ?o1 (above ?o2 c1))')
+        ('on', '?o1', ('above', '?o2', 'c1'))
+        >>> tuplizer._parse_template('(on ?b (above ?a c1))')
+        ('on', '?b', ('above', '?a', 'c1'))
+        >>> tuplizer.template_cache.hits
+        1
+        """
+        pieces = _variable_token.split(relation)
+        variables = pieces[1::2]
+        if not variables:
+            return self._parse_relation(relation)
+
+        key = tuple(pieces[0::2])
+        template = self.template_cache.get(key)
+        if template is not None:
+            return _fill_template(template, iter(variables))
+
+        parsed = self._parse_relation(relation)
+        found = []
+        template = _compile_template(parsed, found)
+        if found == variables:
+            self.template_cache.put(key, template)
+        return parsed
+
+    def _parse_relation(self, relation):
+        """
+        Parses a string formatted relation into a tuplized relation (without
+        any caching).
+        """
         stack = [[]]
 
         for val in relation.split(' '):
@@ -281,12 +490,50 @@ class Tuplizer(Preprocessor):
         >>> tuplizer._stringify_relation(relation)
         '(foo1 o1 (foo2 o2 o3))'
         """
-        if isinstance(relation, tuple):
-            relation = [self._stringify_relation(ele) if isinstance(ele, tuple)
-                        else ele for ele in relation]
-            return "(" + " ".join(relation) + ")"
-        else:
-            return relation
+        if not isinstance(relation, tuple) or self.stringify_cache is None:
+            return _stringify(relation)
+
+        string = self.stringify_cache.get(relation)
+        if string is None:
+            string = _stringify(relation)
+            self.stringify_cache.put(relation, string)
+        return string
+
+
+def _stringify(relation):
+    """
+    Converts a tupleized relation into a string formated relation (without
+    any caching).
+    """
+    if isinstance(relation, tuple):
+        relation = [_stringify(ele) if isinstance(ele, tuple) else ele for ele
+                    in relation]
+        return "(" + " ".join(relation) + ")"
+    else:
+        return relation
+
+
+def _compile_template(relation, variables):
+    """
+    Returns a copy of a tuplized relation with its variables replaced by
+    slots, and appends the variables (in order) to the given list.
+    """
+    if isinstance(relation, tuple):
+        return tuple([_compile_template(ele, variables) for ele in relation])
+    if isinstance(relation, str) and relation[:1] == '?':
+        variables.append(relation)
+        return _variable_slot
+    return relation
+
+
+def _fill_template(template, variables):
+    """
+    Returns a tuplized relation with the slots of the template filled in with
+    the variables (an iterator).
+    """
+    return tuple([next(variables) if ele is _variable_slot else
+                  _fill_template(ele, variables) if isinstance(ele, tuple) else
+                  ele for ele in template])
 
 
 def rename_relation(relation, mapping):
@@ -435,7 +682,7 @@ class NameStandardizer(Preprocessor):
 
         return new_instance
 
-    def _standardize(self, instance, mapping={}, prefix=None):
+    def _standardize(self, instance, mapping=None, prefix=None):
         """
         Given an instance rename all the components so they
         have unique names.
@@ -449,9 +696,13 @@ class NameStandardizer(Preprocessor):
         component's name within relation attributes. This renaming is necessary
         to allow for a search between possible mappings without collisions.
 
+        The instance is traversed with an explicit stack (rather than
+        recursively), so deeply nested instances do not hit python's recursion
+        limit.
+
         :param instance: An instance to be named apart.
-        :param mapping: An existing mapping to add new mappings to; used for
-            recursive calls.
+        :param mapping: An existing mapping to add new mappings to. By default
+            a new mapping is used.
         :type instance: :ref:`Instance<instance-rep>`
         :return: an instance with component attributes renamed
         :rtype: :ref:`Instance<instance-rep>`
@@ -473,46 +724,82 @@ class NameStandardizer(Preprocessor):
          ('relation1', '?o1', 'c2'): True,
          ('relation2', ('a1', '?o1'), ('relation3', ('a3', ('c2', 'c3')))): 4.3}
         """
+        if mapping is None:
+            mapping = {}
+
+        def name_components(relation):
+            for o in get_attribute_components(relation):
+                if o not in mapping:
+                    mapping[o] = self.gensym()
+
         new_instance = {}
-        relations = []
 
-        # I had to add the key function to the sort because python apparently
-        # can't naturally sort strings and tuples
-        # for attr in instance:
-        for attr in sorted(instance, key=lambda at: str(at)):
+        # Each frame holds the remaining attributes of an object (sorted by
+        # their string representation, as python cannot compare strings and
+        # tuples, so names are generated in a deterministic order), the
+        # object, its standardized copy, and its relations, which are renamed
+        # once the object is done. A frame without attributes names the
+        # components of a relation whose (sub-object) value has been
+        # standardized.
+        stack = [(iter(sorted(instance, key=str)), instance, new_instance,
+                  [])]
+
+        while stack:
+            attrs, obj, new_obj, relations = stack[-1]
+
+            if attrs is None:
+                stack.pop()
+                name_components(obj)
+                continue
 
-            name = attr
-            indexable = False
-            try:
-                attr[0] == '?'
-                indexable = True
-            except:
-                pass
-
-            if indexable and attr[0] == '?' and not isinstance(attr, tuple):
-                if name not in mapping:
-                    mapping[name] = self.gensym()
-                name = mapping[name]
-
-            value = instance[attr]
-
-            if isinstance(value, dict):
-                value = self._standardize(value, mapping, name)
-            elif isinstance(value, list):
-                value = [self._standardize(ele, mapping, name) if
-                         isinstance(ele, dict) else ele for ele in value]
-
-            if isinstance(name, tuple):
-                for o in get_attribute_components(name):
-                    if o not in mapping:
-                        mapping[o] = self.gensym()
-                relations.append((name, value))
-            else:
-                new_instance[name] = value
+            for attr in attrs:
+                name = attr
+                try:
+                    variable = attr[0] == '?' and not isinstance(attr, tuple)
+                except Exception:
+                    variable = False
+
+                if variable:
+                    if name not in mapping:
+                        mapping[name] = self.gensym()
+                    name = mapping[name]
+
+                value = obj[attr]
+                children = None
+                if isinstance(value, dict):
+                    new_value = {}
+                    children = [(value, new_value)]
+                elif isinstance(value, list):
+                    new_value = []
+                    children = []
+                    for ele in value:
+                        if isinstance(ele, dict):
+                            new_ele = {}
+                            children.append((ele, new_ele))
+                            new_value.append(new_ele)
+                        else:
+                            new_value.append(ele)
+                else:
+                    new_value = value
 
-        for relation, val in relations:
-            temp_rel = rename_relation(relation, mapping)
-            new_instance[temp_rel] = val
+                if isinstance(name, tuple):
+                    relations.append((name, new_value))
+                    if not children:
+                        name_components(name)
+                    else:
+                        stack.append((None, name, None, None))
+                else:
+                    new_obj[name] = new_value
+
+                if children:
+                    for child, new_child in reversed(children):
+                        stack.append((iter(sorted(child, key=str)), child,
+                                      new_child, []))
+                    break
+            else:
+                stack.pop()
+                for relation, val in relations:
+                    new_obj[rename_relation(relation, mapping)] = val
 
         return new_instance
 
@@ -557,8 +844,32 @@ class Flattener(Preprocessor):
     >>> instance = flattener.undo_transform(instance)
     >>> pprint.pprint(instance)
     {'l1': {'l2': {'l3': {'l4': 1}}}}
+
+    When an :class:`InternTable <concept_formation.utils.InternTable>` is
+    given, the flattened attributes are interned in it, so the attributes of
+    different instances are shared rather than rebuilt for every instance.
+
+    >>> from concept_formation.utils import InternTable
+    >>> flattener = Flattener(InternTable())
+    >>> a = flattener.transform({'?o1': {'Position': {'X': 1}}})
+    >>> b = flattener.transform({'?o1': {'Position': {'X': 2}}})
+    >>> list(a)[0] is list(b)[0]
+    True
+
+    :param interner: A table to intern the flattened attributes in
+    :type interner: :class:`InternTable <concept_formation.utils.InternTable>`
+        or None
     """
 
+    stateless = True
+
+    def __init__(self, interner=None):
+        self.interner = interner
+        # The attributes are only shared when they are interned in this
+        # process.
+        if interner is not None:
+            self.stateless = False
+
     def transform(self, instance):
         """
         Perform the flattening procedure.
@@ -635,7 +946,9 @@ class Flattener(Preprocessor):
 
         To eliminate structure, the inner most attributes are pulled up to the
         top level and renamed as tuples that contain information about the
-        structure.
+        structure. The instance is traversed with an explicit stack (rather
+        than recursively), so deeply nested instances do not hit python's
+        recursion limit.
 
         :param instance: An instance to be flattened.
         :type instance: instance
@@ -679,20 +992,31 @@ class Flattener(Preprocessor):
          ('Z', ('Rotation', '?cube02')): 0.0}
         """
         temp = {}
-        for attr in instance:
-            original = attr
-            if outer_attr is not None:
-                if attr[0] == "_":
-                    attr = ('_', (attr, outer_attr))
-                else:
-                    attr = (attr, outer_attr)
+        interner = self.interner
+
+        # Each frame holds the remaining attributes of a (sub-)object and the
+        # flattened attribute of the object itself.
+        stack = [(iter(instance.items()), outer_attr)]
+
+        while stack:
+            items, outer = stack[-1]
+            for attr, value in items:
+                if outer is not None:
+                    if attr[0] == "_":
+                        attr = ('_', (attr, outer))
+                    else:
+                        attr = (attr, outer)
+
+                if isinstance(value, dict):
+                    stack.append((iter(value.items()), attr))
+                    break
 
-            if isinstance(instance[original], dict):
-                so = self._flatten(instance[original], attr)
-                for so_attr in so:
-                    temp[so_attr] = so[so_attr]
+                if interner is not None:
+                    attr = interner.intern(attr)
+                temp[attr] = value
             else:
-                temp[attr] = instance[original]
+                stack.pop()
+
         return temp
 
 
@@ -945,33 +1269,53 @@ class ExtractListElements(Preprocessor):
         """
         Unlike the utils.extract_components function this one will extract ALL
         elements into their own objects not just object literals
+
+        The instance is traversed with an explicit stack (rather than
+        recursively), so deeply nested instances do not hit python's recursion
+        limit.
         """
         new_instance = {}
-        for a in instance.keys():
-            if isinstance(instance[a], list):
 
-                if a[0] == '_':
-                    new_instance[a] = str(instance[a])
-                    continue
-
-                new_list = []
-                for el in instance[a]:
-
-                    if isinstance(el, dict):
-                        new_obj = deepcopy(el)
+        # Each frame holds the remaining items of an object or list and the
+        # object that the extracted attributes are added to. List frames also
+        # hold the list's attribute and the names of its extracted elements,
+        # which are added once all of the elements have been extracted.
+        stack = [(iter(instance.items()), new_instance, None, None)]
+
+        while stack:
+            items, new_obj, list_attr, new_list = stack[-1]
+
+            if new_list is None:
+                for a, value in items:
+                    if isinstance(value, list):
+                        if a[0] == '_':
+                            new_obj[a] = str(value)
+                            continue
+                        stack.append((iter(value), new_obj, a, []))
+                        break
+                    elif isinstance(value, dict):
+                        new_obj[a] = {}
+                        stack.append((iter(value.items()), new_obj[a], None,
+                                      None))
+                        break
                     else:
-                        new_obj = {"val": el}
+                        new_obj[a] = value
+                else:
+                    stack.pop()
 
+            else:
+                for el in items:
+                    if not isinstance(el, dict):
+                        el = {"val": el}
                     new_att = self.gensym()
-                    new_instance[new_att] = self._extract(new_obj)
+                    new_obj[new_att] = {}
                     new_list.append(new_att)
-
-                new_instance[a] = new_list
-
-            elif isinstance(instance[a], dict):
-                new_instance[a] = self._extract(instance[a])
-            else:
-                new_instance[a] = instance[a]
+                    stack.append((iter(el.items()), new_obj[new_att], None,
+                                  None))
+                    break
+                else:
+                    stack.pop()
+                    new_obj[list_attr] = new_list
 
         return new_instance
 
@@ -1136,36 +1480,56 @@ class ListsToRelations(Preprocessor):
             return [path]
 
     def _lists_to_relations(self, instance, current=None, top_level=None):
+        """
+        Replaces the lists in the instance with empty objects and adds
+        relations describing their elements and order to the top level.
+
+        The instance is traversed with an explicit stack (rather than
+        recursively), so deeply nested instances do not hit python's recursion
+        limit.
+        """
         new_instance = {}
         if top_level is None:
             top_level = new_instance
 
-        for attr in instance.keys():
-            if current is None:
-                lname = attr
-            else:
-                lname = (attr, current)
+        # Each frame holds the remaining attributes of a (sub-)object, its
+        # path (i.e., its flattened attribute), its converted copy, and where
+        # the copy is added once it is done.
+        stack = [(iter(instance.items()), current, new_instance, None, None)]
+
+        while stack:
+            items, path, new_obj, parent, parent_attr = stack[-1]
+            for attr, value in items:
+                if path is None:
+                    lname = attr
+                else:
+                    lname = (attr, path)
 
-            if isinstance(instance[attr], list):
-                new_instance[attr] = {}
+                if isinstance(value, list):
+                    new_obj[attr] = {}
 
-                for i in range(len(instance[attr])-1):
-                    rel = ("ordered-list", lname, str(instance[attr][i]),
-                           str(instance[attr][i+1]))
-                    top_level[rel] = True
+                    names = [str(ele) for ele in value]
+                    for i in range(len(value)-1):
+                        rel = ("ordered-list", lname, names[i], names[i+1])
+                        top_level[rel] = True
 
-                    rel = ("has-element", lname, instance[attr][i])
-                    top_level[rel] = True
+                        rel = ("has-element", lname, value[i])
+                        top_level[rel] = True
 
-                if len(instance[attr]) > 0:
-                    rel = ('has-element', lname, instance[attr][-1])
-                    top_level[rel] = True
+                    if len(value) > 0:
+                        rel = ('has-element', lname, value[-1])
+                        top_level[rel] = True
 
-            elif isinstance(instance[attr], dict):
-                new_instance[attr] = self._lists_to_relations(instance[attr],
-                                                              lname, top_level)
+                elif isinstance(value, dict):
+                    stack.append((iter(value.items()), lname, {}, new_obj,
+                                  attr))
+                    break
+                else:
+                    new_obj[attr] = value
             else:
-                new_instance[attr] = instance[attr]
+                stack.pop()
+                if parent is not None:
+                    parent[parent_attr] = new_obj
 
         return new_instance
 
@@ -1229,8 +1593,16 @@ class SubComponentProcessor(Preprocessor):
                'a4': 'v4'},
      'a1': 'v1',
      ('ordered-list', ('list1', ('?o2', '?o1')), 'b', 'a'): True}
+
+    :param interner: A table to intern the extracted attributes and
+        has-component relations in
+    :type interner: :class:`InternTable <concept_formation.utils.InternTable>`
+        or None
     """
 
+    def __init__(self, interner=None):
+        self.interner = interner
+
     def transform(self, instance):
         """
         Travese the instance for objects that contain subobjects and extracts
@@ -1277,11 +1649,16 @@ class SubComponentProcessor(Preprocessor):
 
     def _extract_sub_objects(self, instance):
         new_instance = {}
+        interner = self.interner
         for a in instance:
             rels = self._get_has_components(a)
             for r in rels:
+                if interner is not None:
+                    r = interner.intern(r)
                 new_instance[r] = True
             new_a = self._extract_attr(a)
+            if interner is not None:
+                new_a = interner.intern(new_a)
             new_instance[new_a] = instance[a]
         return new_instance
 
@@ -1444,6 +1821,8 @@ class NumericToNominal(OneWayPreprocessor):
         numeric values will be converted.
     :type attrs: strings
     """
+    stateless = True
+
     def __init__(self, *attrs):
         if len(attrs) == 0:
             self.targets = None
@@ -1537,6 +1916,7 @@ class NominalToNumeric(OneWayPreprocessor):
         non-component values will be converted.
     :type attrs: strings
     """
+    stateless = True
 
     def __init__(self, on_fail='break', *attrs):
         if len(attrs) == 0:
@@ -1622,6 +2002,7 @@ class Sanitizer(OneWayPreprocessor):
      ('r1', '2', 'r3'): 'v4',
      ('r4', 'r5'): {'3': 'v6', 'aa3': 4}}
     """
+    stateless = True
 
     def __init__(self,spec='trestle'):
         if spec.lower() not in ['trestle','cobweb','cobweb3']:
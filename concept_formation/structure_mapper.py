@@ -15,19 +15,29 @@ from __future__ import division
 
 from random import choice
 from random import random
+from random import Random
+from copy import deepcopy
 from itertools import combinations
+from timeit import default_timer
 
 from munkres import Munkres
-# from scipy.optimize import linear_sum_assignment
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
 
 from py_search.base import Problem
+from py_search.base import AnnotatedProblem
 from py_search.base import Node
 from py_search.optimization import hill_climbing
 from concept_formation.preprocessor import Preprocessor
 from concept_formation.preprocessor import rename_relation
 from concept_formation.preprocessor import get_attribute_components
 from concept_formation.cobweb3 import Cobweb3Node
+from concept_formation.cobweb3 import Cobweb3Tree
 from concept_formation.cobweb3 import cv_key
+from concept_formation.continuous_value import ContinuousValue
+from concept_formation.utils import isNumber
 
 
 def get_component_names(instance, vars_only=True):
@@ -70,7 +80,65 @@ def get_component_names(instance, vars_only=True):
     return names
 
 
-def rename_flat(target, mapping):
+def structure_signature(target):
+    """
+    Returns a canonical signature of the structure of a (flattened) target,
+    which ignores the names of its components and the values of its
+    attributes, along with its component names in a canonical order. Two
+    targets with the same signature have the same components and attributes
+    up to renaming, and their components in the canonical order play
+    corresponding roles (up to ties between components with the same
+    attributes).
+
+    Each component is described by the sorted shapes of the attributes it is
+    part of, where the component is replaced with ``'*'`` and any other
+    components with ``'?'``.
+
+    >>> a = {('size', '?o1'): 1, ('size', '?o2'): 3,
+    ...      ('on', '?o1', '?o2'): True}
+    >>> b = {('size', '?o7'): 2, ('size', '?o5'): 2,
+    ...      ('on', '?o7', '?o5'): True}
+    >>> structure_signature(a)[0] == structure_signature(b)[0]
+    True
+    >>> structure_signature(a)[1]
+    ['?o1', '?o2']
+    >>> structure_signature(b)[1]
+    ['?o7', '?o5']
+
+    :param target: An instance or concept.av_counts object
+    :type target: :ref:`Instance<instance-rep>` or av_counts obj from concept
+    :return: the signature and the component names in canonical order
+    :rtype: (tuple, list)
+    """
+    shapes = {}
+    for attr in target:
+        names = get_attribute_components(attr)
+        for name in names:
+            mapping = {n: '?' for n in names}
+            mapping[name] = '*'
+            shapes.setdefault(name, []).append(str(rename_flat({attr: None},
+                                                               mapping)))
+
+    profiles = {name: str(sorted(shapes[name])) for name in shapes}
+    names = sorted(profiles, key=lambda name: (profiles[name],
+                                               _nominal_values(target, name),
+                                               str(name)))
+    return tuple(profiles[name] for name in names), names
+
+
+def _nominal_values(target, name):
+    """
+    Returns the sorted nominal values of the attributes of a component, which
+    is used to break ties between components with the same structure so that
+    similar components are put in the same canonical position.
+    """
+    return str(sorted(str(target[attr]) for attr in target
+                      if not isNumber(target[attr]) and
+                      not isinstance(target[attr], dict) and
+                      contains_component(name, attr)))
+
+
+def rename_flat(target, mapping, interner=None):
     """
     Given an instance and a mapping rename the components and relations and
     return the renamed instance.
@@ -80,6 +148,9 @@ def rename_flat(target, mapping):
     :param mapping: :param mapping: A dictionary of mappings between component
         names
     :type mapping: dict
+    :param interner: A table the renamed attributes are interned in
+    :type interner: :class:`InternTable <concept_formation.utils.InternTable>`
+        or None
     :return: A copy of the instance with components and relations renamed
     :rtype: instance
 
@@ -94,11 +165,14 @@ def rename_flat(target, mapping):
 
     for attr in target:
         if attr in mapping:
-            temp_instance[mapping[attr]] = target[attr]
+            new_attr = mapping[attr]
         elif isinstance(attr, tuple):
-            temp_instance[rename_relation(attr, mapping)] = target[attr]
+            new_attr = rename_relation(attr, mapping)
         else:
-            temp_instance[attr] = target[attr]
+            new_attr = attr
+        if interner is not None:
+            new_attr = interner.intern(new_attr)
+        temp_instance[new_attr] = target[attr]
 
     return temp_instance
 
@@ -170,7 +244,47 @@ def contains_component(component, attr):
     return attr == component
 
 
-def flat_match(target, base, initial_mapping=None):
+def get_component_block(name, target, blocking_keys):
+    """
+    Returns the blocking key of a component, i.e., the tuple of the
+    component's values for each of the blocking_keys attributes. Hidden keys
+    (e.g., ``'_type'``) are looked up under their flattened hidden name. When
+    the target is a concept's av_counts table the most common value is used,
+    and a missing value is ``None``.
+
+    >>> target = {('type', '?o1'): 'cube', ('_', ('_type', '?o1')): 'block'}
+    >>> get_component_block('?o1', target, ['type', '_type'])
+    ('cube', 'block')
+    >>> av_counts = {('type', '?c1'): {'cube': 2, 'ball': 1}}
+    >>> get_component_block('?c1', av_counts, ['type', 'color'])
+    ('cube', None)
+
+    :param name: A component name
+    :type name: str or tuple
+    :param target: An instance or concept.av_counts object
+    :type target: :ref:`Instance<instance-rep>` or av_counts obj from concept
+    :param blocking_keys: The attribute names whose values must agree
+    :type blocking_keys: [str, ...]
+    :return: The component's blocking key
+    :rtype: tuple
+    """
+    block = []
+    for key in blocking_keys:
+        if key[0] == '_':
+            attr = ('_', (key, name))
+        else:
+            attr = (key, name)
+        value = target.get(attr)
+        if isinstance(value, dict):
+            nominal = [val for val in value if val != cv_key]
+            value = max(nominal, key=value.get) if nominal else None
+        block.append(value)
+    return tuple(block)
+
+
+def flat_match(target, base, initial_mapping=None, instrumentation=None,
+               solver=None, blocking_keys=None, max_evaluations=None,
+               time_budget=None, restarts=0, restart_seed=0, pool=None):
     """
     Given a base (usually concept) and target (instance or concept av table)
     this function returns a mapping that can be used to rename components in
@@ -183,6 +297,54 @@ def flat_match(target, base, initial_mapping=None):
     assignment (no relations). This initialization approach is polynomial in
     the size of the base.
 
+    If blocking_keys are provided, then a target component can only be mapped
+    to a base component with the same values for those attributes (see:
+    :func:`get_component_block`), e.g., objects are only mapped to objects of
+    the same type. The initial mapping is then computed separately for each
+    group of components with the same blocking key, and the local search only
+    considers mappings within these groups.
+
+    The local search can also be given a budget, either a maximum number of
+    mapping evaluations or a wall time (which includes computing the initial
+    mapping). When the budget runs out the best mapping found so far is
+    returned, which bounds the time spent mapping large instances.
+
+    Since hill climbing only finds a local optimum, restarts additional
+    searches can be run, each starting from the initial mapping perturbed by
+    random swaps (see: :meth:`random_successor
+    <StructureMappingOptimizationProblem.random_successor>`), and the best
+    mapping of all the searches is returned. The i-th restart is seeded with
+    restart_seed + i, so the result is deterministic. If a
+    ``multiprocessing.Pool`` is provided then the searches are run in
+    parallel in its worker processes, which are sent a read-only snapshot of
+    the base (see: :func:`snapshot_concept`); this gives the same result as
+    running them in this process. Each search gets its own max_evaluations.
+    When the searches are run in this process they share the time_budget, so
+    later restarts only get the time that is left, whereas the searches run
+    in a pool each get the time that was left when they were submitted.
+
+    >>> base = Cobweb3Node()
+    >>> base.increment_counts({('_', ('_type', '?c1')): 'a',
+    ...                        ('_', ('_type', '?c2')): 'b',
+    ...                        ('color', '?c1'): 'red', ('size', '?c1'): 1,
+    ...                        ('color', '?c2'): 'red', ('size', '?c2'): 2})
+    >>> target = {('_', ('_type', '?o1')): 'b', ('_', ('_type', '?o2')): 'a',
+    ...           ('color', '?o1'): 'red', ('size', '?o1'): 1,
+    ...           ('color', '?o2'): 'red', ('size', '?o2'): 2}
+    >>> sorted(flat_match(target, base).items())
+    [('?o1', '?c1'), ('?o2', '?c2')]
+    >>> sorted(flat_match(target, base, blocking_keys=['_type']).items())
+    [('?o1', '?c2'), ('?o2', '?c1')]
+
+    >>> from concept_formation.instrumentation import Instrumentation
+    >>> inst = Instrumentation()
+    >>> mapping = flat_match(target, base, instrumentation=inst,
+    ...                      max_evaluations=1)
+    >>> inst.counters['mapping_budget_hits']
+    1
+    >>> sorted(flat_match(target, base, restarts=3).items())
+    [('?o1', '?c1'), ('?o2', '?c2')]
+
     :param target: An instance or concept.av_counts object to be mapped to the
         base concept.
     :type target: :ref:`Instance<instance-rep>` or av_counts obj from concept
@@ -190,9 +352,34 @@ def flat_match(target, base, initial_mapping=None):
     :type base: TrestleNode
     :param initial_mapping: An initial mapping to seed the local search
     :type initial_mapping: A mapping dict
+    :param instrumentation: An optional object to record search statistics in
+    :type instrumentation: :class:`Instrumentation
+        <concept_formation.instrumentation.Instrumentation>`
+    :param solver: The assignment solver used to compute the initial mapping
+        (see: :func:`hungarian_mapping`)
+    :type solver: str, function, or None
+    :param blocking_keys: Attribute names whose values must agree for two
+        components to be mapped. By default any components can be mapped.
+    :type blocking_keys: [str, ...] or None
+    :param max_evaluations: The maximum number of mappings the local search
+        evaluates. By default there is no limit.
+    :type max_evaluations: int or None
+    :param time_budget: The time (in seconds) after which the local search is
+        stopped. By default there is no limit.
+    :type time_budget: float or None
+    :param restarts: The number of additional, randomly perturbed, searches
+    :type restarts: int
+    :param restart_seed: The seed of the first restart
+    :type restart_seed: int
+    :param pool: A pool of worker processes to run the searches in
+    :type pool: multiprocessing.Pool or None
     :return: a mapping for renaming components in the instance.
     :rtype: dict
     """
+    deadline = None
+    if time_budget is not None:
+        deadline = default_timer() + time_budget
+
     inames = frozenset(get_component_names(target))
     cnames = frozenset(get_component_names(base.av_counts))
 
@@ -203,35 +390,284 @@ def flat_match(target, base, initial_mapping=None):
         raise Exception("Objects in target and base must not collide. "
                         "Consider running NameStandardizer first.")
 
+    blocks = None
+    if blocking_keys:
+        blocks = {}
+        for o in inames:
+            blocks[o] = get_component_block(o, target, blocking_keys)
+        for c in cnames:
+            blocks[c] = get_component_block(c, base.av_counts, blocking_keys)
+
     # TODO consider flipping target and base when one is larger than the other.
-    if initial_mapping is None:
-        initial_mapping = hungarian_mapping(inames, cnames, target, base)
+    if initial_mapping is None and blocks is None:
+        initial_mapping = hungarian_mapping(inames, cnames, target, base,
+                                            solver)
+    elif initial_mapping is None:
+        initial_mapping = frozenset()
+        for block_inames, block_cnames in group_by_block(inames, cnames,
+                                                         blocks):
+            if block_cnames:
+                initial_mapping |= hungarian_mapping(block_inames,
+                                                     block_cnames, target,
+                                                     base, solver)
+            else:
+                initial_mapping |= frozenset((o, o) for o in block_inames)
     else:
         initial_mapping = frozenset([(a, v) for a, v in initial_mapping if a in
-                                     inames and v in cnames])
+                                     inames and (v == a or v in cnames and
+                                                 (blocks is None or
+                                                  blocks[a] == blocks[v]))])
+        # components without a (valid) initial mapping start out unmapped, so
+        # the search still considers them.
+        mapped = frozenset(a for a, v in initial_mapping)
+        initial_mapping |= frozenset((o, o) for o in inames - mapped)
 
     unmapped = cnames - frozenset(dict(initial_mapping).values())
 
     # print("MATCHING", initial_mapping, target, base)
 
-    initial_cost = mapping_cost(initial_mapping, target, base)
-
-    op_problem = StructureMappingOptimizationProblem((initial_mapping,
-                                                      unmapped),
-                                                     initial_cost=initial_cost,
-                                                     extra=(target, base))
+    remaining = None
+    if deadline is not None:
+        remaining = deadline - default_timer()
+
+    searches = [(target, base, initial_mapping, unmapped, blocks,
+                 max_evaluations, remaining, None, 0)]
+    if restarts > 0:
+        if pool is not None:
+            base = snapshot_concept(base)
+            searches[0] = (target, base) + searches[0][2:]
+        for i in range(restarts):
+            searches.append((target, base, initial_mapping, unmapped, blocks,
+                             max_evaluations, remaining, restart_seed + i,
+                             len(inames)))
+
+    if restarts > 0 and pool is not None:
+        results = pool.map(mapping_search, searches)
+    else:
+        results = []
+        for search in searches:
+            if deadline is not None:
+                remaining = max(0.0, deadline - default_timer())
+                search = search[:6] + (remaining,) + search[7:]
+            results.append(mapping_search(search))
+
+    if instrumentation is not None:
+        instrumentation.incr('mapping_searches')
+        if restarts > 0:
+            instrumentation.incr('mapping_restarts', restarts)
+        for cost, mapping, expanded, evaluated, budget_hit in results:
+            instrumentation.incr('mapping_expansions', expanded)
+            instrumentation.incr('mapping_evaluations', evaluated)
+            if budget_hit:
+                instrumentation.incr('mapping_budget_hits')
+
+    # the first of the best mappings, so ties are broken deterministically.
+    best = min(range(len(results)), key=lambda i: results[i][0])
+    return dict(results[best][1])
+
+
+def mapping_search(search):
+    """
+    Runs a single hill-climbing search for a mapping, which is used by
+    :func:`flat_match` (possibly in a worker process).
+
+    The search is described by a tuple of the target, the base, the initial
+    mapping, the unmapped base components, the blocks (see:
+    :func:`flat_match`), the maximum number of evaluations, the time budget,
+    the seed of the random perturbation, and the number of random swaps
+    (see: :meth:`StructureMappingOptimizationProblem.random_successor`)
+    applied to the initial mapping before searching.
+
+    :param search: The search to run
+    :type search: tuple
+    :return: the cost of the best mapping found, the mapping, and the number
+        of nodes expanded and evaluated, and whether the budget was hit.
+    :rtype: (float, frozenset, int, int, bool)
+    """
+    (target, base, initial_mapping, unmapped, blocks, max_evaluations,
+     time_budget, perturbation_seed, perturbation) = search
+
+    deadline = None
+    if time_budget is not None:
+        deadline = default_timer() + time_budget
+
+    if perturbation > 0:
+        problem = StructureMappingOptimizationProblem(
+            (initial_mapping, unmapped), extra=(target, base), blocks=blocks)
+        rng = Random(perturbation_seed)
+        node = problem.initial
+        for i in range(perturbation):
+            node = problem.random_successor(node, rng)
+        initial_mapping, unmapped = node.state
+
+    evaluator = MappingCostEvaluator(target, base)
+    initial_cost = evaluator.cost(initial_mapping)
+
+    problem = StructureMappingOptimizationProblem(
+        (initial_mapping, unmapped), initial_cost=initial_cost,
+        extra=(target, base), blocks=blocks, max_evaluations=max_evaluations,
+        deadline=deadline, evaluator=evaluator)
+    op_problem = AnnotatedProblem(problem)
 
     solution = next(hill_climbing(op_problem))
-    return dict(solution.state[0])
 
+    # newer versions of py_search wrap the result in a SolutionNode
+    if hasattr(solution, 'state_node'):
+        solution = solution.state_node
+    mapping = solution.state[0]
+
+    return (evaluator.cost(mapping), mapping, op_problem.nodes_expanded,
+            op_problem.nodes_evaluated, problem.budget_hit)
 
-def hungarian_mapping(inames, cnames, target, base):
+
+def snapshot_concept(base):
+    """
+    Returns a detached copy of a concept's counts, along with a copy of the
+    scaling information of its tree, which gives the same mapping costs as
+    the concept. The snapshot is much cheaper to send to another process
+    than the concept (which references its whole tree).
+
+    >>> base = Cobweb3Node()
+    >>> base.increment_counts({('size', '?c1'): 1.0, ('color', '?c1'): 'red'})
+    >>> target = {('size', '?o1'): 2.0, ('color', '?o1'): 'red'}
+    >>> (mapping_cost({'?o1': '?c1'}, target, snapshot_concept(base)) ==
+    ...  mapping_cost({'?o1': '?c1'}, target, base))
+    True
+
+    :param base: A concept
+    :type base: Cobweb3Node
+    :return: A snapshot of the concept
+    :rtype: Cobweb3Node
+    """
+    snapshot = Cobweb3Node()
+    snapshot.count = base.count
+    snapshot.av_counts = deepcopy(base.av_counts)
+    if base.tree is not None:
+        tree = Cobweb3Tree(scaling=base.tree.scaling,
+                           inner_attr_scaling=base.tree.inner_attr_scaling)
+        tree.attr_scales = deepcopy(base.tree.attr_scales)
+        tree.instance_weight = base.tree.instance_weight
+        snapshot.tree = tree
+    return snapshot
+
+
+def group_by_block(inames, cnames, blocks):
+    """
+    Splits the target and base component names into groups that share the
+    same blocking key (see: :func:`get_component_block`).
+
+    >>> blocks = {'?o1': ('a',), '?o2': ('b',), '?c1': ('b',), '?c2': ('c',)}
+    >>> group_by_block(['?o1', '?o2'], ['?c1', '?c2'], blocks)
+    [(['?o1'], []), (['?o2'], ['?c1'])]
+
+    :param inames: the target component names
+    :type inames: collection
+    :param cnames: the base component names
+    :type cnames: collection
+    :param blocks: the blocking key of every component
+    :type blocks: dict
+    :return: the (inames, cnames) of each block that contains a target
+        component
+    :rtype: [([name, ...], [name, ...]), ...]
+    """
+    groups = {}
+    order = []
+    for o in inames:
+        if blocks[o] not in groups:
+            groups[blocks[o]] = ([], [])
+            order.append(blocks[o])
+        groups[blocks[o]][0].append(o)
+    for c in cnames:
+        if blocks[c] in groups:
+            groups[blocks[c]][1].append(c)
+    return [groups[block] for block in order]
+
+
+def munkres_solver(cost_matrix):
+    """
+    Solves an assignment problem using the pure python `munkres
+    <https://pypi.org/project/munkres/>`_ package.
+
+    :param cost_matrix: A matrix (list of rows) of assignment costs, which may
+        contain ``float('inf')`` for forbidden assignments
+    :type cost_matrix: [[float, ...], ...]
+    :return: The (row, column) pairs of a minimum cost assignment
+    :rtype: [(int, int), ...]
+
+    >>> munkres_solver([[4, 1], [2, 8]])
+    [(0, 1), (1, 0)]
+    """
+    return [(row, col) for row, col in Munkres().compute(cost_matrix)]
+
+
+def scipy_solver(cost_matrix):
+    """
+    Solves an assignment problem using scipy's
+    ``scipy.optimize.linear_sum_assignment``, which is much faster than
+    :func:`munkres_solver` on large matrices. Infinite (forbidden) costs are
+    replaced with a finite cost that is larger than any feasible assignment.
+
+    :param cost_matrix: A matrix (list of rows) of assignment costs, which may
+        contain ``float('inf')`` for forbidden assignments
+    :type cost_matrix: [[float, ...], ...]
+    :return: The (row, column) pairs of a minimum cost assignment
+    :rtype: [(int, int), ...]
+    """
+    if linear_sum_assignment is None:
+        raise ImportError("The scipy solver requires scipy to be installed.")
+
+    finite = [v for row in cost_matrix for v in row if v != float('inf')]
+    forbidden = 1.0
+    if finite:
+        forbidden += (max(finite) - min(finite)) * len(cost_matrix)
+        forbidden += max(abs(v) for v in finite)
+    matrix = [[forbidden if v == float('inf') else v for v in row]
+              for row in cost_matrix]
+
+    rows, cols = linear_sum_assignment(matrix)
+    return [(int(row), int(col)) for row, col in zip(rows, cols)]
+
+
+assignment_solvers = {'munkres': munkres_solver, 'scipy': scipy_solver}
+
+
+def get_assignment_solver(solver=None):
+    """
+    Returns the assignment solver function with the given name, which is one
+    of the keys of ``assignment_solvers``. If solver is already a function it
+    is returned unchanged. By default the scipy solver is used when scipy is
+    installed, otherwise the munkres solver is used.
+
+    A solver is any function that takes a cost matrix (a list of rows, which
+    may contain ``float('inf')``) and returns the (row, column) pairs of a
+    minimum cost assignment of the rows.
+
+    >>> get_assignment_solver('munkres') is munkres_solver
+    True
+
+    :param solver: The name of a solver, a solver function, or None
+    :type solver: str, function, or None
+    :return: An assignment solver
+    :rtype: function
+    """
+    if solver is None:
+        if linear_sum_assignment is None:
+            return munkres_solver
+        return scipy_solver
+    if callable(solver):
+        return solver
+    if solver not in assignment_solvers:
+        raise ValueError("Unknown assignment solver: %s" % solver)
+    return assignment_solvers[solver]
+
+
+def hungarian_mapping(inames, cnames, target, base, solver=None):
     """
     Utilizes the hungarian/munkres matching algorithm to compute an initial
     mapping of inames to cnames. The base cost is the expected correct guesses
     if each object is matched to itself (i.e., a new object). Then the cost of
     each object-object match is evaluated by setting each individual object and
-    computing the expected correct guesses.
+    computing the expected correct guesses (see: :func:`mapping_cost_matrix`).
 
     :param inames: the target component names
     :type inames: collection
@@ -242,6 +678,10 @@ def hungarian_mapping(inames, cnames, target, base):
     :type target: :ref:`Instance<instance-rep>` or av_counts obj from concept
     :param base: A concept to map the target to
     :type base: TrestleNode
+    :param solver: The assignment solver to use (see:
+        :func:`get_assignment_solver`), by default scipy is used if it is
+        installed and munkres otherwise.
+    :type solver: str, function, or None
     :return: a mapping for renaming components in the instance.
     :rtype: frozenset
 
@@ -249,15 +689,134 @@ def hungarian_mapping(inames, cnames, target, base):
     cnames = list(cnames)
     inames = list(inames)
 
+    cost_matrix = mapping_cost_matrix(inames, cnames, target, base)
+    indices = get_assignment_solver(solver)(cost_matrix)
+
+    mapping = {}
+    for row, col in indices:
+        if col >= len(cnames):
+            mapping[inames[row]] = inames[row]
+        else:
+            mapping[inames[row]] = cnames[col]
+
+    return frozenset(mapping.items())
+
+
+def mapping_cost_matrix(inames, cnames, target, base):
+    """
+    Computes the cost matrix used by :func:`hungarian_mapping`. Row i contains
+    the :func:`mapping_cost` of mapping inames[i] to each of the cnames,
+    followed by the cost of leaving each of the inames unmapped, which is
+    ``float('inf')`` for every column but the i-th.
+
+    Rather than copying the base and recomputing its expected correct guesses
+    for every pair of components, the expected correct guesses are decomposed
+    into per attribute terms. The terms for the base are computed once, so
+    each pair only recomputes the terms for the attributes that mention the
+    target component.
+
+    >>> from pprint import pprint
+    >>> base = Cobweb3Node()
+    >>> base.increment_counts({('color', '?c1'): 'red', ('size', '?c1'): 1.0,
+    ...                        ('color', '?c2'): 'blue', ('size', '?c2'): 5.0,
+    ...                        ('on', '?c1', '?c2'): True})
+    >>> target = {('color', '?o1'): 'blue', ('size', '?o1'): 4.0,
+    ...           ('color', '?o2'): 'red', ('size', '?o2'): 1.5,
+    ...           ('on', '?o2', '?o1'): True}
+    >>> inames = ['?o1', '?o2']
+    >>> cnames = ['?c1', '?c2']
+    >>> matrix = mapping_cost_matrix(inames, cnames, target, base)
+    >>> pprint([["%0.4f" % v for v in row] for row in matrix])
+    [['-0.2632', '-0.3504', '-0.2500', 'inf'],
+     ['-0.3796', '-0.2613', 'inf', '-0.2500']]
+    >>> all(abs(matrix[i][j] - mapping_cost({o: c}, target, base)) < 1e-9
+    ...     for i, o in enumerate(inames) for j, c in enumerate(cnames))
+    True
+    >>> sorted(hungarian_mapping(inames, cnames, target, base))
+    [('?o1', '?c2'), ('?o2', '?c1')]
+
+    :param inames: the target component names
+    :type inames: list
+    :param cnames: the base component names
+    :type cnames: list
+    :param target: An instance or concept.av_counts object to be mapped to the
+        base concept.
+    :type target: :ref:`Instance<instance-rep>` or av_counts obj from concept
+    :param base: A concept to map the target to
+    :type base: TrestleNode
+    :return: The cost matrix
+    :rtype: [[float, ...], ...]
+    """
+    # the target's counts, as they would be added to the base.
+    if isinstance(next(iter(target.values())), dict):
+        values = target
+        target_count = max([sum([target[attr][val].num if val == cv_key else
+                                 target[attr][val] for val in target[attr]])
+                            for attr in target])
+    else:
+        temp_target = Cobweb3Node()
+        temp_target.tree = base.tree
+        temp_target.increment_counts(target)
+        values = temp_target.av_counts
+        target_count = temp_target.count
+
+    count = base.count + target_count
+    base_guesses = {attr: base.attr_correct_guesses(attr, base.av_counts[attr],
+                                                    count)
+                    for attr in base.attrs()}
+    base_total = sum(base_guesses.values())
+
+    def change(attrs):
+        """
+        Returns how much the correct guesses and the number of attributes of
+        the base change when the given (renamed) target attributes are added.
+        """
+        guesses = 0.0
+        new_attrs = 0
+        for attr in attrs:
+            if attr[0] == '_':
+                continue
+
+            combined = attrs[attr]
+            if attr in base.av_counts:
+                combined = dict(base.av_counts[attr])
+                for val in attrs[attr]:
+                    if val == cv_key:
+                        cv = combined.get(val, ContinuousValue()).copy()
+                        cv.combine(attrs[attr][val])
+                        combined[val] = cv
+                    else:
+                        combined[val] = (combined.get(val, 0) +
+                                         attrs[attr][val])
+
+            if attr in base_guesses:
+                guesses -= base_guesses[attr]
+            else:
+                new_attrs += 1
+            guesses += base.attr_correct_guesses(attr, combined, count)
+
+        return guesses, new_attrs
+
+    def cost(guesses, new_attrs):
+        return -(base_total + guesses) / (len(base_guesses) + new_attrs)
+
+    unmapped_cost = cost(*change(values))
+
     cost_matrix = []
     for o in inames:
+        owned = {}
+        rest = {}
+        for attr in values:
+            if contains_component(o, attr):
+                owned[attr] = values[attr]
+            else:
+                rest[attr] = values[attr]
+        rest_guesses, rest_attrs = change(rest)
+
         row = []
         for c in cnames:
-            nm = {}
-            nm[o] = c
-            cost = mapping_cost({o: c}, target, base)
-            row.append(cost)
-        unmapped_cost = mapping_cost({}, target, base)
+            guesses, new_attrs = change(rename_flat(owned, {o: c}))
+            row.append(cost(rest_guesses + guesses, rest_attrs + new_attrs))
         for other_o in inames:
             if other_o == o:
                 row.append(unmapped_cost)
@@ -265,25 +824,7 @@ def hungarian_mapping(inames, cnames, target, base):
                 row.append(float('inf'))
         cost_matrix.append(row)
 
-    m = Munkres()
-    indices = m.compute(cost_matrix)
-
-    # comments for using scipy hungarian
-    # indices = linear_sum_assignment(cost_matrix)
-
-    mapping = {}
-
-    # for i in range(len(indices[0])):
-    #     row = indices[0][i]
-    #     col = indices[1][i]
-
-    for row, col in indices:
-        if col >= len(cnames):
-            mapping[inames[row]] = inames[row]
-        else:
-            mapping[inames[row]] = cnames[col]
-
-    return frozenset(mapping.items())
+    return cost_matrix
 
 
 def mapping_cost(mapping, target, base):
@@ -327,6 +868,181 @@ def mapping_cost(mapping, target, base):
     return -temp_base.expected_correct_guesses()
 
 
+class MappingCostEvaluator(object):
+    """
+    Computes the :func:`mapping_cost` of many mappings of the same target to
+    the same base, which is what a local search over mappings does.
+
+    :func:`mapping_cost` renames the whole target, copies the whole base, and
+    recomputes the expected correct guesses for every mapping. Instead, the
+    evaluator computes the copied base's values once, and caches the renamed
+    name of each target attribute (keyed by the mapping of the components it
+    contains) and the correct guess terms of each base attribute with each
+    renamed target attribute added to it. Only the attributes that mention
+    components whose mapping has not been seen before are recomputed, so
+    neighboring mappings (e.g., a swap of two components) are cheap to score.
+
+    The cached terms are summed in the same order as
+    :meth:`Cobweb3Node.expected_correct_guesses
+    <concept_formation.cobweb3.Cobweb3Node.expected_correct_guesses>`, so the
+    costs are identical to those of :func:`mapping_cost`.
+
+    >>> base = Cobweb3Node()
+    >>> base.increment_counts({('color', '?c1'): 'red', ('size', '?c1'): 1.0,
+    ...                        ('color', '?c2'): 'blue', ('size', '?c2'): 5.0,
+    ...                        ('on', '?c1', '?c2'): True})
+    >>> target = {('color', '?o1'): 'blue', ('size', '?o1'): 4.0,
+    ...           ('color', '?o2'): 'red', ('size', '?o2'): 1.5,
+    ...           ('on', '?o2', '?o1'): True}
+    >>> evaluator = MappingCostEvaluator(target, base)
+    >>> mapping = {'?o1': '?c2', '?o2': '?o2'}
+    >>> evaluator.cost(mapping) == mapping_cost(mapping, target, base)
+    True
+
+    :param target: the target
+    :type target: an instance or concept.av_counts
+    :param base: the base
+    :type base: a concept
+    """
+
+    def __init__(self, target, base):
+        self.target = target
+        self.base = base
+
+        inames = get_component_names(target)
+        self.target_names = {attr: [n for n in inames
+                                    if contains_component(n, attr)]
+                             for attr in target}
+
+        # the base's values as they are copied by mapping_cost.
+        temp_base = Cobweb3Node()
+        temp_base.update_counts_from_node(base)
+        self.base_values = temp_base.av_counts
+        self.base_attrs = [attr for attr in self.base_values
+                           if attr[0] != '_']
+
+        self.av_target = isinstance(next(iter(target.values())), dict)
+        if self.av_target:
+            target_count = max([sum([target[attr][val].num if val == cv_key
+                                     else target[attr][val] for val in
+                                     target[attr]]) for attr in target])
+            self.weight = None
+        else:
+            target_count = 1
+            if base.tree is not None:
+                target_count = base.tree.instance_weight
+            self.weight = target_count
+        self.count = temp_base.count + target_count
+
+        self.base_terms = {attr: self.terms(attr, self.base_values[attr])
+                           for attr in self.base_attrs}
+        self.renamed = {}
+        self.combined_terms = {}
+
+    def terms(self, attr, values):
+        """
+        Returns the terms that the given values of an attribute add to the
+        expected correct guesses, in order.
+        """
+        return [self.base.attr_correct_guesses(attr, {val: values[val]},
+                                               self.count)
+                for val in values]
+
+    def rename(self, attr, mapping):
+        """
+        Returns the name of a target attribute after renaming it with the
+        mapping (see: :func:`rename_flat`).
+        """
+        key = (attr, tuple([mapping.get(n) for n in self.target_names[attr]]))
+        if key not in self.renamed:
+            if attr in mapping:
+                self.renamed[key] = mapping[attr]
+            elif isinstance(attr, tuple):
+                self.renamed[key] = rename_relation(attr, mapping)
+            else:
+                self.renamed[key] = attr
+        return self.renamed[key]
+
+    def combined(self, attr, renamed_attr):
+        """
+        Returns the values of renamed_attr after the target attribute is added
+        to the base (the way :func:`mapping_cost` adds it).
+        """
+        values = {}
+        for val in self.base_values.get(renamed_attr, ()):
+            if val == cv_key:
+                values[val] = ContinuousValue()
+                values[val].combine(self.base_values[renamed_attr][val])
+            else:
+                values[val] = self.base_values[renamed_attr][val]
+
+        if self.av_target:
+            for val in self.target[attr]:
+                if val == cv_key:
+                    values[val] = values.get(val, ContinuousValue())
+                    values[val].combine(self.target[attr][val])
+                else:
+                    values[val] = (values.get(val, 0) +
+                                   self.target[attr][val])
+        elif isNumber(self.target[attr]):
+            if cv_key not in values:
+                values[cv_key] = ContinuousValue()
+            values[cv_key].update(self.target[attr], self.weight)
+        else:
+            val = self.target[attr]
+            values[val] = values.get(val, 0) + self.weight
+
+        return values
+
+    def attr_terms(self, attr, renamed_attr):
+        """
+        Returns the (cached) correct guess terms of renamed_attr after the
+        target attribute is added to the base.
+        """
+        key = (attr, renamed_attr)
+        if key not in self.combined_terms:
+            self.combined_terms[key] = self.terms(renamed_attr,
+                                                  self.combined(attr,
+                                                                renamed_attr))
+        return self.combined_terms[key]
+
+    def cost(self, mapping):
+        """
+        Returns the :func:`mapping_cost` of the mapping.
+
+        :param mapping: the mapping of target items to base items
+        :type mapping: frozenset or dict
+        :return: the cost of the mapping
+        :rtype: float
+        """
+        if isinstance(mapping, frozenset):
+            mapping = dict(mapping)
+
+        renamed = {}
+        for attr in self.target:
+            renamed[self.rename(attr, mapping)] = attr
+
+        correct_guesses = 0.0
+        attr_count = 0
+        for attr in self.base_attrs:
+            attr_count += 1
+            if attr in renamed:
+                terms = self.attr_terms(renamed[attr], attr)
+            else:
+                terms = self.base_terms[attr]
+            for term in terms:
+                correct_guesses += term
+
+        for renamed_attr in renamed:
+            if renamed_attr in self.base_values or renamed_attr[0] == '_':
+                continue
+            attr_count += 1
+            for term in self.attr_terms(renamed[renamed_attr], renamed_attr):
+                correct_guesses += term
+
+        return -(correct_guesses / attr_count)
+
+
 class StructureMappingOptimizationProblem(Problem):
     """
     A class for describing a structure mapping problem to be solved using the
@@ -337,13 +1053,70 @@ class StructureMappingOptimizationProblem(Problem):
     Unlike StructureMappingProblem, this class uses a local search approach;
     i.e., given an initial mapping it tries to improve the mapping by permuting
     it.
+
+    If blocks are provided (a dict of the blocking key of every component, see:
+    :func:`flat_match`), then only successors that map components with the
+    same blocking key are generated.
+
+    If max_evaluations or a deadline (a :func:`timeit.default_timer` value)
+    are provided, then no more successors are generated once the number of
+    evaluated mappings reaches max_evaluations or the deadline has passed, so
+    the search returns the best mapping found so far. ``budget_hit`` records
+    whether this happened.
+
+    If a :class:`MappingCostEvaluator` for the target and base is provided,
+    then it is used to score the nodes, rather than :func:`mapping_cost`.
     """
+    def __init__(self, initial, goal=None, initial_cost=0, extra=None,
+                 blocks=None, max_evaluations=None, deadline=None,
+                 evaluator=None):
+        super(StructureMappingOptimizationProblem, self).__init__(
+            initial, goal=goal, initial_cost=initial_cost, extra=extra)
+        self.blocks = blocks
+        self.evaluator = evaluator
+        self.max_evaluations = max_evaluations
+        self.deadline = deadline
+        self.evaluations = 0
+        self.budget_hit = False
+
+    def out_of_budget(self):
+        """
+        Returns whether the search has used up its budget.
+        """
+        if ((self.max_evaluations is not None and
+             self.evaluations >= self.max_evaluations) or
+                (self.deadline is not None and
+                 default_timer() > self.deadline)):
+            self.budget_hit = True
+        return self.budget_hit
+
+    def can_swap(self, o1, o2, mapping):
+        """
+        Returns whether swapping the mappings of o1 and o2 respects the
+        blocks.
+        """
+        if self.blocks is None:
+            return True
+        return ((mapping[o2] == o2 or
+                 self.blocks[o1] == self.blocks[mapping[o2]]) and
+                (mapping[o1] == o1 or
+                 self.blocks[o2] == self.blocks[mapping[o1]]))
+
+    def can_assign(self, o1, o2):
+        """
+        Returns whether mapping o1 to the unmapped o2 respects the blocks.
+        """
+        return self.blocks is None or self.blocks[o1] == self.blocks[o2]
+
     def node_value(self, node):
         """
         The value of a node (based on mapping_cost).
         """
         # return node.cost()
+        self.evaluations += 1
         mapping, unmapped_cnames = node.state
+        if self.evaluator is not None:
+            return self.evaluator.cost(mapping)
         target, base = node.extra
         return mapping_cost(mapping, target, base)
 
@@ -383,34 +1156,62 @@ class StructureMappingOptimizationProblem(Problem):
         return Node((new_mapping,
                     frozenset(new_unmapped_cnames)), extra=node.extra)
 
-    def random_successor(self, node):
+    def random_successor(self, node, rng=None):
         """
         Similar to the successor function, but generates only a single random
-        successor.
+        successor. If a random number generator is provided, then it is used
+        (and the components are considered in sorted order), so that the
+        successor only depends on its seed.
         """
         mapping, unmapped_cnames = node.state
         target, base = node.extra
         mapping = dict(mapping)
 
-        o1 = choice(list(mapping))
+        pick = choice
+        draw = random
+        names = list(mapping)
+        unmapped = list(unmapped_cnames)
+        if rng is not None:
+            pick = rng.choice
+            draw = rng.random
+            names.sort(key=str)
+            unmapped.sort(key=str)
+
+        o1 = pick(names)
         while mapping[o1] == o1 and len(unmapped_cnames) == 0:
-            o1 = choice(list(mapping))
+            o1 = pick(names)
+
+        possible_flips = [v for v in names if (v != o1 and
+                                               not (mapping[o1] == o1 or
+                                                    mapping[v] == v) and
+                                               self.can_swap(o1, v,
+                                                             mapping))]
+        possible_unmapped = [c for c in unmapped if self.can_assign(o1, c)]
 
-        possible_flips = [v for v in mapping if (v != o1 and
-                                                 not (mapping[o1] == o1 or
-                                                      mapping[v] == v))]
+        if not possible_flips and not possible_unmapped:
+            return node
 
-        if random() <= len(possible_flips) / (len(possible_flips) +
-                                              len(unmapped_cnames)):
-            o2 = choice(possible_flips)
+        if draw() <= len(possible_flips) / (len(possible_flips) +
+                                            len(possible_unmapped)):
+            o2 = pick(possible_flips)
             return self.swap_two(o1, o2, mapping, unmapped_cnames, target,
                                  base, node)
         else:
-            o2 = choice(list(unmapped_cnames))
+            o2 = pick(possible_unmapped)
             return self.swap_unnamed(o1, o2, mapping, unmapped_cnames, target,
                                      base, node)
 
     def successors(self, node):
+        """
+        An iterator that returns all successors, until the search runs out of
+        budget.
+        """
+        for successor in self.all_successors(node):
+            if self.out_of_budget():
+                return
+            yield successor
+
+    def all_successors(self, node):
         """
         An iterator that returns all successors.
         """
@@ -418,15 +1219,26 @@ class StructureMappingOptimizationProblem(Problem):
         target, base = node.extra
         mapping = dict(mapping)
 
-        for o1, o2 in combinations(mapping, 2):
-            if o1 == o2 or (mapping[o1] == o1 and mapping[o2] == o2):
-                continue
+        if self.blocks is None:
+            groups = [list(mapping)]
+        else:
+            groups = [inames for inames, cnames in
+                      group_by_block(mapping, (), self.blocks)]
+
+        for group in groups:
+            for o1, o2 in combinations(group, 2):
+                if o1 == o2 or (mapping[o1] == o1 and mapping[o2] == o2):
+                    continue
+                if not self.can_swap(o1, o2, mapping):
+                    continue
 
-            yield self.swap_two(o1, o2, mapping, unmapped_cnames, target,
-                                base, node)
+                yield self.swap_two(o1, o2, mapping, unmapped_cnames, target,
+                                    base, node)
 
         for o1 in mapping:
             for o2 in unmapped_cnames:
+                if not self.can_assign(o1, o2):
+                    continue
                 yield self.swap_unnamed(o1, o2, mapping, unmapped_cnames,
                                         target, base, node)
 
@@ -491,14 +1303,53 @@ class StructureMapper(Preprocessor):
 
     :param base: A concept to structure map the instance to
     :type base: TrestleNode
-    :param gensym: a function that returns unique object names (str) on each
-        call
-    :type gensym: function
+    :param instrumentation: An optional object to record mapping statistics
+        and timings in
+    :type instrumentation: :class:`Instrumentation
+        <concept_formation.instrumentation.Instrumentation>`
+    :param blocking_keys: Attribute names whose values must agree for two
+        components to be mapped (see: :func:`flat_match`)
+    :type blocking_keys: [str, ...] or None
+    :param max_evaluations: The maximum number of mappings evaluated by the
+        search (see: :func:`flat_match`)
+    :type max_evaluations: int or None
+    :param time_budget: The time (in seconds) after which the search returns
+        the best mapping found so far (see: :func:`flat_match`)
+    :type time_budget: float or None
+    :param cache: A cache of the mappings found for previous targets. The
+        mapping of a previous target with the same structure (see:
+        :func:`structure_signature`) to a base with the same components is
+        used as the initial mapping of the search, which skips the hungarian
+        matching.
+    :type cache: :class:`LRUCache <concept_formation.utils.LRUCache>` or None
+    :param restarts: The number of additional, randomly perturbed, searches
+        (see: :func:`flat_match`)
+    :type restarts: int
+    :param restart_seed: The seed of the first restart
+    :type restart_seed: int
+    :param pool: A pool of worker processes to run the searches in
+    :type pool: multiprocessing.Pool or None
+    :param interner: A table the attributes of the mapped instances are
+        interned in, so that they are shared with the concepts they are
+        incorporated into
+    :type interner: :class:`InternTable <concept_formation.utils.InternTable>`
+        or None
     :return: A flattened and mapped copy of the instance
     :rtype: instance
     """
-    def __init__(self, base):
+    def __init__(self, base, instrumentation=None, blocking_keys=None,
+                 max_evaluations=None, time_budget=None, cache=None,
+                 restarts=0, restart_seed=0, pool=None, interner=None):
         self.base = base
+        self.instrumentation = instrumentation
+        self.blocking_keys = blocking_keys
+        self.max_evaluations = max_evaluations
+        self.time_budget = time_budget
+        self.cache = cache
+        self.restarts = restarts
+        self.restart_seed = restart_seed
+        self.pool = pool
+        self.interner = interner
         self.mapping = None
         self.reverse_mapping = None
 
@@ -523,9 +1374,43 @@ class StructureMapper(Preprocessor):
         :return: The renamed instance or av_counts table
         :rtype: instance or av_counts table
         """
-        self.mapping = flat_match(target, self.base, initial_mapping)
+        key = None
+        if self.cache is not None and initial_mapping is None:
+            signature, names = structure_signature(target)
+            key = (signature,
+                   frozenset(get_component_names(self.base.av_counts)))
+            cached = self.cache.get(key)
+            if cached is not None:
+                initial_mapping = frozenset(zip(names, cached))
+
+        inst = self.instrumentation
+        if inst is None:
+            self.mapping = flat_match(target, self.base, initial_mapping,
+                                      blocking_keys=self.blocking_keys,
+                                      max_evaluations=self.max_evaluations,
+                                      time_budget=self.time_budget,
+                                      restarts=self.restarts,
+                                      restart_seed=self.restart_seed,
+                                      pool=self.pool)
+        else:
+            inst.begin()
+            try:
+                start = default_timer()
+                self.mapping = flat_match(
+                    target, self.base, initial_mapping, instrumentation=inst,
+                    blocking_keys=self.blocking_keys,
+                    max_evaluations=self.max_evaluations,
+                    time_budget=self.time_budget, restarts=self.restarts,
+                    restart_seed=self.restart_seed, pool=self.pool)
+                inst.add_time('structure_mapping', default_timer() - start)
+            finally:
+                inst.end()
+
+        if key is not None and self.mapping:
+            self.cache.put(key, tuple(self.mapping.get(o, o) for o in names))
+
         self.reverse_mapping = {self.mapping[o]: o for o in self.mapping}
-        return rename_flat(target, self.mapping)
+        return rename_flat(target, self.mapping, self.interner)
 
     def undo_transform(self, target):
         """
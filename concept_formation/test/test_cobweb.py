@@ -2,10 +2,21 @@ from __future__ import print_function, unicode_literals
 from __future__ import absolute_import, division
 import unittest
 import random
+import os
+import signal
 
 from concept_formation.cobweb import CobwebTree
+from concept_formation.cobweb import CobwebNode
+from concept_formation.cobweb import other_key
+from concept_formation.parallel import merge_trees
+from concept_formation.parallel import CobwebForest
+from concept_formation.parallel import WorkerError
+from concept_formation.operator_policy import OperatorPolicy
+from concept_formation.instrumentation import Instrumentation
+from concept_formation.utils import LRUCache
+from concept_formation.utils import AliasTable
 
-def verify_counts(node):
+def verify_counts(node, tolerance=0.0):
     """
     Checks the property that the counts of the children sum to the same
     count as the parent. This is/was useful when debugging. If you are
@@ -39,17 +50,62 @@ def verify_counts(node):
         print("Parent: %i" % node.count)
         for child in node.children:
             print("Child: %i" % child.count)
-    assert temp_count == 0
+    assert abs(temp_count) <= tolerance
 
     for attr in temp:
         for val in temp[attr]:
             if temp[attr][val] != 0.0:
                 print(node)
 
-            assert temp[attr][val] == 0.0
+            assert abs(temp[attr][val]) <= tolerance
 
     for child in node.children:
-        verify_counts(child)
+        verify_counts(child, tolerance)
+
+def verify_structure(node):
+    """
+    Checks that the cached subtree sizes and depths of the concepts match
+    their actual values.
+    """
+    depth = 0
+    temp = node
+    while temp.parent is not None:
+        temp = temp.parent
+        depth += 1
+    assert node.depth() == depth
+
+    size = 1
+    for child in node.children:
+        assert child.parent is node
+        size += verify_structure(child)
+    assert node.num_concepts() == size
+    return size
+
+def table_probs(table):
+    """
+    Returns the probability of sampling each value from an alias table.
+    """
+    n = len(table.values)
+    probs = {v: 0.0 for v in table.values}
+    for i, v in enumerate(table.values):
+        probs[v] += table.prob[i] / n
+        probs[table.values[table.alias[i]]] += (1 - table.prob[i]) / n
+    return probs
+
+def verify_choice_tables(tree):
+    """
+    Checks that the cached choice tables of every concept match the tables
+    built from its current counts, then caches the tables of every concept.
+    """
+    for node in tree.preorder():
+        for attr in node.attrs('all'):
+            for allow_none in [True, False]:
+                table = node._choice_table(attr, allow_none)
+                fresh = AliasTable(node.get_weighted_values(attr, allow_none))
+                assert set(table.best) == set(fresh.best)
+                probs = table_probs(fresh)
+                for v, p in table_probs(table).items():
+                    assert abs(p - probs[v]) < 1e-9
 
 class TestCobweb(unittest.TestCase):
 
@@ -62,5 +118,411 @@ class TestCobweb(unittest.TestCase):
             tree.ifit(data)
         verify_counts(tree.root)
 
+    def test_cobweb_decay(self):
+        tree = CobwebTree(decay=0.95, prune_threshold=0.05)
+        for i in range(200):
+            tree.ifit({'a1': random.choice(['v1', 'v2']), 'a2': 'old'})
+        for i in range(200):
+            tree.ifit({'a1': random.choice(['v3', 'v4']), 'a2': 'new'})
+        tree.renormalize()
+        assert tree.root.probability('a2', 'new') > 0.99
+        assert tree.root.count < 1 / (1 - 0.95)
+        assert tree.root.num_concepts() < 100
+        verify_counts(tree.root, 1e-9)
+        verify_structure(tree.root)
+
+        # pruning removes the counts of the pruned concepts from their
+        # ancestors.
+        tree = CobwebTree(decay=0.9, prune_threshold=0.3)
+        for i in range(400):
+            tree.ifit({'a1': random.choice(['v1', 'v2', 'v3', 'v4']),
+                       'a2': random.choice(['v1', 'v2'])})
+            verify_counts(tree.root, 1e-9)
+
+    def test_merge_trees(self):
+        trees = []
+        for t in range(3):
+            tree = CobwebTree()
+            for i in range(40):
+                data = {}
+                data['a1'] = random.choice(['v1', 'v2', 'v3', 'v4'])
+                data['a2'] = random.choice(['v1', 'v2', 'v3', 'v4'])
+                tree.ifit(data)
+            trees.append(tree)
+        merged = merge_trees(*trees)
+        verify_counts(merged.root)
+        verify_structure(merged.root)
+        assert merged.root.count == 120
+        assert trees[0].root.count == 40
+
+    def test_merge_deep_trees(self):
+        # a chain of concepts that each split off one instance as a leaf.
+        instances = [{'a': 'v%i' % i} for i in range(300)]
+        tree = CobwebTree(decay=0.99)
+        node = tree.root
+        for i, instance in enumerate(instances):
+            for other in instances[i:]:
+                node.increment_counts(other)
+            for child_instance in [instance, None]:
+                if child_instance is None and i + 1 == len(instances):
+                    break
+                child = CobwebNode()
+                child.tree = tree
+                child.parent = node
+                node.children.append(child)
+                if child_instance is not None:
+                    child.increment_counts(child_instance)
+            node = child
+        tree._structure_changed()
+        assert max(c.depth() for c in tree.leaves()) == 300
+
+        other = CobwebTree()
+        other.fit(instances[:10] + [{'a': 'new'}])
+        merged = merge_trees(tree, other)
+        verify_counts(merged.root)
+        verify_structure(merged.root)
+        assert merged.root.count == 311
+        assert merged.decay == 0.99
+        for node in merged.preorder():
+            assert node.tree is merged
+        assert tree.root.count == 300
+        assert all(node.tree is tree for node in tree.preorder())
+
+    def test_forest_voting(self):
+        # round-robin partitioning sends the even instances to the first tree
+        # and the odd instances to the second.
+        instances = []
+        for i in range(10):
+            instances.append({'a': 'x', 'b': 'y', 'c': 'p'})
+            if i < 4:
+                instances.append({'a': 'x', 'b': 'w', 'c': 'q'})
+            else:
+                instances.append({'a': 'x', 'b': 'y', 'c': 'r'})
+
+        with CobwebForest(CobwebTree, n_workers=2) as forest:
+            forest.fit(instances)
+            trees = forest.get_trees()
+            assert [t.root.count for t in trees] == [10, 10]
+
+            # the first tree votes with its whole root (10 instances of p)
+            # and the second with its leaf of 4 instances of q.
+            concept = forest.categorize({'b': 'w'})
+            assert concept.count == 14
+            assert concept.av_counts['c'] == {'p': 10, 'q': 4}
+            assert trees[1].categorize({'b': 'w'}).predict('c') == 'q'
+            assert forest.predict({'b': 'w'}, 'c') == 'p'
+            assert forest.infer_missing({'b': 'w'}) == {'a': 'x', 'b': 'w',
+                                                        'c': 'p'}
+
+            merged = forest.merge()
+            verify_counts(merged.root)
+            assert merged.root.count == 20
+
+    def test_forest_hash_partition(self):
+        instances = [{'a': 'v%i' % (i % 5)} for i in range(50)]
+        with CobwebForest(CobwebTree, n_workers=3, partition="hash",
+                          chunk_size=7) as forest:
+            forest.fit(instances)
+            trees = forest.get_trees()
+
+        # identical instances are always sent to the same tree.
+        assert sum([t.root.count for t in trees]) == 50
+        for i in range(5):
+            counts = [t.root.av_counts['a'].get('v%i' % i, 0) for t in trees]
+            assert sorted(counts) == [0, 0, 10]
+
+    def test_forest_worker_failure(self):
+        with CobwebForest(CobwebTree, n_workers=2) as forest:
+            forest.fit([{'a': 'x'}, {'a': [1]}, {'a': 'y'}])
+            self.assertRaises(WorkerError, forest.categorize, {'a': 'x'})
+            # the failure is reported by every query, not just the first.
+            self.assertRaises(WorkerError, forest.predict, {}, 'a')
+
+            # clearing recovers the failed worker.
+            forest.clear()
+            forest.fit([{'a': 'x'}, {'a': 'x'}])
+            assert forest.categorize({}).count == 2
+            assert forest.predict({}, 'a') == 'x'
+
+    def test_forest_worker_killed(self):
+        forest = CobwebForest(CobwebTree, n_workers=3, chunk_size=1)
+        workers = list(forest.workers)
+        try:
+            with forest:
+                forest.fit([{'a': 'x'}, {'a': 'y'}, {'a': 'z'}])
+                os.kill(workers[1].pid, signal.SIGKILL)
+                workers[1].join()
+                self.assertRaises(WorkerError, forest.categorize, {'a': 'x'})
+                self.assertRaises(WorkerError, forest.fit,
+                                  [{'a': 'x'}, {'a': 'y'}])
+                raise KeyError('body')
+        except KeyError as e:
+            # closing the forest does not hide the original exception.
+            assert e.args == ('body',)
+
+        assert forest.workers == []
+        for worker in workers:
+            assert not worker.is_alive()
+
+    def test_cached_structure(self):
+        tree = CobwebTree(decay=0.9, prune_threshold=0.05)
+        for i in range(300):
+            data = {}
+            data['a1'] = random.choice(['v1', 'v2', 'v3', 'v4'])
+            data['a2'] = random.choice(['v1', 'v2', 'v3', 'v4'])
+            tree.ifit(data)
+            if i % 30 == 0:
+                verify_structure(tree.root)
+        verify_structure(tree.root)
+
+        nodes = list(tree.preorder())
+        assert len(nodes) == tree.root.num_concepts()
+        assert set(tree.postorder()) == set(nodes)
+        assert set(tree.level_order()) == set(nodes)
+        assert set(tree.leaves()) == set(n for n in nodes if not n.children)
+
+    def test_categorize_cache(self):
+        tree = CobwebTree(decay=0.8, prune_threshold=0.2)
+        tree.categorize_cache = LRUCache(10)
+        queries = [{'a1': 'v1', 'a2': 'v1'}, {'a1': 'v2'}, {'a2': 'v3'}]
+
+        def check_queries():
+            for instance in queries:
+                concept = tree.categorize(instance)
+                assert concept is tree._cobweb_categorize(instance)
+                assert concept in set(tree.preorder())
+
+        for i in range(60):
+            tree.ifit({'a1': random.choice(['v1', 'v2', 'v3', 'v4']),
+                       'a2': random.choice(['v1', 'v2', 'v3', 'v4'])})
+            check_queries()
+
+        misses = tree.categorize_cache.misses
+        check_queries()
+        assert tree.categorize_cache.misses == misses
+        assert tree.categorize_cache.hits >= len(queries)
+
+        # renormalizing prunes and restructures the tree.
+        tree.renormalize()
+        check_queries()
+        assert tree.categorize_cache.misses == misses + len(queries)
+
+        root = tree.root
+        tree.clear()
+        assert len(tree.categorize_cache) == 0
+        assert tree.categorize(queries[0]) is tree.root
+        assert tree.root is not root
+
+        # the cached root is no longer the best concept once it is split.
+        tree.ifit({'a1': 'v1', 'a2': 'v1'})
+        assert tree.infer_missing({'a1': 'v2'}) == {'a1': 'v2', 'a2': 'v1'}
+        tree.ifit({'a1': 'v2', 'a2': 'v2'})
+        assert tree.infer_missing({'a1': 'v2'}) == {'a1': 'v2', 'a2': 'v2'}
+
+    def test_early_stopping(self):
+        tree = CobwebTree()
+        for i in range(100):
+            tree.ifit({'a1': random.choice(['v1', 'v2', 'v3', 'v4']),
+                       'a2': random.choice(['v1', 'v2', 'v3', 'v4']),
+                       'a3': 'v1' if i % 3 else 'v2'})
+
+        for i in range(20):
+            instance = {'a1': random.choice(['v1', 'v2', 'v3', 'v4']),
+                        'a2': random.choice(['v1', 'v2', 'v3', 'v4'])}
+
+            # ties are broken randomly, so every categorization of the
+            # instance uses the same random state.
+            state = random.getstate()
+            leaf, path = tree.categorize(instance, return_path=True)
+            assert path[0] is tree.root and path[-1] is leaf
+            assert not leaf.children
+            for parent, child in zip(path, path[1:]):
+                assert child.parent is parent
+
+            for depth in range(len(path) + 1):
+                random.setstate(state)
+                concept, p = tree.categorize(instance, max_depth=depth,
+                                             return_path=True)
+                assert p == path[:depth + 1]
+                assert concept is p[-1]
+                assert concept.depth() == min(depth, len(path) - 1)
+
+            for min_count in [1, 3, 10, 50]:
+                random.setstate(state)
+                concept = tree.categorize(instance, min_count=min_count)
+                stop = 0
+                while (stop + 1 < len(path) and
+                       path[stop + 1].count >= min_count):
+                    stop += 1
+                assert concept is path[stop]
+
+            random.setstate(state)
+            concept = tree.categorize(instance,
+                                      stop_when=lambda c: c.count < 20)
+            assert concept is [c for c in path
+                               if c.count < 20 or c is leaf][0]
+
+            inferred = tree.infer_missing(instance, max_depth=0)
+            assert inferred['a3'] == 'v1'
+
+        # stopping early is not cached, nor served from the cache.
+        tree.categorize_cache = LRUCache(10)
+        leaf = tree.categorize(instance)
+        assert tree.categorize(instance, max_depth=0) is tree.root
+        assert tree.categorize(instance, min_count=1e9) is tree.root
+        assert tree.categorize(instance) is leaf
+        assert len(tree.categorize_cache) == 1
+        assert tree.categorize_cache.hits == 1
+        assert tree.categorize_cache.misses == 1
+
+    def test_choice_tables(self):
+        tree = CobwebTree()
+        tree.fit([{'a': 'x'}, {'a': 'x'}, {'a': 'y'}], randomize_first=False)
+        table = tree.root._choice_table('a')
+        assert tree.root._choice_table('a') is table
+        assert tree.root.predict('a') == 'x'
+        for i in range(3):
+            tree.ifit({'a': 'y'})
+        assert tree.root._choice_table('a') is not table
+        assert tree.root.predict('a') == 'y'
+
+        # decay, pruning, value caps, merges and splits all change the counts
+        # of concepts that already have cached tables.
+        trees = [CobwebTree(decay=0.9, prune_threshold=0.3,
+                            value_caps={'a1': 3}),
+                 CobwebTree(sparse=True)]
+        for tree in trees:
+            for i in range(150):
+                tree.ifit({'a1': random.choice(['v1', 'v2', 'v3', 'v4']),
+                           'a2': random.choice(['v1', 'v2'])})
+                verify_choice_tables(tree)
+                if i % 10 == 0:
+                    tree.renormalize()
+                    verify_choice_tables(tree)
+
+        # merging sorts the concepts of one tree into the existing concepts
+        # of a copy of the other.
+        for sparse in [False, True]:
+            tree = CobwebTree(sparse=sparse)
+            tree.fit([{'a1': 'v1'}, {'a1': 'v2'}, {'a1': 'v1'}])
+            verify_choice_tables(tree)
+            other = CobwebTree(sparse=sparse)
+            other.fit([{'a1': 'v2'}, {'a1': 'v2'}, {'a1': 'v3'}])
+            merged = merge_trees(tree, tree, other)
+            verify_choice_tables(merged)
+
+    def test_bounded_two_best_children(self):
+        tree = CobwebTree()
+        for i in range(30):
+            tree.root.increment_counts({'a1': 'v%i' % (i % 6), 'a2': 'v1'})
+            tree.root.create_new_child({'a1': 'v%i' % (i % 6), 'a2': 'v1'})
+        root = tree.root
+        assert len(root.children) >= root._bound_min_children
+
+        for i in range(50):
+            instance = {'a1': 'v%i' % random.randint(0, 7),
+                        'a2': random.choice(['v1', 'v2'])}
+            state = random.getstate()
+            bounded = root.two_best_children(instance)
+            random.setstate(state)
+            root._bound_min_children = len(root.children) + 1
+            full = root.two_best_children(instance)
+            del root._bound_min_children
+            assert bounded == full
+
+    def test_operator_policy(self):
+        for policy in [OperatorPolicy(max_depth=0),
+                       OperatorPolicy(every=1000),
+                       OperatorPolicy(time_budget=0)]:
+            tree = CobwebTree(operator_policy=policy)
+            tree.instrumentation = Instrumentation()
+            for i in range(100):
+                data = {}
+                data['a1'] = random.choice(['v1', 'v2', 'v3', 'v4'])
+                data['a2'] = random.choice(['v1', 'v2', 'v3', 'v4'])
+                tree.ifit(data)
+            verify_counts(tree.root)
+            counters = tree.instrumentation.counters
+            assert counters.get('op_merge', 0) == 0
+            assert counters.get('op_split', 0) == 0
+            assert policy.instances == 100
+
+    def test_instrumentation_after_error(self):
+        class FailingPolicy(OperatorPolicy):
+            def operations(self, depth):
+                raise RuntimeError("policy failed")
+
+        tree = CobwebTree(operator_policy=FailingPolicy())
+        tree.instrumentation = Instrumentation(trace=True)
+        tree.fit([{'a': 'x'}, {'a': 'y'}], randomize_first=False)
+        self.assertRaises(RuntimeError, tree.ifit, {'a': 'z'})
+        tree.operator_policy = None
+        tree.ifit({'a': 'z'})
+        traces = tree.instrumentation.traces
+        assert len(traces) == 4
+        assert traces[-1]['counters']['instances'] == 1
+
+    def test_sparse(self):
+        tree = CobwebTree(sparse=True)
+        words = ['w%i' % i for i in range(50)]
+        for i in range(200):
+            tree.ifit({w: True for w in random.sample(words, 4)})
+            # instances without any (non-hidden) attributes.
+            if i % 50 == 0:
+                tree.ifit({})
+                tree.ifit({'_id': i})
+        verify_counts(tree.root)
+
+        instances = [{w: True for w in random.sample(words, 4)}, {},
+                     {'_id': 1}]
+        for node in tree.preorder():
+            dense_ecg = CobwebNode.expected_correct_guesses(node)
+            assert abs(node.expected_correct_guesses() - dense_ecg) < 1e-9
+            if not node.children:
+                continue
+            for instance in instances:
+                for child in node.children:
+                    sparse_cu = node.cu_for_insert(child, instance)
+                    dense_cu = CobwebNode.cu_for_insert(node, child, instance)
+                    assert abs(sparse_cu - dense_cu) < 1e-9
+                sparse_cu = node.cu_for_new_child(instance)
+                dense_cu = CobwebNode.cu_for_new_child(node, instance)
+                assert abs(sparse_cu - dense_cu) < 1e-9
+                if len(node.children) > 1:
+                    best1, best2 = node.children[:2]
+                    sparse_cu = node.cu_for_merge(best1, best2, instance)
+                    dense_cu = CobwebNode.cu_for_merge(node, best1, best2,
+                                                       instance)
+                    assert abs(sparse_cu - dense_cu) < 1e-9
+
+    def test_value_caps(self):
+        tree = CobwebTree(decay=0.99, value_caps={'id': 3})
+        for i in range(200):
+            tree.ifit({'id': 'id%i' % random.randint(0, 50),
+                       'a1': random.choice(['v1', 'v2', 'v3', 'v4'])})
+        for node in tree.preorder():
+            assert len(node.av_counts['id']) <= 4
+            total = sum(node.av_counts['id'].values())
+            assert abs(total - node.count) < 1e-6
+            assert node.predict('id') != other_key
+
+    def test_value_caps_heavy_hitter(self):
+        # the first values fill every concept's table before a frequent value
+        # arrives mixed in with a long tail of unique values.
+        instances = [{'id': v, '_hot': 'no'} for v in ['a'] * 10 + ['b'] * 10]
+        for i in range(30):
+            instances.append({'id': 'hot', '_hot': 'yes'})
+            instances.append({'id': 'tail%i' % i, '_hot': 'no'})
+        tree = CobwebTree(value_caps={'id': 3})
+        tree.fit(instances, randomize_first=False)
+        assert tree.root.predict('id') == 'hot'
+
+        # Space-Saving keeps every value with more than count / cap instances
+        for node in tree.preorder():
+            if node.av_counts['_hot'].get('yes', 0) > node.count / 3:
+                assert 'hot' in node.av_counts['id']
+            total = sum(node.av_counts['id'].values())
+            assert abs(total - node.count) < 1e-6
+
 if __name__ == "__main__":
     unittest.main()
@@ -6,8 +6,11 @@ from numbers import Number
 
 from concept_formation.cobweb3 import cv_key
 from concept_formation.cobweb3 import Cobweb3Tree
+from concept_formation.parallel import CobwebForest
+from concept_formation.parallel import merge_trees
+from concept_formation.test.test_cobweb import verify_choice_tables
 
-def verify_counts(node):
+def verify_counts(node, tolerance=0.0):
     """
     Checks the property that the counts of the children sum to the same
     count as the parent. This is/was useful when debugging. This is modified
@@ -44,17 +47,17 @@ def verify_counts(node):
                 else:
                     temp[attr][val] -= child.av_counts[attr][val]
 
-    assert temp_count == 0
+    assert abs(temp_count) <= tolerance
 
     for attr in temp:
         if isinstance(temp[attr], Number):
-            assert temp[attr] == 0.0
+            assert abs(temp[attr]) <= tolerance
         else:
             for val in temp[attr]:
-                assert temp[attr][val] == 0.0
+                assert abs(temp[attr][val]) <= tolerance
 
     for child in node.children:
-        verify_counts(child)
+        verify_counts(child, tolerance)
 
 
 class TestCobweb(unittest.TestCase):
@@ -77,6 +80,55 @@ class TestCobweb(unittest.TestCase):
             tree.ifit(data)
         verify_counts(tree.root)
 
+    def test_cobweb3_decay(self):
+        tree = Cobweb3Tree(decay=0.95, prune_threshold=0.05)
+        for i in range(200):
+            tree.ifit({'x': random.normalvariate(0, 1)})
+        for i in range(200):
+            tree.ifit({'x': random.normalvariate(10, 1)})
+        tree.renormalize()
+        assert tree.root.av_counts['x'][cv_key].mean > 9
+        assert tree.root.count < 1 / (1 - 0.95)
+        verify_counts(tree.root, 1e-9)
+
+    def test_choice_tables(self):
+        tree = Cobweb3Tree(decay=0.9, prune_threshold=0.3)
+        for i in range(100):
+            instance = {'c': random.choice(['v1', 'v2', 'v3'])}
+            if random.random() < 0.5:
+                instance['x'] = random.normalvariate(0, 1)
+            tree.ifit(instance)
+            verify_choice_tables(tree)
+            for node in tree.preorder():
+                if 'x' in node.av_counts:
+                    mean = node.av_counts['x'][cv_key].mean
+                    assert node.predict('x', allow_none=False) == mean
+            if i % 10 == 0:
+                tree.renormalize()
+                verify_choice_tables(tree)
+
+        tree = Cobweb3Tree()
+        tree.fit([{'x': 1.0}, {'c': 'v1'}, {'x': 2.0, 'c': 'v2'}])
+        verify_choice_tables(tree)
+        other = Cobweb3Tree()
+        other.fit([{'x': 3.0}, {'x': 4.0}, {'c': 'v1'}])
+        merged = merge_trees(tree, tree, other)
+        verify_choice_tables(merged)
+
+    def test_forest_average(self):
+        with CobwebForest(Cobweb3Tree, n_workers=2) as forest:
+            forest.fit([{'x': 1.0, 'c': 'a'}, {'x': 4.0, 'c': 'b'},
+                        {'x': 1.0, 'c': 'a'}])
+            concept = forest.categorize({})
+
+            # numeric attributes are combined into a count-weighted mean.
+            assert concept.count == 3
+            assert abs(concept.av_counts['x'][cv_key].mean - 2.0) < 1e-9
+            assert abs(forest.predict({}, 'x') - 2.0) < 1e-9
+            assert forest.predict({}, 'c') == 'a'
+            inferred = forest.infer_missing({'c': 'b'})
+            assert abs(inferred['x'] - 2.0) < 1e-9
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,76 @@
+from __future__ import print_function, unicode_literals
+from __future__ import absolute_import, division
+import unittest
+from itertools import count
+from itertools import islice
+from multiprocessing import Pool
+
+from concept_formation.preprocessor import Pipeline
+from concept_formation.preprocessor import Tuplizer
+from concept_formation.preprocessor import NameStandardizer
+from concept_formation.preprocessor import SubComponentProcessor
+from concept_formation.preprocessor import NumericToNominal
+from concept_formation.preprocessor import Flattener
+from concept_formation.preprocessor import ListProcessor
+from concept_formation.preprocessor import _reset_gensym
+
+
+def nested_instance(depth):
+    """
+    Returns an instance whose objects are nested depth levels deep, with a
+    short list at every level.
+    """
+    instance = {'a': 'v'}
+    for i in range(depth):
+        instance = {'?o%i' % i: instance, 'l%i' % i: ['x', 'y']}
+    return instance
+
+
+class TestPreprocessor(unittest.TestCase):
+
+    def test_deep_nesting(self):
+        depth = 2000
+        instance = nested_instance(depth)
+
+        flat = Flattener().transform(NameStandardizer().transform(instance))
+        assert len(flat) == depth + 1
+
+        extracted = ListProcessor().transform(instance)
+        assert len([a for a in extracted if isinstance(a, tuple)]) == 3 * depth
+
+    def test_standardize_mapping_not_shared(self):
+        std = NameStandardizer()
+        _reset_gensym()
+        first = std._standardize({'?a': {'x': 1}})
+        second = std._standardize({'?a': {'x': 1}})
+        assert list(first) == ['?o1']
+        assert list(second) == ['?o2']
+
+    def test_stream_in_pool(self):
+        instances = [{'?o1': {'x': i, 'y': {'z': i % 3}},
+                      '(left-of ?o1 ?o2)': True, '?o2': {'x': -i}}
+                     for i in range(250)]
+        pipeline = Pipeline(Tuplizer(), NameStandardizer(), Flattener(),
+                            SubComponentProcessor(), NumericToNominal())
+        assert not pipeline.stateless
+
+        _reset_gensym()
+        expected = [pipeline.transform(instance) for instance in instances]
+        pool = Pool(2)
+        try:
+            _reset_gensym()
+            streamed = pipeline.stream(iter(instances), pool=pool,
+                                       chunk_size=7, max_pending=2)
+            assert list(streamed) == expected
+
+            unbounded = ({'?o1': {'x': i}} for i in count())
+            streamed = Pipeline(Tuplizer(), Flattener()).stream(unbounded,
+                                                               pool=pool)
+            assert list(islice(streamed, 3)) == [{('x', '?o1'): i}
+                                                 for i in range(3)]
+        finally:
+            pool.close()
+            pool.join()
+
+if __name__ == "__main__":
+    unittest.main()
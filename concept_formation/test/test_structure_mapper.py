@@ -3,18 +3,33 @@ from __future__ import unicode_literals
 from __future__ import absolute_import
 from __future__ import division
 
+import unittest
+import time
+from itertools import permutations
+from multiprocessing import Pool
 from random import normalvariate
 from pprint import pprint
 from random import shuffle
 from random import choice
 from random import random
+from random import Random
 
 from munkres import Munkres
 #from scipy.optimize import linear_sum_assignment
 
+from concept_formation import structure_mapper
 from concept_formation.trestle import TrestleTree
+from concept_formation.instrumentation import Instrumentation
 from concept_formation.structure_mapper import StructureMappingOptimizationProblem
 from concept_formation.structure_mapper import mapping_cost
+from concept_formation.structure_mapper import mapping_cost_matrix
+from concept_formation.structure_mapper import get_assignment_solver
+from concept_formation.structure_mapper import get_component_block
+from concept_formation.structure_mapper import flat_match
+from concept_formation.structure_mapper import MappingCostEvaluator
+from concept_formation.structure_mapper import StructureMapper
+from concept_formation.utils import LRUCache
+from concept_formation.cobweb3 import Cobweb3Node
 from concept_formation.structure_mapper import hungarian_mapping
 from concept_formation.structure_mapper import get_component_names
 from concept_formation.preprocessor import Pipeline
@@ -22,6 +37,8 @@ from concept_formation.preprocessor import Tuplizer
 from concept_formation.preprocessor import NameStandardizer
 from concept_formation.preprocessor import SubComponentProcessor
 from concept_formation.preprocessor import Flattener
+from concept_formation.data_files.generate_synthetic import \
+    generate_relational
 from py_search.utils import compare_searches
 from py_search.informed import widening_beam_search
 from py_search.informed import best_first_search
@@ -291,3 +308,198 @@ compare_searches([
 
 
 
+
+
+def relational_problem(num_objects=4, num_instances=10, seed=0):
+    """
+    Returns a flattened target instance and a base concept trained on similar
+    synthetic relational instances.
+    """
+    instances = list(generate_relational(num_instances + 1,
+                                         num_objects=num_objects, seed=seed))
+    tree = TrestleTree()
+    tree.fit(instances[:-1], randomize_first=False)
+    standardize = Pipeline(NameStandardizer(tree.gensym), Flattener(),
+                           SubComponentProcessor())
+    return standardize.transform(instances[-1]), tree.root
+
+
+class TestStructureMapper(unittest.TestCase):
+
+    def test_mapping_cost_matrix(self):
+        for seed in range(3):
+            target, base = relational_problem(seed=seed)
+            inames = sorted(get_component_names(target))
+            cnames = sorted(get_component_names(base.av_counts))
+            matrix = mapping_cost_matrix(inames, cnames, target, base)
+            unmapped_cost = mapping_cost({}, target, base)
+            for i, o in enumerate(inames):
+                for j, c in enumerate(cnames):
+                    self.assertAlmostEqual(matrix[i][j],
+                                           mapping_cost({o: c}, target, base),
+                                           places=12)
+                for k, other in enumerate(inames):
+                    if k == i:
+                        self.assertAlmostEqual(matrix[i][len(cnames) + k],
+                                               unmapped_cost, places=12)
+                    else:
+                        assert matrix[i][len(cnames) + k] == float('inf')
+
+    def test_assignment_solvers(self):
+        target, base = relational_problem()
+        inames = sorted(get_component_names(target))
+        cnames = sorted(get_component_names(base.av_counts))
+        matrix = mapping_cost_matrix(inames, cnames, target, base)
+
+        # the optimal assignment cost found by brute force.
+        columns = range(len(matrix[0]))
+        best = min(sum(matrix[row][col] for row, col in enumerate(cols))
+                   for cols in permutations(columns, len(matrix)))
+        for solver in ('munkres', 'scipy'):
+            assignment = get_assignment_solver(solver)(matrix)
+            assert sorted(row for row, col in assignment) == list(
+                range(len(matrix)))
+            cost = sum(matrix[row][col] for row, col in assignment)
+            self.assertAlmostEqual(cost, best)
+
+    def test_blocking(self):
+        for seed in range(3):
+            target, base = relational_problem(seed=seed)
+            inames = get_component_names(target)
+            cnames = get_component_names(base.av_counts)
+
+            # an initial mapping that maps every component across blocks.
+            crossed = {}
+            for o in inames:
+                for c in cnames:
+                    if (get_component_block(o, target, ['_role']) !=
+                            get_component_block(c, base.av_counts,
+                                                ['_role']) and
+                            c not in crossed.values()):
+                        crossed[o] = c
+                        break
+
+            for initial_mapping in (None, frozenset(crossed.items())):
+                mapping = flat_match(target, base, initial_mapping,
+                                     blocking_keys=['_role'], restarts=2)
+                for o in mapping:
+                    if mapping[o] == o:
+                        continue
+                    assert (get_component_block(o, target, ['_role']) ==
+                            get_component_block(mapping[o], base.av_counts,
+                                                ['_role']))
+
+    def test_mapping_budgets(self):
+        target, base = relational_problem(num_objects=6)
+        inames = set(get_component_names(target))
+
+        inst = Instrumentation()
+        flat_match(target, base, instrumentation=inst)
+        assert 'mapping_budget_hits' not in inst.counters
+        assert inst.counters['mapping_evaluations'] > 5
+
+        for budget in ({'max_evaluations': 1}, {'max_evaluations': 5},
+                       {'time_budget': 0.0}):
+            inst = Instrumentation()
+            mapping = flat_match(target, base, instrumentation=inst, **budget)
+            assert inst.counters['mapping_budget_hits'] == 1
+            assert inst.counters['mapping_evaluations'] <= budget.get(
+                'max_evaluations', 1)
+            assert set(mapping) == inames
+
+        tree = TrestleTree(mapping_max_evaluations=1)
+        tree.instrumentation = Instrumentation()
+        tree.fit(generate_relational(20, num_objects=4, seed=0),
+                 randomize_first=False)
+        counters = tree.instrumentation.counters
+        assert counters['mapping_budget_hits'] > 0
+        assert (counters['mapping_evaluations'] ==
+                counters['mapping_searches'])
+
+    def test_mapping_cost_evaluator(self):
+        rng = Random(0)
+        for seed in range(3):
+            target, base = relational_problem(seed=seed)
+            concept = Cobweb3Node()
+            concept.increment_counts(target)
+            inames = sorted(get_component_names(target))
+            cnames = sorted(get_component_names(base.av_counts))
+
+            for t in (target, concept.av_counts):
+                evaluator = MappingCostEvaluator(t, base)
+                for i in range(30):
+                    names = cnames + inames
+                    rng.shuffle(names)
+                    mapping = {o: c if c in cnames else o
+                               for o, c in zip(inames, names)}
+                    assert (evaluator.cost(mapping) ==
+                            mapping_cost(mapping, t, base))
+
+    def test_mapping_cache(self):
+        instances = list(generate_relational(12, num_objects=5,
+                                             num_clusters=1, noise=0.0,
+                                             seed=0))
+        tree = TrestleTree()
+        tree.fit(instances[:10], randomize_first=False)
+        base = tree.root
+        cnames = set(get_component_names(base.av_counts))
+        standardize = Pipeline(NameStandardizer(tree.gensym), Flattener(),
+                               SubComponentProcessor())
+
+        mapper = StructureMapper(base, cache=LRUCache(10))
+        for instance in instances[10:]:
+            target = standardize.transform(instance)
+            inames = set(get_component_names(target))
+            mapper.transform(target)
+            mapping = mapper.mapping
+            assert set(mapping) == inames
+            assert len(set(mapping.values())) == len(mapping)
+            for o in mapping:
+                assert mapping[o] == o or mapping[o] in cnames
+        assert mapper.cache.hits == 1
+
+        # the cached mapping only seeds the search, which still refines it to
+        # the mapping an uncached search finds for these identical layouts.
+        assert mapping == flat_match(target, base)
+
+    def test_restarts(self):
+        target, base = relational_problem(num_objects=6)
+        serial = [flat_match(target, base, restarts=4, restart_seed=seed)
+                  for seed in range(3)]
+        assert serial == [flat_match(target, base, restarts=4,
+                                     restart_seed=seed) for seed in range(3)]
+
+        pool = Pool(2)
+        try:
+            pooled = [flat_match(target, base, restarts=4, restart_seed=seed,
+                                 pool=pool) for seed in range(3)]
+        finally:
+            pool.close()
+            pool.join()
+        assert serial == pooled
+
+    def test_restarts_share_time_budget(self):
+        target, base = relational_problem()
+        budgets = []
+        search = structure_mapper.mapping_search
+
+        def slow_search(args):
+            budgets.append(args[6])
+            time.sleep(0.02)
+            return search(args)
+
+        structure_mapper.mapping_search = slow_search
+        try:
+            flat_match(target, base, time_budget=0.05, restarts=4)
+        finally:
+            structure_mapper.mapping_search = search
+
+        # the serial searches only get the time left by the previous ones.
+        assert len(budgets) == 5
+        assert budgets == sorted(budgets, reverse=True)
+        assert budgets[0] <= 0.05
+        assert budgets[-1] == 0.0
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import division
+import unittest
+import random
+
+from concept_formation.trestle import TrestleTree
+from concept_formation.instrumentation import Instrumentation
+from concept_formation.data_files.generate_synthetic import \
+    generate_relational
+
+
+def two_object_instances(num_instances):
+    return [{'?a': {'size': random.random()},
+             '?b': {'size': random.random()}}
+            for i in range(num_instances)]
+
+
+class TestTrestle(unittest.TestCase):
+
+    def test_intern_table_bounded(self):
+        random.seed(0)
+        tree = TrestleTree()
+        tree.fit(two_object_instances(300), randomize_first=False)
+
+        # only attributes that concepts refer to are interned, not the fresh
+        # names every instance is given before it is structure mapped.
+        assert len(tree.intern_table) < 30
+        for node in tree.root.preorder():
+            for attr in node.av_counts:
+                assert attr in tree.intern_table
+
+    def test_synthetic_relational_components(self):
+        instances = list(generate_relational(20, num_objects=3, seed=0))
+        for instance in instances:
+            components = [a for a in instance
+                          if isinstance(instance[a], dict)]
+            assert len(components) == 3
+            for name in components:
+                assert name[0] == '?'
+            for attr in instance:
+                if isinstance(attr, tuple):
+                    assert attr[1] in components and attr[2] in components
+
+        # the variable components are structure mapped onto the objects of
+        # the root rather than each instance adding new ones.
+        tree = TrestleTree()
+        tree.fit(instances, randomize_first=False)
+        components = set(a[1] for a in tree.root.av_counts
+                         if isinstance(a, tuple) and a[0] == 'a0')
+        assert len(components) == 3
+
+    def test_early_stopping(self):
+        random.seed(0)
+        tree = TrestleTree()
+        tree.fit(two_object_instances(30), randomize_first=False)
+        instance = two_object_instances(1)[0]
+
+        leaf, path = tree.categorize(instance, return_path=True)
+        assert path[0] is tree.root and path[-1] is leaf
+        assert not leaf.children
+        for parent, child in zip(path, path[1:]):
+            assert child.parent is parent
+
+        concept, path = tree.categorize(instance, max_depth=1,
+                                        return_path=True)
+        assert concept.depth() == 1
+        assert path == [tree.root, concept]
+        assert tree.categorize(instance, min_count=1e9) is tree.root
+        assert tree.categorize(instance, stop_when=lambda c: True) is \
+            tree.root
+
+        # the other components are inferred from the root's means.
+        inferred = tree.infer_missing({'?a': {'size': 0.5}}, max_depth=0)
+        assert inferred['?a'] == {'size': 0.5}
+        assert len(inferred) > 1
+        means = [tree.root.predict(attr) for attr in tree.root.attrs()]
+        for name in inferred:
+            if name != '?a':
+                assert inferred[name]['size'] in means
+
+    def test_instrumentation_after_error(self):
+        tree = TrestleTree()
+        tree.instrumentation = Instrumentation(trace=True)
+        tree.ifit({'?a': {'size': 1}})
+        self.assertRaises(ValueError, tree.ifit, {'a': [1, [2]]})
+        tree.ifit({'?b': {'size': 2}})
+
+        # the failed instance does not leave the instrumentation nested, so
+        # every later instance still gets its own trace.
+        traces = tree.instrumentation.traces
+        assert len(traces) == 3
+        assert traces[-1]['counters']['instances'] == 1
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -58,6 +58,56 @@ class TestUtils(unittest.TestCase):
             cv.combine(cv2)
             assert cv.biased_std() - utils.std(values) < 0.00000000001
 
+    def test_instance_key(self):
+        instances = [{'a': 1}, {'a': True}, {'a': 1.0}, {'a': '1'},
+                     {'a': [1]}, {'a': (1,)}, {'a': [True]}, {'a': [[1]]},
+                     {'a': [(1,)]}, {'a': {'b': 1}}, {'a': [{'b': 1}]},
+                     {'a': {'b': [1]}}, {'a': {'b': (1,)}}, {}]
+        keys = [utils.instance_key(instance) for instance in instances]
+        assert len(set(keys)) == len(instances)
+
+        for instance, key in zip(instances, keys):
+            same = {attr: instance[attr] for attr in reversed(list(instance))}
+            same['c'] = 'x'
+            instance['c'] = 'x'
+            assert utils.instance_key(same) == utils.instance_key(instance)
+            assert utils.instance_key(instance) != key
+
+        assert utils.instance_key({'a': [{'b': [1]}], 'c': 'x'}) == \
+            utils.instance_key({'c': 'x', 'a': [{'b': [1]}]})
+        assert utils.instance_key({'a': [1, set([2])]}) is None
+
+    def test_alias_table(self):
+        for i in range(10):
+            choices = [('v%i' % j, random.choice([0, random.random()]))
+                       for j in range(random.randint(1, 8))]
+            total = sum([p for v, p in choices])
+            table = utils.AliasTable(choices)
+
+            # the probability of sampling each value from the table.
+            n = len(choices)
+            probs = {v: 0.0 for v, p in choices}
+            for j, v in enumerate(table.values):
+                probs[v] += table.prob[j] / n
+                probs[table.values[table.alias[j]]] += (1 - table.prob[j]) / n
+
+            for v, p in choices:
+                # all zero weights are sampled uniformly.
+                expected = p / total if total > 0 else 1 / n
+                assert abs(probs[v] - expected) < 1e-9
+
+            best = max([p for v, p in choices])
+            assert table.most_likely() in [v for v, p in choices if p == best]
+
+        random.seed(0)
+        table = utils.AliasTable([('a', 0.1), ('b', 0.0), ('c', 0.6),
+                                  ('d', 0.3)])
+        samples = table.samples(10000) + [table.sample() for i in range(100)]
+        assert samples.count('b') == 0
+        for v, p in [('a', 0.1), ('c', 0.6), ('d', 0.3)]:
+            assert abs(samples.count(v) / len(samples) - p) < 0.02
+        assert table.most_likely() == 'c'
+
 if __name__ == "__main__":
     unittest.main()
 
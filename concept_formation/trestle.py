@@ -7,6 +7,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import absolute_import
 from __future__ import division
+from timeit import default_timer
 
 from concept_formation.cobweb3 import Cobweb3Tree
 from concept_formation.cobweb3 import Cobweb3Node
@@ -15,6 +16,7 @@ from concept_formation.preprocessor import SubComponentProcessor
 from concept_formation.preprocessor import Flattener
 from concept_formation.preprocessor import Pipeline
 from concept_formation.preprocessor import NameStandardizer
+from concept_formation.utils import InternTable
 
 
 class TrestleTree(Cobweb3Tree):
@@ -50,18 +52,96 @@ class TrestleTree(Cobweb3Tree):
         drastically reduces performance, but allows the category structure to
         influcence structure mapping.
     :type structure_map_internally: boolean
+    :param operator_policy: A policy that limits when the merge and split
+        operations are entertained (see: :class:`CobwebTree
+        <concept_formation.cobweb.CobwebTree>`). By default every operation is
+        entertained.
+    :type operator_policy: :class:`OperatorPolicy
+        <concept_formation.operator_policy.OperatorPolicy>` or None
+    :param blocking_keys: Attribute names (e.g., ``'type'`` or ``'_type'``)
+        whose values must agree for an instance object to be mapped to a
+        concept object during structure mapping (see: :func:`flat_match
+        <concept_formation.structure_mapper.flat_match>`). This splits
+        structure mapping into smaller problems, one for each type of object.
+        By default any objects can be mapped.
+    :type blocking_keys: [str, ...] or None
+    :param mapping_max_evaluations: The maximum number of mappings evaluated
+        when structure mapping an instance, after which the best mapping found
+        so far is used. By default there is no limit.
+    :type mapping_max_evaluations: int or None
+    :param mapping_time_budget: The time (in seconds) structure mapping an
+        instance can take, after which the best mapping found so far is used.
+        By default there is no limit. The mapping_restarts share this time,
+        unless they are run in the mapping_pool, where each restart can take
+        up to the full budget. How often either budget is hit is recorded by
+        the tree's :class:`Instrumentation
+        <concept_formation.instrumentation.Instrumentation>` (if any).
+    :type mapping_time_budget: float or None
+    :param mapping_restarts: The number of additional, randomly perturbed,
+        structure mapping searches run for each instance, the best mapping of
+        which is used (see: :func:`flat_match
+        <concept_formation.structure_mapper.flat_match>`). By default only one
+        search is run.
+    :type mapping_restarts: int
+    :param mapping_restart_seed: The seed of the first restart, which makes
+        the restarts deterministic.
+    :type mapping_restart_seed: int
+    :param intern_attributes: Whether the attributes of the instances fit
+        into the tree are interned in the tree's intern_table (an
+        :class:`InternTable <concept_formation.utils.InternTable>`), so that
+        every concept shares a single copy of each flattened and relational
+        attribute rather than holding its own. Only the structure mapped
+        attributes of the instances that are fit are interned, so the table
+        only holds attributes that concepts refer to (rather than the fresh
+        names every instance is given before it is mapped).
+    :type intern_attributes: boolean
+
+    The mapping_cache attribute can be set to an :class:`LRUCache
+    <concept_formation.utils.LRUCache>` to reuse the mappings found for
+    previous instances with the same structure as the starting point of the
+    structure mapping search (see: :class:`StructureMapper
+    <concept_formation.structure_mapper.StructureMapper>`). This is useful
+    when many instances share the same layout of objects and relations.
+    Similarly, the mapping_pool attribute can be set to a
+    ``multiprocessing.Pool`` to run the mapping_restarts in parallel.
+
+    >>> from concept_formation.utils import LRUCache
+    >>> tree = TrestleTree()
+    >>> tree.mapping_cache = LRUCache(100)
+    >>> tree.fit([{'?a': {'size': 1}, '?b': {'size': 5}},
+    ...           {'?c': {'size': 5}, '?d': {'size': 1}},
+    ...           {'?e': {'size': 2}, '?f': {'size': 4}}],
+    ...          randomize_first=False)
+    >>> tree.mapping_cache.hits, tree.mapping_cache.misses
+    (1, 2)
     """
-
-    def __init__(self, scaling=0.5, inner_attr_scaling=True):
+    blocking_keys = None
+    mapping_max_evaluations = None
+    mapping_time_budget = None
+    mapping_cache = None
+    mapping_restarts = 0
+    mapping_restart_seed = 0
+    mapping_pool = None
+    intern_attributes = True
+    intern_table = None
+
+    def __init__(self, scaling=0.5, inner_attr_scaling=True,
+                 operator_policy=None, blocking_keys=None,
+                 mapping_max_evaluations=None, mapping_time_budget=None,
+                 mapping_restarts=0, mapping_restart_seed=0,
+                 intern_attributes=True):
         """
         The tree constructor.
         """
-        self.gensym_counter = 0
-        self.root = Cobweb3Node()
-        self.root.tree = self
-        self.scaling = scaling
-        self.inner_attr_scaling = inner_attr_scaling
-        self.attr_scales = {}
+        self.intern_attributes = intern_attributes
+        super(TrestleTree, self).__init__(scaling=scaling,
+                                          inner_attr_scaling=inner_attr_scaling,
+                                          operator_policy=operator_policy)
+        self.blocking_keys = blocking_keys
+        self.mapping_max_evaluations = mapping_max_evaluations
+        self.mapping_time_budget = mapping_time_budget
+        self.mapping_restarts = mapping_restarts
+        self.mapping_restart_seed = mapping_restart_seed
 
     def clear(self):
         """
@@ -71,6 +151,30 @@ class TrestleTree(Cobweb3Tree):
         self.root = Cobweb3Node()
         self.root.tree = self
         self.attr_scales = {}
+        self.instance_weight = 1
+        self._invalidate_categorize_cache()
+        if self.mapping_cache is not None:
+            self.mapping_cache.clear()
+        if self.intern_attributes:
+            self.intern_table = InternTable()
+        else:
+            self.intern_table = None
+
+    def _structure_mapper(self, instrumentation=None, interner=None):
+        """
+        Returns a :class:`StructureMapper
+        <concept_formation.structure_mapper.StructureMapper>` to the root that
+        uses the tree's structure mapping options.
+        """
+        return StructureMapper(self.root, instrumentation=instrumentation,
+                               blocking_keys=self.blocking_keys,
+                               max_evaluations=self.mapping_max_evaluations,
+                               time_budget=self.mapping_time_budget,
+                               cache=self.mapping_cache,
+                               restarts=self.mapping_restarts,
+                               restart_seed=self.mapping_restart_seed,
+                               pool=self.mapping_pool,
+                               interner=interner)
 
     def gensym(self):
         """
@@ -151,25 +255,30 @@ class TrestleTree(Cobweb3Tree):
         """
         return self.trestle(instance)
 
-    def _trestle_categorize(self, instance):
+    def _trestle_categorize(self, instance, **options):
         """
         The structure maps the instance, categorizes the matched instance, and
         returns the resulting concept.
 
         :param instance: an instance to be categorized into the tree.
         :type instance: {a1:v1, a2:v2, ...}
+        :param options: early stopping options passed to
+            :meth:`CobwebTree._cobweb_categorize
+            <concept_formation.cobweb.CobwebTree._cobweb_categorize>`
         :return: A concept describing the instance
         :rtype: concept
         """
+        mapper = self._structure_mapper()
         preprocessing = Pipeline(NameStandardizer(self.gensym),
                                  Flattener(), SubComponentProcessor(),
-                                 StructureMapper(self.root))
+                                 mapper)
         temp_instance = preprocessing.transform(instance)
         self._sanity_check_instance(temp_instance)
-        return self._cobweb_categorize(temp_instance)
+        return self._cobweb_categorize(temp_instance, **options)
 
     def infer_missing(self, instance, choice_fn="most likely",
-                      allow_none=True):
+                      allow_none=True, max_depth=None, min_count=None,
+                      stop_when=None):
         """
         Given a tree and an instance, returns a new instance with attribute
         values picked using the specified choice function (either "most likely"
@@ -186,15 +295,25 @@ class TrestleTree(Cobweb3Tree):
             inferred to be missing. If False, then all attributes will be
             inferred with some value.
         :type allow_none: Boolean
+        :param max_depth: the maximum depth to categorize the instance to.
+        :type max_depth: int
+        :param min_count: the minimum count of a concept to descend into.
+        :type min_count: float
+        :param stop_when: a function that takes a concept and returns True if
+            categorization should stop at that concept.
+        :type stop_when: function
         :return: A completed instance
         :rtype: instance
         """
+        mapper = self._structure_mapper()
         preprocessing = Pipeline(NameStandardizer(self.gensym),
                                  Flattener(), SubComponentProcessor(),
-                                 StructureMapper(self.root))
+                                 mapper)
 
         temp_instance = preprocessing.transform(instance)
-        concept = self._cobweb_categorize(temp_instance)
+        concept = self._cobweb_categorize(temp_instance, max_depth=max_depth,
+                                          min_count=min_count,
+                                          stop_when=stop_when)
 
         for attr in concept.attrs('all'):
             if attr in temp_instance:
@@ -206,7 +325,8 @@ class TrestleTree(Cobweb3Tree):
         temp_instance = preprocessing.undo_transform(temp_instance)
         return temp_instance
 
-    def categorize(self, instance):
+    def categorize(self, instance, max_depth=None, min_count=None,
+                   stop_when=None, return_path=False):
         """
         Sort an instance in the categorization tree and return its resulting
         concept.
@@ -223,14 +343,33 @@ class TrestleTree(Cobweb3Tree):
         <concept_formation.cobweb3.Cobweb3Tree.categorize>` by structure
         mapping instances before categorizing them.
 
+        The max_depth, min_count, stop_when, and return_path options behave
+        the same as in :meth:`CobwebTree.categorize
+        <concept_formation.cobweb.CobwebTree.categorize>`.
+
         :param instance: an instance to be categorized into the tree.
         :type instance: :ref:`Instance<instance-rep>`
-        :return: A concept describing the instance
-        :rtype: CobwebNode
+        :param max_depth: the maximum depth to categorize the instance to.
+        :type max_depth: int
+        :param min_count: the minimum count of a concept to descend into.
+        :type min_count: float
+        :param stop_when: a function that takes a concept and returns True if
+            categorization should stop at that concept.
+        :type stop_when: function
+        :param return_path: whether to also return the concepts from the root
+            to the returned concept.
+        :type return_path: Boolean
+        :return: A concept describing the instance, or the concept and the path
+            to it when return_path is True.
+        :rtype: CobwebNode or (CobwebNode, [CobwebNode, ...])
 
         .. seealso:: :meth:`TrestleTree.trestle`
         """
-        return self._trestle_categorize(instance)
+        return self._categorize_with_cache(instance, self._trestle_categorize,
+                                           max_depth=max_depth,
+                                           min_count=min_count,
+                                           stop_when=stop_when,
+                                           return_path=return_path)
 
     def trestle(self, instance):
         """
@@ -248,9 +387,29 @@ class TrestleTree(Cobweb3Tree):
         :return: A concept describing the instance
         :rtype: CobwebNode
         """
-        preprocessing = Pipeline(NameStandardizer(self.gensym),
-                                 Flattener(), SubComponentProcessor(),
-                                 StructureMapper(self.root))
-        temp_instance = preprocessing.transform(instance)
-        self._sanity_check_instance(temp_instance)
-        return self.cobweb(temp_instance)
+        inst = self.instrumentation
+        interner = self.intern_table
+        if inst is None:
+            mapper = self._structure_mapper(interner=interner)
+            preprocessing = Pipeline(NameStandardizer(self.gensym),
+                                     Flattener(), SubComponentProcessor(),
+                                     mapper)
+            temp_instance = preprocessing.transform(instance)
+            self._sanity_check_instance(temp_instance)
+            return self.cobweb(temp_instance)
+
+        inst.begin()
+        try:
+            start = default_timer()
+            preprocessing = Pipeline(NameStandardizer(self.gensym),
+                                     Flattener(), SubComponentProcessor())
+            temp_instance = preprocessing.transform(instance)
+            inst.add_time('preprocessing', default_timer() - start)
+
+            mapper = self._structure_mapper(instrumentation=inst,
+                                            interner=interner)
+            temp_instance = mapper.transform(temp_instance)
+            self._sanity_check_instance(temp_instance)
+            return self.cobweb(temp_instance)
+        finally:
+            inst.end()
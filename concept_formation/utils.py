@@ -7,9 +7,13 @@ from __future__ import unicode_literals
 from __future__ import absolute_import
 from __future__ import division
 from numbers import Number
+from collections import OrderedDict
 from random import uniform
 from random import random
+from random import choice
 from math import sqrt
+from math import exp
+from math import lgamma
 
 
 # A hashtable of values to use in the c4(n) function to apply corrections to
@@ -49,13 +53,23 @@ def c4(n) :
     deviation in low sample sizes. This implementation is based on a lookup 
     table for n in [2-29] and returns 1.0 for values >= 30.
 
+    Non-integer sample sizes (e.g., the weighted counts produced by a decaying
+    tree) are computed directly from the gamma function definition of c4.
+
     >>> c4(3)
     0.886226925452758
+    >>> round(c4(2.5), 6)
+    0.854096
     """
     if n <= 1 :
         raise ValueError("Cannot apply correction for a sample size of 1.")
-    else :
-        return c4n_table[n] if n < 30 else 1.0
+    elif n >= 30:
+        return 1.0
+    elif n in c4n_table:
+        return c4n_table[n]
+    else:
+        return (sqrt(2 / (n - 1)) *
+                exp(lgamma(n / 2) - lgamma((n - 1) / 2)))
 
 def isNumber(n):
     """
@@ -156,7 +170,312 @@ def most_likely_choice(choices):
     :return: the val with the hightest prob
     :rtype: val
     """
-    updated_choices = [(prob, random(), val) for val, prob in choices]
-    return sorted(updated_choices, reverse=True)[0][2]
+    best = []
+    best_prob = None
+    for val, prob in choices:
+        if best_prob is None or prob > best_prob:
+            best = [val]
+            best_prob = prob
+        elif prob == best_prob:
+            best.append(val)
+
+    if len(best) == 1:
+        return best[0]
+    return choice(best)
+
+
+class AliasTable(object):
+    """
+    A table for repeatedly sampling from a fixed discrete distribution. The
+    table is built in linear time using Vose's alias method, after which each
+    sample takes constant time (compared to the linear scan of
+    :func:`weighted_choice`). The most likely values are also found once, so
+    repeated most likely choices are constant time as well.
+
+    >>> from random import seed
+    >>> seed(0)
+    >>> table = AliasTable([('a', .25), ('b', .75)])
+    >>> samples = [table.sample() for i in range(1000)]
+    >>> samples.count('b') > samples.count('a')
+    True
+    >>> table.most_likely()
+    'b'
+
+    :param choices: A list of tuples
+    :type choices: [(val, prob),...(val, prob)]
+    """
+
+    def __init__(self, choices):
+        if len(choices) == 0:
+            raise ValueError("Cannot build an alias table without choices.")
+
+        self.values = [val for val, prob in choices]
+        weights = [prob for val, prob in choices]
+        n = len(weights)
+        total = sum(weights)
+        if total <= 0:
+            weights = [1.0] * n
+            total = n
+
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+        best_prob = max(weights)
+        self.best = [val for val, w in zip(self.values, weights)
+                     if w == best_prob]
+
+    def sample(self):
+        """
+        Returns a value sampled according to the weights of the choices.
+        """
+        i = int(random() * len(self.values))
+        if random() < self.prob[i]:
+            return self.values[i]
+        return self.values[self.alias[i]]
+
+    def samples(self, n):
+        """
+        Returns a list of n values sampled according to the weights of the
+        choices.
+        """
+        values = self.values
+        prob = self.prob
+        alias = self.alias
+        size = len(values)
+        samples = []
+        for r in range(n):
+            i = int(random() * size)
+            if random() < prob[i]:
+                samples.append(values[i])
+            else:
+                samples.append(values[alias[i]])
+        return samples
+
+    def most_likely(self):
+        """
+        Returns the value with the highest weight. Ties are randomly broken.
+        """
+        if len(self.best) == 1:
+            return self.best[0]
+        return choice(self.best)
+
+
+def instance_key(instance):
+    """
+    Returns a canonical, hashable key for an instance, so that instances
+    with the same attributes and values (in any order) have equal keys.
+    Component and list values are converted recursively and the type of each
+    value is included, so values that compare equal but are treated
+    differently by the trees (e.g., ``True`` and ``1``, or a list and a
+    tuple) have different keys. Returns None if the instance contains values
+    that cannot be hashed.
+
+    >>> key = instance_key({'a': 1, 'b': {'c': 'x'}})
+    >>> key == instance_key({'b': {'c': 'x'}, 'a': 1})
+    True
+    >>> instance_key({'a': 1}) == instance_key({'a': True})
+    False
+    >>> instance_key({'a': [1]}) == instance_key({'a': (1,)})
+    False
+
+    :param instance: An instance
+    :type instance: :ref:`Instance<instance-rep>`
+    :return: A key for the instance
+    :rtype: tuple or None
+    """
+    try:
+        return _value_key(instance)
+    except TypeError:
+        return None
+
+
+def _value_key(val):
+    """
+    Returns a hashable key for a value of an instance (see:
+    :func:`instance_key`) that is tagged with the type of the value. Raises a
+    TypeError if the value cannot be hashed.
+    """
+    if isinstance(val, dict):
+        key = frozenset((attr, _value_key(val[attr])) for attr in val)
+    elif isinstance(val, (list, tuple)):
+        key = tuple(_value_key(v) for v in val)
+    else:
+        hash(val)
+        key = val
+    return (val.__class__.__name__, key)
+
+
+class LRUCache(object):
+    """
+    A simple least recently used cache with hit and miss statistics. When the
+    cache is full, adding a new entry removes the least recently used one.
+
+    >>> cache = LRUCache(2)
+    >>> cache.put('a', 1)
+    >>> cache.put('b', 2)
+    >>> cache.get('a')
+    1
+    >>> cache.put('c', 3)
+    >>> cache.get('b') is None
+    True
+    >>> cache.hits, cache.misses
+    (1, 1)
+
+    :param maxsize: The maximum number of entries to keep
+    :type maxsize: int
+    """
+
+    def __init__(self, maxsize=1024):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1.")
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for a key, or default if the key is not in
+        the cache, and marks the key as recently used.
+        """
+        if key not in self._data:
+            self.misses += 1
+            return default
+        self.hits += 1
+        value = self._data.pop(key)
+        self._data[key] = value
+        return value
+
+    def put(self, key, value):
+        """
+        Stores a value for a key, removing the least recently used entry if
+        the cache is full.
+        """
+        if key in self._data:
+            del self._data[key]
+        elif len(self._data) >= self.maxsize:
+            self._data.popitem(last=False)
+        self._data[key] = value
+
+    def clear(self):
+        """
+        Removes all of the entries (but not the statistics) from the cache.
+        """
+        self._data.clear()
+
+    def stats(self):
+        """
+        Returns the hit and miss statistics of the cache.
+
+        :return: the hits, misses, hit rate, and current size
+        :rtype: dict
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._data)}
+
+
+class InternTable(object):
+    """
+    A table that interns string and tuple attributes, so that equal
+    attributes are represented by a single shared object. Tuples are interned
+    recursively, so the nested tuples of flattened and relational attributes
+    (e.g., ``('X', ('Position', '?o3'))``) are shared as well. This saves the
+    memory of storing a copy of every attribute in every concept and lets
+    dictionary lookups of interned attributes succeed on identity rather
+    than comparing the tuples element by element.
+
+    Only strings and tuples made up of strings and tuples are interned, any
+    other value is returned unchanged (e.g., to keep ``1`` and ``True`` from
+    being confused).
+
+    >>> table = InternTable()
+    >>> a = table.intern(('X', ('Position', '?o3')))
+    >>> b = table.intern(('X', ('Position', '?o3')))
+    >>> a is b
+    True
+    >>> table.intern(('Y', ('Position', '?o3')))[1] is a[1]
+    True
+    >>> table.intern(('r', 1)) is table.intern(('r', 1))
+    False
+    >>> len(table)
+    8
+    """
+
+    def __init__(self):
+        self._table = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._table)
+
+    def __contains__(self, value):
+        return value in self._table
+
+    def intern(self, value):
+        """
+        Returns the shared object that is equal to the value, adding the value
+        to the table if there is not one yet.
+
+        :param value: The attribute to intern
+        :type value: str or tuple
+        :return: The shared attribute
+        :rtype: str or tuple
+        """
+        if not isinstance(value, (str, tuple)):
+            return value
+
+        canonical = self._table.get(value)
+        if canonical is not None:
+            self.hits += 1
+            return canonical
+
+        self.misses += 1
+        if isinstance(value, tuple):
+            value = tuple([self.intern(v) for v in value])
+            for v in value:
+                if self._table.get(v) is not v:
+                    return value
+
+        self._table[value] = value
+        return value
+
+    def clear(self):
+        """
+        Removes all of the entries (but not the statistics) from the table.
+        """
+        self._table.clear()
 
+    def stats(self):
+        """
+        Returns the hit and miss statistics of the table.
 
+        :return: the hits, misses, hit rate, and current size
+        :rtype: dict
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._table)}
@@ -11,10 +11,10 @@ from os.path import dirname
 from os.path import join
 from os.path import exists
 from os.path import isdir
-from os.path import realpath
 from os import mkdir
 from shutil import copy
 import webbrowser
+import gzip
 import json
 
 from concept_formation.cobweb import CobwebNode
@@ -26,7 +26,177 @@ def _copy_file(filename, target_dir):
     dst = join(target_dir, filename)
     copy(src, dst)
 
-def _gen_viz(js_ob,dst,recreate_html):
+
+def _subtree_heights(root):
+    """
+    Returns the height (the length of the longest path down to a leaf) of
+    every node below the root, computed iteratively.
+    """
+    heights = {}
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            heights[node] = 1 + max([heights[c] for c in node.children] or
+                                    [-1])
+        else:
+            stack.append((node, True))
+            stack.extend((c, False) for c in node.children)
+    return heights
+
+
+def _visible_children(root, max_depth=None, max_nodes=None, cuts=0,
+                      clusters=None):
+    """
+    Returns a function that, given a node and its depth, returns the children
+    of the node that should be included in the output.
+
+    Children are excluded when they are deeper than max_depth, when their
+    parent is one of the clusters, or when they are within cuts levels of the
+    leaves (i.e., they would have been removed by trimming the leaves cuts
+    times). When max_nodes is provided the remaining nodes are included in
+    breadth first order until max_nodes have been included, so that the upper
+    levels of the tree are kept.
+    """
+    heights = _subtree_heights(root) if cuts > 0 else None
+
+    if clusters is not None:
+        clusters = set("Concept" + c.concept_id if isinstance(c, CobwebNode)
+                       else c for c in clusters)
+
+    def children(node, depth):
+        if max_depth is not None and depth >= max_depth:
+            return []
+        if clusters is not None and "Concept" + node.concept_id in clusters:
+            return []
+        if heights is not None:
+            return [c for c in node.children if heights[c] >= cuts]
+        return node.children
+
+    if max_nodes is None:
+        return children
+
+    included = set([root])
+    level = [root]
+    depth = 0
+    while level and len(included) < max_nodes:
+        next_level = []
+        for node in level:
+            for child in children(node, depth):
+                if len(included) >= max_nodes:
+                    break
+                included.add(child)
+                next_level.append(child)
+        level = next_level
+        depth += 1
+
+    def truncated_children(node, depth):
+        return [c for c in children(node, depth) if c in included]
+
+    return truncated_children
+
+
+def iter_json(root, max_depth=None, max_nodes=None, cuts=0, clusters=None):
+    """
+    Iteratively generates the JSON representation of a concept and its
+    descendants (the same format as :meth:`CobwebNode.output_json
+    <concept_formation.cobweb.CobwebNode.output_json>`) as a sequence of
+    strings. Joining the strings gives the JSON text, but they can also be
+    written out one at a time so that large trees are never held in memory.
+
+    The output can be truncated to a maximum depth (the root is at depth 0)
+    or a maximum number of nodes (chosen breadth first). The level of detail
+    can also be reduced by trimming the leaves cuts times (as in
+    :func:`visualize_no_leaves`) or by stopping at the concepts of a
+    clustering (as in :func:`visualize_clusters`).
+
+    >>> from concept_formation.cobweb import CobwebTree
+    >>> tree = CobwebTree()
+    >>> tree.fit([{'a': 'x'}, {'a': 'y'}, {'a': 'y'}], randomize_first=False)
+    >>> ob = json.loads(''.join(iter_json(tree.root)))
+    >>> ob == json.loads(json.dumps(tree.root.output_json()))
+    True
+    >>> ob = json.loads(''.join(iter_json(tree.root, max_depth=0)))
+    >>> ob['size'], ob['children']
+    (3.0, [])
+
+    :param root: The concept to start the output at
+    :type root: :class:`CobwebNode <concept_formation.cobweb.CobwebNode>`
+    :param max_depth: The maximum depth of concepts to include
+    :type max_depth: int
+    :param max_nodes: The maximum number of concepts to include
+    :type max_nodes: int
+    :param cuts: The number of times to trim the leaves
+    :type cuts: int
+    :param clusters: A list of cluster labels or concept nodes generated by
+        the cluster module, the descendants of which are not included
+    :type clusters: list
+    :return: an iterator over strings of JSON
+    :rtype: iterator
+    """
+    children = _visible_children(root, max_depth, max_nodes, cuts, clusters)
+
+    def node_start(node):
+        fields = json.dumps(node._json_fields())
+        return fields[:-1] + ', "children": ['
+
+    yield node_start(root)
+    stack = [[iter(children(root, 0)), True]]
+
+    while stack:
+        top = stack[-1]
+        child = next(top[0], None)
+        if child is None:
+            stack.pop()
+            yield ']}'
+            continue
+
+        if not top[1]:
+            yield ', '
+        top[1] = False
+        yield node_start(child)
+        stack.append([iter(children(child, len(stack))), True])
+
+
+def _write_chunks(out, chunks, buffer_size=1000):
+    """
+    Writes an iterator of strings to a binary file in buffered batches.
+    """
+    buf = []
+    for chunk in chunks:
+        buf.append(chunk)
+        if len(buf) >= buffer_size:
+            out.write(''.join(buf).encode('utf-8'))
+            buf = []
+    out.write(''.join(buf).encode('utf-8'))
+
+
+def export_json(tree, filename, max_depth=None, max_nodes=None, cuts=0,
+                clusters=None, compress=None):
+    """
+    Streams the JSON representation of a tree to a file (see:
+    :func:`iter_json` for the truncation and level of detail options).
+
+    :param tree: A category tree to export
+    :type tree: :class:`CobwebTree <concept_formation.cobweb.CobwebTree>`,
+        :class:`Cobweb3Tree <concept_formation.cobweb3.Cobweb3Tree>`, or
+        :class:`TrestleTree <concept_formation.trestle.TrestleTree>`
+    :param filename: The file to write to
+    :type filename: str
+    :param compress: Whether to gzip the output. By default the output is
+        compressed when the filename ends with ".gz"
+    :type compress: bool
+    """
+    if compress is None:
+        compress = filename.endswith('.gz')
+
+    chunks = iter_json(tree.root, max_depth, max_nodes, cuts, clusters)
+    opener = gzip.open if compress else open
+    with opener(filename, 'wb') as out:
+        _write_chunks(out, chunks)
+
+
+def _gen_viz(tree, dst, recreate_html, open_browser=True, **kwargs):
     if not isdir(join(dst,'images')):
         mkdir(join(dst,'images'))
         with open(join(dst,'images','README.txt'),'w') as out:
@@ -35,14 +205,15 @@ def _gen_viz(js_ob,dst,recreate_html):
         _copy_file('viz.html',dst)
         _copy_file('viz_logic.js',dst)
         _copy_file('viz_styling.css',dst)
-    with open(join(dst,'output.js'),'w') as out:
-        out.write('var trestle_output = ')
-        out.write(json.dumps(js_ob))
-        out.write(';')
-    # webbrowser.open(join(dst,'viz.html'))
-    webbrowser.open('file://' + realpath('viz.html'))
+    with open(join(dst,'output.js'),'wb') as out:
+        out.write('var trestle_output = '.encode('utf-8'))
+        _write_chunks(out, iter_json(tree.root, **kwargs))
+        out.write(';'.encode('utf-8'))
+    if open_browser:
+        webbrowser.open('file://' + realpath(join(dst, 'viz.html')))
 
-def visualize(tree,dst='.',recreate_html=True):
+def visualize(tree, dst='.', recreate_html=True, max_depth=None,
+              max_nodes=None, open_browser=True):
     """
     Create an interactive visualization of a concept_formation tree and open
     it in your browswer.
@@ -51,25 +222,34 @@ def visualize(tree,dst='.',recreate_html=True):
     destination directory provided. By default this will always recreate the
     support html, js, and css files but a flag can turn this off.
 
+    The tree is streamed to the output files, so large trees can be
+    visualized, although it is useful to truncate them to a maximum depth or
+    number of nodes (see: :func:`iter_json`) to keep the visualization
+    responsive.
+
     :param tree: A category tree to visualize
     :param dst: A directory to generate visualization files into
     :param create_html: A flag for whether new supporting html files should be
         created
+    :param max_depth: The maximum depth of concepts to include
+    :param max_nodes: The maximum number of concepts to include
+    :param open_browser: Whether to open the visualization in a browser, set
+        this to False to only generate the files (e.g., on a headless server)
     :type tree: :class:`CobwebTree <concept_formation.cobweb.CobwebTree>`,
         :class:`Cobweb3Tree <concept_formation.cobweb3.Cobweb3Tree>`, or
         :class:`TrestleTree <concept_formation.trestle.TrestleTree>`
     :type dst: str
     :type create_html: bool
+    :type max_depth: int
+    :type max_nodes: int
+    :type open_browser: bool
     """
-    _gen_viz(tree.root.output_json(),dst,recreate_html)
-
+    _gen_viz(tree, dst, recreate_html, open_browser, max_depth=max_depth,
+             max_nodes=max_nodes)
 
-def _trim_leaves(j_ob):
-    ret = {k:j_ob[k] for k in j_ob if k != 'children'}
-    ret['children'] = [_trim_leaves(child) for child in j_ob['children'] if len(child['children']) > 0]
-    return ret
 
-def visualize_no_leaves(tree,cuts=1,dst='.',recreate_html=True):
+def visualize_no_leaves(tree, cuts=1, dst='.', recreate_html=True,
+                        max_depth=None, max_nodes=None, open_browser=True):
     """
     Create an interactive visualization of a concept_formation tree cuts levels
     above the leaves and open it in your browswer.
@@ -87,28 +267,25 @@ def visualize_no_leaves(tree,cuts=1,dst='.',recreate_html=True):
     :param dst: A directory to generate visualization files into
     :param create_html: A flag for whether new supporting html files should be
         created
+    :param max_depth: The maximum depth of concepts to include
+    :param max_nodes: The maximum number of concepts to include
+    :param open_browser: Whether to open the visualization in a browser
     :type tree: :class:`CobwebTree <concept_formation.cobweb.CobwebTree>`,
         :class:`Cobweb3Tree <concept_formation.cobweb3.Cobweb3Tree>`, or
         :class:`TrestleTree <concept_formation.trestle.TrestleTree>`
     :type cuts: int
     :type dst: str
     :type create_html: bool
+    :type max_depth: int
+    :type max_nodes: int
+    :type open_browser: bool
     """
-    j_ob = tree.root.output_json()
-    for i in range(cuts):
-        j_ob = _trim_leaves(j_ob)
-    _gen_viz(j_ob,dst,recreate_html)
+    _gen_viz(tree, dst, recreate_html, open_browser, max_depth=max_depth,
+             max_nodes=max_nodes, cuts=cuts)
 
 
-def _trim_to_clusters(j_ob,clusters):
-    ret = {k:j_ob[k] for k in j_ob if k != 'children'}
-    if j_ob['name'] not in clusters:
-        ret['children'] = [_trim_to_clusters(child,clusters) for child in j_ob['children']]
-    else:
-        ret['children'] = []
-    return ret
-
-def visualize_clusters(tree,clusters,dst='.',recreate_html=True):
+def visualize_clusters(tree, clusters, dst='.', recreate_html=True,
+                       max_depth=None, max_nodes=None, open_browser=True):
     """
     Create an interactive visualization of a concept_formation tree trimmed to
     the level specified by a clustering from the cluster module.
@@ -128,19 +305,18 @@ def visualize_clusters(tree,clusters,dst='.',recreate_html=True):
     :param dst: A directory to generate visualization files into
     :param create_html: A flag for whether new supporting html files should be
         created
+    :param max_depth: The maximum depth of concepts to include
+    :param max_nodes: The maximum number of concepts to include
+    :param open_browser: Whether to open the visualization in a browser
     :type tree: :class:`CobwebTree <concept_formation.cobweb.CobwebTree>`,
         :class:`Cobweb3Tree <concept_formation.cobweb3.Cobweb3Tree>`, or
         :class:`TrestleTree <concept_formation.trestle.TrestleTree>`
     :type clusters: list
     :type dst: str
     :type create_html: bool
+    :type max_depth: int
+    :type max_nodes: int
+    :type open_browser: bool
     """
-    if isinstance(clusters[0],CobwebNode):
-        clusters = {c.concept_id for c in clusters}
-    else:
-        clusters = set(clusters)
-
-    j_ob = tree.root.output_json()
-    j_ob = _trim_to_clusters(j_ob,clusters)
-    _gen_viz(j_ob,dst,recreate_html)
-
+    _gen_viz(tree, dst, recreate_html, open_browser, max_depth=max_depth,
+             max_nodes=max_nodes, clusters=clusters)